@@ -1,9 +1,4 @@
 import streamlit as st
-from ui_components import (
-    login_page, home_page, run_routines, show_database_statistics, show_settings, show_queries, show_main_programs
-)
-from database_manager import DatabaseManager
-from utils import authenticate_user, logout
 import logging
 
 # Configure logging
@@ -33,9 +28,16 @@ if 'table_operation' not in st.session_state:
 
 def main():
     """Main application function"""
+    # Purpose: Pages are imported on first use; the login page only needs streamlit, so pandas,
+    # SQLAlchemy and psycopg2 are loaded after login instead of before the first render
     if not st.session_state.authenticated:
+        from login import login_page
         login_page()
     else:
+        from ui_components import (
+            home_page, run_routines, show_database_statistics, show_settings, show_queries, show_main_programs,
+            show_room_availability
+        )
         if st.session_state.current_page == "home":
             home_page()
         elif st.session_state.current_page == "routines":
@@ -48,6 +50,8 @@ def main():
             show_queries()
         elif st.session_state.current_page == "main_programs":
             show_main_programs()
+        elif st.session_state.current_page == "rooms":
+            show_room_availability()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,406 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+from sql_catalog import find_repo_dir
+from statement_cache import quote_ident
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Directory holding pg_dump / pg_restore when they are not on PATH
+PG_BIN_ENV = "PG_BIN_DIR"
+BACKUP_PHASES = ('Phase1', 'Phase2', 'Phase3', 'Phase4')
+COMPRESSION_METHODS = ('gzip', 'lz4', 'zstd', 'none')
+DEFAULT_GZIP_LEVEL = 6
+# Written next to toc.dat by dump_database; verify_backup compares the restored copy with it
+MANIFEST_NAME = 'table_checksums.json'
+# pg_dump before 16 takes only a gzip level (-Z 0-9), not a method:level spec
+_METHOD_SPEC_VERSION = 16
+
+# Verbose (-v) progress lines of pg_dump and pg_restore that start and finish copying one table.
+# Parallel runs report "finished item" for every worker; serial runs only report the start of each table.
+_TABLE_STARTED = re.compile(r'(?:dumping contents of table|processing data for table) "(?:[^"]+\.)?([^"]+)"'
+                            r'|launching item \d+ TABLE DATA (?:\S+ )?(\S+)')
+_TABLE_FINISHED = re.compile(r'finished item \d+ TABLE DATA (?:\S+ )?(\S+)')
+# Order-independent content hash of a table: one md5 per row, aggregated in sorted order
+_CHECKSUM_SQL = "SELECT count(*), md5(string_agg(h, '' ORDER BY h)) FROM (SELECT md5(t::text) AS h FROM {} t) s"
+
+
+class BackupError(RuntimeError):
+    """pg_dump or pg_restore failed"""
+
+
+def find_pg_tool(name: str) -> str:
+    """Locate a PostgreSQL client program in PG_BIN_DIR or on PATH"""
+    directory = os.environ.get(PG_BIN_ENV)
+    if directory:
+        candidate = os.path.join(directory, name)
+        if os.access(candidate, os.X_OK):
+            return candidate
+    found = shutil.which(name)
+    if not found:
+        raise BackupError(f"{name} not found; add the PostgreSQL bin directory to PATH or set {PG_BIN_ENV}")
+    return found
+
+
+_tool_versions: Dict[str, int] = {}
+
+
+def pg_tool_version(name: str = 'pg_dump') -> int:
+    """Major version of a PostgreSQL client program (pg_dump (PostgreSQL) 15.4 -> 15)"""
+    path = find_pg_tool(name)
+    if path not in _tool_versions:
+        output = subprocess.run([path, '--version'], capture_output=True, text=True, check=True).stdout
+        match = re.search(r'(\d+)(?:\.\d+)?', output)
+        if not match:
+            raise BackupError(f"Cannot read the version of {path}: {output.strip()!r}")
+        _tool_versions[path] = int(match.group(1))
+    return _tool_versions[path]
+
+
+def libpq_dsn(url: Any) -> str:
+    """Connection string usable by libpq tools from a SQLAlchemy URL (postgresql+psycopg2:// -> postgresql://)"""
+    if hasattr(url, 'render_as_string'):
+        url = url.render_as_string(hide_password=False)
+    return re.sub(r'^postgres(?:ql)?\+\w+://', 'postgresql://', str(url))
+
+
+def _split_password(dsn: str) -> Tuple[str, Dict[str, str]]:
+    """Connection string without its password, and the environment that passes it as PGPASSWORD instead"""
+    # Purpose: Command-line arguments are visible to every local user in ps, the environment is not
+    params = parse_dsn(dsn)
+    password = params.pop('password', None)
+    env = dict(os.environ)
+    if password is not None:
+        env['PGPASSWORD'] = password
+    return make_dsn(**params), env
+
+
+def with_database(dsn: str, database: str) -> str:
+    """Same connection string pointing at another database"""
+    from sqlalchemy.engine import make_url
+    return libpq_dsn(make_url(dsn).set(database=database))
+
+
+def backup_dirs() -> List[str]:
+    """Backups folders of the phase directories in the repository"""
+    dirs = [os.path.join(find_repo_dir(phase), 'Backups') for phase in BACKUP_PHASES if find_repo_dir(phase)]
+    return [d for d in dirs if os.path.isdir(d)]
+
+
+def list_archives(directories: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Backup archives in the Backups folders, with their format (directory, custom or tar)"""
+    archives = []
+    for directory in directories or backup_dirs():
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                if not os.path.exists(os.path.join(path, 'toc.dat')):
+                    continue
+                archive_format, size = 'directory', sum(os.path.getsize(os.path.join(path, f))
+                                                        for f in os.listdir(path))
+            elif os.path.isfile(path):
+                with open(path, 'rb') as handle:
+                    header = handle.read(5)
+                archive_format = 'custom' if header == b'PGDMP' else 'tar' if header == b'toc.d' else None
+                if archive_format is None:
+                    continue
+                size = os.path.getsize(path)
+            else:  # Sockets and other special files
+                continue
+            folder = os.path.basename(os.path.dirname(directory)).strip('\u200f\u200e ')
+            archives.append({'path': path, 'name': name, 'folder': folder,
+                             'format': archive_format, 'size_mb': round(size / 1024 / 1024, 2),
+                             'modified': datetime.fromtimestamp(os.path.getmtime(path))})
+    return archives
+
+
+def compression_spec(method: str = 'gzip', level: Optional[int] = None, version: Optional[int] = None) -> str:
+    """
+    pg_dump -Z value for the installed pg_dump (gzip:6, zstd:3, lz4, none; a plain 0-9 gzip level before 16).
+
+    lz4 and zstd need pg_dump 16 and a build with them. The version is read from pg_dump --version when not
+    given; if pg_dump cannot be found the 16+ syntax is used and dump_database reports the missing program.
+    """
+    if method not in COMPRESSION_METHODS:
+        raise ValueError(f"Unknown compression method {method!r}; expected one of {', '.join(COMPRESSION_METHODS)}")
+    if version is None:
+        try:
+            version = pg_tool_version('pg_dump')
+        except (BackupError, OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"Could not read the pg_dump version, assuming {_METHOD_SPEC_VERSION}+: {e}")
+            version = _METHOD_SPEC_VERSION
+    if version < _METHOD_SPEC_VERSION:
+        if method in ('lz4', 'zstd'):
+            raise ValueError(f"pg_dump {version} only supports gzip compression; {method} needs pg_dump 16")
+        return '0' if method == 'none' else str(DEFAULT_GZIP_LEVEL if level is None else level)
+    if method == 'none' or level is None:
+        return method
+    return f"{method}:{level}"
+
+
+def _run_timed(command: List[str], serial: bool, progress: Optional[Callable[[str], None]] = None,
+               env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Run pg_dump/pg_restore -v and time every table from its progress lines"""
+    started = time.perf_counter()
+    open_tables: Dict[str, float] = {}
+    table_ms: Dict[str, float] = {}
+    errors: List[str] = []
+
+    def close(table: str, now: float) -> None:
+        table_ms[table] = table_ms.get(table, 0.0) + (now - open_tables.pop(table)) * 1000
+
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env)
+    for line in process.stderr:
+        now, line = time.perf_counter(), line.rstrip()
+        if serial:  # A serial run works on one table at a time; any later line means it is done
+            for table in list(open_tables):
+                close(table, now)
+        finished = _TABLE_FINISHED.search(line)
+        match = _TABLE_STARTED.search(line)
+        if finished and finished.group(1) in open_tables:
+            close(finished.group(1), now)
+        elif match:
+            open_tables[match.group(1) or match.group(2)] = now
+        if 'error:' in line or 'warning:' in line:
+            errors.append(line)
+        if progress:
+            progress(line)
+    returncode = process.wait()
+    now = time.perf_counter()
+    for table in list(open_tables):
+        close(table, now)
+    return {'returncode': returncode, 'elapsed_ms': (now - started) * 1000, 'errors': errors,
+            'tables': [{'table': table, 'elapsed_ms': round(ms, 1)}
+                       for table, ms in sorted(table_ms.items(), key=lambda item: -item[1])]}
+
+
+def dump_database(dsn: str, target_dir: str, jobs: int = 4, compress: Optional[str] = None,
+                  progress: Optional[Callable[[str], None]] = None,
+                  schemas: Sequence[str] = ('public',)) -> Dict[str, Any]:
+    """
+    Dump a database in directory format with parallel workers (pg_dump -Fd -j N).
+
+    The table checksums of the dumped snapshot are written to MANIFEST_NAME in the dump directory.
+
+    Returns:
+        Dict[str, Any]: path, jobs, compress, elapsed_ms, size_mb and per-table elapsed_ms
+    """
+    if os.path.exists(target_dir):
+        raise BackupError(f"{target_dir} already exists; pg_dump -Fd needs a new directory")
+    compress = compress or compression_spec('gzip', DEFAULT_GZIP_LEVEL)
+    # Purpose: pg_dump reads the snapshot exported here, so the manifest describes exactly the dumped rows
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_export_snapshot()")
+            snapshot = cursor.fetchone()[0]
+            checksums = _table_checksums(cursor, schemas)
+            libpq, env = _split_password(dsn)
+            command = [find_pg_tool('pg_dump'), '-v', '-Fd', '-j', str(jobs), '-Z', compress,
+                       '--snapshot', snapshot, '-f', target_dir, '--dbname', libpq]
+            result = _run_timed(command, serial=jobs <= 1, progress=progress, env=env)
+    finally:
+        conn.close()
+    if result['returncode'] != 0:
+        shutil.rmtree(target_dir, ignore_errors=True)
+        raise BackupError(f"pg_dump failed: {'; '.join(result['errors']) or 'exit code ' + str(result['returncode'])}")
+    with open(os.path.join(target_dir, MANIFEST_NAME), 'w', encoding='utf-8') as handle:
+        json.dump({'schemas': list(schemas), 'tables': checksums}, handle, indent=2)
+    size = sum(os.path.getsize(os.path.join(target_dir, f)) for f in os.listdir(target_dir))
+    logger.info(f"Dumped to {target_dir} with {jobs} jobs in {result['elapsed_ms']:.0f} ms")
+    return {'path': target_dir, 'jobs': jobs, 'compress': compress, 'elapsed_ms': result['elapsed_ms'],
+            'size_mb': round(size / 1024 / 1024, 2), 'tables': result['tables']}
+
+
+def restore_database(archive: str, dsn: str, jobs: int = 4,
+                     progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Restore an archive into an existing database (pg_restore -j N, without owners or privileges).
+
+    Tar archives cannot be restored in parallel, so they always use one job.
+    """
+    if os.path.isfile(archive):
+        with open(archive, 'rb') as handle:
+            if handle.read(5) != b'PGDMP':
+                jobs = 1
+    dsn, env = _split_password(dsn)
+    command = [find_pg_tool('pg_restore'), '-v', '-j', str(jobs), '--no-owner', '--no-privileges',
+               '-d', dsn, archive]
+    result = _run_timed(command, serial=jobs <= 1, progress=progress, env=env)
+    if result['returncode'] != 0:
+        raise BackupError(f"pg_restore failed: {'; '.join(result['errors']) or 'exit code ' + str(result['returncode'])}")
+    logger.info(f"Restored {archive} with {jobs} jobs in {result['elapsed_ms']:.0f} ms")
+    return {'archive': archive, 'jobs': jobs, 'elapsed_ms': result['elapsed_ms'], 'tables': result['tables']}
+
+
+def _table_checksums(cursor, schemas: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """Row count and order-independent md5 of every table in the given schemas, read with an open cursor"""
+    checksums = {}
+    cursor.execute("SELECT schemaname, tablename FROM pg_tables WHERE schemaname = ANY(%s) "
+                   "ORDER BY schemaname, tablename", [list(schemas)])
+    for schema, table in cursor.fetchall():
+        cursor.execute(_CHECKSUM_SQL.format(f"{quote_ident(schema)}.{quote_ident(table)}"))
+        rows, checksum = cursor.fetchone()
+        key = table if schema == 'public' else f"{schema}.{table}"
+        checksums[key] = {'rows': rows, 'checksum': checksum}
+    return checksums
+
+
+def table_checksums(dsn: str, schemas: Sequence[str] = ('public',)) -> Dict[str, Dict[str, Any]]:
+    """Row count and order-independent md5 of every table in the given schemas"""
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        checksums = _table_checksums(cursor, schemas)
+    conn.close()
+    return checksums
+
+
+def read_manifest(archive: str) -> Optional[Dict[str, Any]]:
+    """Checksum manifest written by dump_database, or None for archives without one (tar, custom, older dumps)"""
+    path = os.path.join(archive, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def _admin(dsn: str, statement: str) -> None:
+    """Run CREATE/DROP DATABASE, which cannot run inside a transaction"""
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(statement)
+    finally:
+        conn.close()
+
+
+def verify_backup(archive: str, dsn: str, jobs: int = 4, schemas: Sequence[str] = ('public',),
+                  keep_scratch: bool = False, against_database: bool = False) -> Dict[str, Any]:
+    """
+    Restore an archive into a scratch database and compare every table with the archive's checksum manifest.
+
+    With against_database the restored tables are compared with the current contents of the database at dsn
+    instead, which also works for archives without a manifest but reports every change made since the dump.
+
+    Returns:
+        Dict[str, Any]: restore timing, the source compared with, one comparison row per table and ok
+    """
+    manifest = None if against_database else read_manifest(archive)
+    if manifest is None and not against_database:
+        raise BackupError(f"{archive} has no {MANIFEST_NAME}; compare it with the database instead "
+                          f"(--against-database)")
+    if manifest is not None:
+        schemas = manifest['schemas']
+    source_name = 'database' if against_database else 'manifest'
+    scratch = f"verify_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}"
+    scratch_dsn = with_database(dsn, scratch)
+    _admin(dsn, f"CREATE DATABASE {quote_ident(scratch)}")
+    try:
+        restore = restore_database(archive, scratch_dsn, jobs)
+        expected = table_checksums(dsn, schemas) if against_database else manifest['tables']
+        restored = table_checksums(scratch_dsn, schemas)
+    finally:
+        if not keep_scratch:
+            _admin(dsn, f"DROP DATABASE IF EXISTS {quote_ident(scratch)} WITH (FORCE)")
+    comparison = []
+    for table in sorted(set(expected) | set(restored)):
+        source, copy = expected.get(table), restored.get(table)
+        if source is None or copy is None:
+            status = 'missing from backup' if copy is None else f'not in {source_name}'
+        elif source['rows'] != copy['rows']:
+            status = 'row count differs'
+        elif source['checksum'] != copy['checksum']:
+            status = 'content differs'
+        else:
+            status = 'match'
+        comparison.append({'table': table, f'{source_name}_rows': source and source['rows'],
+                           'backup_rows': copy and copy['rows'], 'status': status})
+    ok = all(row['status'] == 'match' for row in comparison)
+    logger.info(f"Verified {archive} against the {source_name}: {'all tables match' if ok else 'differences found'}")
+    return {'archive': archive, 'source': source_name, 'scratch_database': scratch if keep_scratch else None,
+            'restore_ms': restore['elapsed_ms'], 'restore_tables': restore['tables'],
+            'tables': comparison, 'ok': ok}
+
+
+def benchmark_parallelism(dsn: str, levels: Sequence[int] = (1, 2, 4, 8), compress: Optional[str] = None,
+                          restore: bool = True) -> List[Dict[str, Any]]:
+    """Total dump (and restore) wall time at each parallelism level, using temporary directories"""
+    results = []
+    for jobs in levels:
+        with tempfile.TemporaryDirectory(prefix='pgdump_') as workdir:
+            dump = dump_database(dsn, os.path.join(workdir, 'dump'), jobs, compress)
+            row = {'jobs': jobs, 'dump_ms': round(dump['elapsed_ms'], 1), 'size_mb': dump['size_mb']}
+            if restore:
+                scratch = f"bench_{jobs}_{os.getpid()}"
+                _admin(dsn, f"CREATE DATABASE {quote_ident(scratch)}")
+                try:
+                    row['restore_ms'] = round(restore_database(dump['path'], with_database(dsn, scratch),
+                                                               jobs)['elapsed_ms'], 1)
+                finally:
+                    _admin(dsn, f"DROP DATABASE IF EXISTS {quote_ident(scratch)} WITH (FORCE)")
+            results.append(row)
+    return results
+
+
+def default_target(directory: Optional[str] = None) -> str:
+    """New backup directory named like the existing ones (backup_17_06_2025_143000)"""
+    directory = directory or (backup_dirs() or [os.getcwd()])[-1]
+    return os.path.join(directory, f"backup_{datetime.now():%d_%m_%Y_%H%M%S}")
+
+
+def main():
+    """Parallel backups, restores and backup verification"""
+    parser = argparse.ArgumentParser(description="Parallel pg_dump/pg_restore with per-table timing and verification")
+    parser.add_argument("--dsn", required=True, help="Connection string of the database")
+    parser.add_argument("--jobs", type=int, default=4, help="Parallel workers for pg_dump/pg_restore")
+    parser.add_argument("--compress", help="pg_dump -Z value (gzip:0-9, lz4, zstd:1-22, none; a plain 0-9 level "
+                                            "before pg_dump 16); default gzip level 6")
+    commands = parser.add_mutually_exclusive_group(required=True)
+    commands.add_argument("--dump", metavar="DIR", nargs='?', const='', help="Dump to DIR (default: a new dated "
+                                                                              "directory in the newest Backups folder)")
+    commands.add_argument("--verify", metavar="ARCHIVE", help="Restore ARCHIVE into a scratch database and "
+                                                              "compare row counts and checksums with its manifest")
+    commands.add_argument("--benchmark", metavar="LEVELS", help="Comma-separated parallelism levels to time")
+    commands.add_argument("--list", action="store_true", help="List the archives in the Backups folders")
+    parser.add_argument("--against-database", action="store_true",
+                        help="With --verify, compare with the current database instead of the manifest")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.list:
+        for archive in list_archives():
+            print(f"{archive['folder']:<8} {archive['name']:<32} {archive['format']:<10} {archive['size_mb']:>8} MB")
+    elif args.dump is not None:
+        dump = dump_database(args.dsn, args.dump or default_target(), args.jobs, args.compress)
+        print(f"{dump['path']}: {dump['size_mb']} MB in {dump['elapsed_ms']:,.0f} ms with {dump['jobs']} jobs")
+        for table in dump['tables']:
+            print(f"  {table['table']:<32} {table['elapsed_ms']:>10,.1f} ms")
+    elif args.verify:
+        result = verify_backup(args.verify, args.dsn, args.jobs, against_database=args.against_database)
+        print(f"restored in {result['restore_ms']:,.0f} ms, compared with the {result['source']}")
+        for row in result['tables']:
+            print(f"  {row['table']:<32} {row[result['source'] + '_rows']!s:>10} {row['backup_rows']!s:>10}  "
+                  f"{row['status']}")
+        if not result['ok']:
+            raise SystemExit(f"Backup does not match the {result['source']}")
+    else:
+        levels = [int(level) for level in args.benchmark.split(',') if level.strip()]
+        for row in benchmark_parallelism(args.dsn, levels, args.compress):
+            print(f"jobs={row['jobs']:<3} dump {row['dump_ms']:>10,.1f} ms  restore "
+                  f"{row.get('restore_ms', 0):>10,.1f} ms  {row['size_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
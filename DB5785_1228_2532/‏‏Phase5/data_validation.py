@@ -0,0 +1,299 @@
+from functools import reduce
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import operator
+import re
+import time
+import pandas as pd
+from value_convert import column_kind
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Comparison operators of CHECK expressions, longest first so '>=' is not read as '>'
+_OPERATORS = {
+    '!~*': lambda s, p: ~s.str.contains(p, regex=True, flags=re.IGNORECASE),
+    '~*': lambda s, p: s.str.contains(p, regex=True, flags=re.IGNORECASE),
+    '!~': lambda s, p: ~s.str.contains(p, regex=True),
+    '>=': operator.ge, '<=': operator.le, '<>': operator.ne, '!=': operator.ne,
+    '~': lambda s, p: s.str.contains(p, regex=True),  # PostgreSQL ~ searches, like re.search
+    '>': operator.gt, '<': operator.lt, '=': operator.eq,
+}
+_REGEX_OPERATORS = ('~', '~*', '!~', '!~*')
+_CAST = re.compile(r'::[a-z_ ]+(\(\d+(,\s*\d+)?\))?(\[\])?$', re.IGNORECASE)
+_NUMBER = re.compile(r'^-?\d+(\.\d+)?$')
+_IDENTIFIER = re.compile(r'^("[^"]+"|[a-z_][a-z0-9_$]*)$', re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+class UnsupportedCheck(Exception):
+    """A CHECK expression that cannot be evaluated client-side (left to the server)"""
+
+
+def _scan(expr: str):
+    """Yield (position, depth) for every character outside string literals"""
+    depth, quoted = 0, False
+    for position, char in enumerate(expr):
+        if char == "'":
+            quoted = not quoted
+        elif not quoted:
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            yield position, depth
+
+
+def _strip_parens(expr: str) -> str:
+    """Remove parentheses that enclose the whole expression"""
+    expr = expr.strip()
+    while expr.startswith('(') and expr.endswith(')'):
+        closing = next((p for p, depth in _scan(expr) if depth == 0), None)
+        if closing != len(expr) - 1:
+            break
+        expr = expr[1:-1].strip()
+    return expr
+
+
+def _split_top(expr: str, keyword: str) -> List[str]:
+    """Split on a keyword (' AND ', ' OR ') that is outside parentheses and string literals"""
+    parts, start = [], 0
+    upper = expr.upper()
+    for position, depth in _scan(expr):
+        if depth == 0 and position >= start and upper.startswith(keyword, position):
+            parts.append(expr[start:position])
+            start = position + len(keyword)
+    parts.append(expr[start:])
+    return [part.strip() for part in parts]
+
+
+def _find_operator(expr: str) -> Optional[Tuple[int, str]]:
+    """Find the comparison operator at the top level of an expression"""
+    for position, depth in _scan(expr):
+        if depth != 0:
+            continue
+        for symbol in _OPERATORS:
+            if expr.startswith(symbol, position):
+                return position, symbol
+    return None
+
+
+def _operand(text: str) -> Tuple[str, Any]:
+    """Parse an operand into ('column', name) or ('literal', value), dropping type casts"""
+    text = _strip_parens(text)
+    while _CAST.search(text):
+        text = _strip_parens(_CAST.sub('', text))
+    if text.startswith("'") and text.endswith("'") and len(text) >= 2:
+        return 'literal', text[1:-1].replace("''", "'")
+    if _NUMBER.match(text):
+        return 'literal', float(text)
+    if _IDENTIFIER.match(text):
+        return 'column', text.strip('"') if text.startswith('"') else text.lower()
+    raise UnsupportedCheck(text)
+
+
+def referenced_columns(expr: str, columns: List[str]) -> List[str]:
+    """Columns of a table that a CHECK expression refers to"""
+    words = set(re.findall(r'[a-z_][a-z0-9_$]*', _LITERAL.sub('', expr).lower()))
+    return [name for name in columns if name.lower() in words]
+
+
+def compile_check(expr: str) -> Callable[[pd.DataFrame], pd.Series]:
+    """
+    Translate a CHECK expression into a function over a typed DataFrame.
+
+    The function returns a nullable boolean Series; like the server, a row only violates the
+    constraint when the expression is False (NULL passes). Raises UnsupportedCheck for expressions
+    outside comparisons, regex matches, IS [NOT] NULL, AND and OR.
+    """
+    expr = _strip_parens(expr)
+    if re.match(r'CHECK\s*\(', expr, re.IGNORECASE):  # Full definition from pg_get_constraintdef
+        expr = _strip_parens(expr[5:])
+    for keyword, combine in ((' OR ', operator.or_), (' AND ', operator.and_)):
+        parts = _split_top(expr, keyword)
+        if len(parts) > 1:
+            checks = [compile_check(part) for part in parts]
+            return lambda frame: reduce(combine, (check(frame) for check in checks))
+
+    null_test = re.fullmatch(r'(.+?)\s+IS\s+(NOT\s+)?NULL', expr, re.IGNORECASE | re.DOTALL)
+    if null_test:
+        _, column = _operand(null_test.group(1))
+        negate = bool(null_test.group(2))
+        return lambda frame: (_column(frame, column).notna() if negate
+                              else _column(frame, column).isna()).astype('boolean')
+
+    found = _find_operator(expr)
+    if found is None:
+        raise UnsupportedCheck(expr)
+    position, symbol = found
+    left = _operand(expr[:position])
+    right = _operand(expr[position + len(symbol):])
+    if symbol in _REGEX_OPERATORS:
+        if left[0] != 'column' or right[0] != 'literal' or not isinstance(right[1], str):
+            raise UnsupportedCheck(expr)
+        try:
+            pattern = re.compile(right[1]).pattern
+        except re.error:
+            raise UnsupportedCheck(expr) from None  # PostgreSQL-only regex syntax
+        return lambda frame: _regex(_column(frame, left[1]), symbol, pattern)
+    return lambda frame: _compare(_value(frame, left), symbol, _value(frame, right))
+
+
+def _column(frame: pd.DataFrame, name: str) -> pd.Series:
+    """Typed column, or all NULL if the upload does not contain it"""
+    return frame[name] if name in frame.columns else pd.Series(pd.NA, index=frame.index, dtype=object)
+
+
+def _value(frame: pd.DataFrame, operand: Tuple[str, Any]) -> Any:
+    return _column(frame, operand[1]) if operand[0] == 'column' else operand[1]
+
+
+def _regex(values: pd.Series, symbol: str, pattern: str) -> pd.Series:
+    return _OPERATORS[symbol](values.astype('string'), pattern).astype('boolean')
+
+
+def _compare(left: Any, symbol: str, right: Any) -> pd.Series:
+    """Compare with SQL NULL semantics: the result is NULL where either side is NULL"""
+    series = left if isinstance(left, pd.Series) else right
+    if isinstance(left, str) and pd.api.types.is_datetime64_any_dtype(right):
+        left = pd.Timestamp(left)
+    if isinstance(right, str) and pd.api.types.is_datetime64_any_dtype(left):
+        right = pd.Timestamp(right)
+    unknown = series.isna()
+    for side in (left, right):
+        if isinstance(side, pd.Series):
+            unknown = unknown | side.isna()
+    result = pd.Series(_OPERATORS[symbol](left, right), index=series.index).astype('boolean')
+    result[unknown] = pd.NA
+    return result
+
+
+class TableRules:
+    """Validation rules of a table, read from the database's column definitions and CHECK constraints"""
+    # Purpose: Mirrors what the server enforces on INSERT (types, enum labels, NOT NULL, varchar
+    # lengths, CHECK constraints, duplicate primary keys), so a whole file can be checked with a few
+    # vectorized pandas operations per rule before anything is sent to the database
+    def __init__(self, table_name: str, columns: List[Dict[str, Any]], primary_key: List[str],
+                 checks: List[Dict[str, Any]]):
+        self.table_name = table_name
+        self.columns = {col['name']: col for col in columns}
+        self.primary_key = primary_key
+        self.checks = []  # (constraint name, expression, compiled function, referenced columns)
+        self.unsupported = []  # Constraints left to the server
+        for check in checks:
+            try:
+                self.checks.append((check['name'], check['sqltext'], compile_check(check['sqltext']),
+                                    referenced_columns(check['sqltext'], list(self.columns))))
+            except UnsupportedCheck as e:
+                self.unsupported.append(check['name'])
+                logger.info(f"CHECK {check['name']} is not evaluated client-side: {e}")
+
+    @classmethod
+    def from_inspector(cls, inspector, table_name: str) -> 'TableRules':
+        """Build the rules from a SQLAlchemy inspector (uses its reflection cache)"""
+        return cls(table_name, inspector.get_columns(table_name),
+                   inspector.get_pk_constraint(table_name).get('constrained_columns') or [],
+                   inspector.get_check_constraints(table_name))
+
+    def required_columns(self) -> List[str]:
+        """Columns without a default that must not be NULL"""
+        return [name for name, col in self.columns.items()
+                if not col.get('nullable', True) and col.get('default') is None and not col.get('autoincrement')]
+
+
+def _typed_frame(rules: TableRules, df: pd.DataFrame, add_error: Callable) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Clean and type every known column, reporting values that do not parse; returns (typed, cleaned)"""
+    typed, cleaned = {}, {}
+    for name in df.columns:
+        if name not in rules.columns:
+            continue
+        column = rules.columns[name]
+        values = df[name]
+        if values.dtype == object:  # Strip strings and treat blanks as NULL, as on insert
+            values = pd.Series([(v.strip() or None) if isinstance(v, str) else v for v in values.tolist()],
+                               index=df.index, dtype=object)
+        cleaned[name] = values
+        present = values.notna()
+        kind = column_kind(column['type'])
+        if kind in ('int', 'float'):
+            parsed = pd.to_numeric(values, errors='coerce')
+            bad = present & parsed.isna()
+            if kind == 'int':
+                bad |= parsed.notna() & (parsed % 1 != 0)
+            add_error(bad, name, 'type', values, f"not a valid {'integer' if kind == 'int' else 'number'}")
+        elif kind in ('date', 'datetime'):
+            parsed = pd.to_datetime(values, errors='coerce', format='ISO8601')
+            retry = present & parsed.isna()
+            if retry.any():
+                parsed[retry] = pd.to_datetime(values[retry], errors='coerce', format='mixed')
+            add_error(present & parsed.isna(), name, 'type', values, f"not a valid {kind}")
+        elif kind == 'enum':
+            labels = list(column['type'].enums)
+            parsed = values.astype('string')
+            add_error(present & ~values.isin(labels), name, 'enum', values, f"not one of {', '.join(labels)}")
+        else:
+            parsed = values.astype('string') if kind == 'text' else values
+            length = getattr(column['type'], 'length', None)
+            if kind == 'text' and length:
+                add_error(parsed.str.len() > length, name, 'length', values, f"longer than {length} characters")
+        typed[name] = parsed
+    return pd.DataFrame(typed, index=df.index), pd.DataFrame(cleaned, index=df.index)
+
+
+def validate_frame(rules: TableRules, df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Validate rows against a table's rules before loading them.
+
+    Args:
+        rules: Rules of the target table
+        df: Rows to load, one column per table column (as read from a CSV, strings are fine)
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, Any]]: (one row per violation: row, column, rule, value, message;
+        summary with row counts, file-level errors and the constraints left to the server)
+    """
+    started = time.perf_counter()
+    problems = []
+
+    def add_error(bad: pd.Series, column: str, rule: str, values: pd.Series, message: str) -> None:
+        bad = pd.Series(bad, index=df.index).fillna(False).astype(bool)
+        if bad.any():
+            problems.append(pd.DataFrame({'row': df.index[bad], 'column': column, 'rule': rule,
+                                          'value': values[bad].astype(object).tolist(), 'message': message}))
+
+    file_errors = []
+    unknown = [name for name in df.columns if name not in rules.columns]
+    if unknown:
+        file_errors.append(f"Unknown columns: {', '.join(unknown)}")
+    missing = [name for name in rules.required_columns() if name not in df.columns]
+    if missing:
+        file_errors.append(f"Missing required columns: {', '.join(missing)}")
+
+    typed, cleaned = _typed_frame(rules, df, add_error)
+    for name in rules.required_columns():
+        if name in cleaned.columns:  # Values that did not parse are already reported as type errors
+            add_error(cleaned[name].isna(), name, 'not null', df[name], "required")
+    if rules.primary_key and all(name in typed.columns for name in rules.primary_key):
+        duplicated = typed.duplicated(rules.primary_key, keep=False) & typed[rules.primary_key].notna().all(axis=1)
+        add_error(duplicated, ', '.join(rules.primary_key), 'primary key', df[rules.primary_key[0]],
+                  "duplicate key in file")
+    for name, expression, check, columns in rules.checks:
+        shown = [column for column in columns if column in df.columns]
+        if not shown:
+            continue  # Columns not in the upload are NULL, and a NULL CHECK passes
+        add_error(check(typed).eq(False), ', '.join(shown), name, df[shown[0]], f"violates CHECK ({expression})")
+
+    columns = ['row', 'column', 'rule', 'value', 'message']
+    report = pd.concat(problems, ignore_index=True).sort_values(['row', 'column'], kind='stable') \
+        if problems else pd.DataFrame(columns=columns)
+    summary = {
+        'rows': len(df),
+        'invalid_rows': int(report['row'].nunique()) if len(report) else 0,
+        'errors': len(report),
+        'file_errors': file_errors,
+        'checks': [check[0] for check in rules.checks],
+        'server_only_checks': rules.unsupported,
+        'elapsed_ms': (time.perf_counter() - started) * 1000,
+    }
+    summary['valid'] = not file_errors and summary['errors'] == 0
+    return report.reset_index(drop=True), summary
@@ -1,13 +1,30 @@
-from sqlalchemy import create_engine, MetaData, Table, text, inspect
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import create_engine, text, inspect, event
 import pandas as pd
 import logging
-from typing import List, Dict, Any, Optional, Tuple
-import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Sequence, Union, Callable
 import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, ISOLATION_LEVEL_DEFAULT
 from psycopg2.extras import RealDictCursor
+from statement_cache import PreparedStatementCache, StatementCacheStats, quote_ident, placeholders, PREPARABLE_COMMANDS
+from sql_parser import split_sql
+from notice_stream import NoticeBuffer, StreamingConnection, format_notice
+from resource_guard import (QueryPolicy, apply_server_settings, classify_statement, is_streamable, is_read_statement,
+                            row_limited_sql, fetch_limited, classify_error)
+from psycopg2 import errors
+import itertools
+from result_cache import get_shared_cache, make_key
+from data_validation import TableRules, validate_frame
+from workload_capture import CAPTURE_LOG_ENV
+from value_convert import convert_value, convert_record, convert_records, convert_series, column_kind, kind_of_type_name
+from collections import deque
+import threading
+from datetime import datetime
+import tempfile
+import uuid
+import io
+import os
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -17,47 +34,126 @@ class DatabaseManager:
     def __init__(self):
         # Initialize database connection attributes
         self.engine = None  # SQLAlchemy engine for database connection
-        self.session = None  # SQLAlchemy session for ORM operations
-        self.metadata = None  # Metadata object to store database schema information
         self.inspector = None  # Inspector to retrieve schema details
         self.notices = []  # Store PostgreSQL NOTICE messages
+        self.statement_cache_size = 64  # Prepared statements kept per pooled connection (LRU)
+        self.statement_stats = StatementCacheStats()  # Hit-rate counters shared by all connection caches
+        self._routine_metadata = None  # Cached pg_proc metadata keyed by specific_name
+        self.notice_buffer_size = 1000  # NOTICEs kept in memory per call; older ones spill to a log file
+        self.notice_log_dir = os.path.join(tempfile.gettempdir(), 'db_notices')  # Spill files location
+        self.last_notice_log = None  # Spill file of the last routine call, if its notices overflowed
+        self.query_policy = QueryPolicy()  # Session resource limits for user-run queries
+        self.guard_events = deque(maxlen=200)  # Recent queries cut off by a resource limit or cancelled
+        self._running_queries = {}  # Guarded query id -> (engine, backend pid) for cancellation
+        self._running_lock = threading.Lock()
+        self.replica_engines = []  # Engines of read replicas (streaming replication standbys)
+        self.max_replica_lag_s = 5.0  # Replicas lagging more than this are skipped for reads
+        self.replica_check_interval_s = 5.0  # How long a replica lag measurement is reused
+        self.routing_stats = {'primary': 0, 'replica': 0, 'fallback': 0}  # Read routing decisions
+        self._replica_state = {}  # Replica engine -> {'checked_at', 'lag_s', 'error'}
+        self._replica_lock = threading.Lock()
+        self._replica_counter = itertools.count()  # Round-robin position over replicas
+        self.result_cache = None  # Shared on-disk cache of results and metadata (all sessions and processes)
+        self.models = None  # Reflected ORM model registry, created on first use (see get_model_registry)
+        self._table_rules = {}  # Table name -> TableRules derived from column definitions and CHECK constraints
+        self.keys = None  # Sequence-backed key allocator, created on first use (see get_key_allocator)
+        self.capture_log = None  # Workload capture log while statements are being recorded (see start_capture)
+        self.streaming_recycle_s = 300  # Idle streaming connections are reopened after this, like pool_recycle
+        self._streaming_conns = {}  # Engine -> idle StreamingConnection reused by routine calls with a listener
+        self._streaming_lock = threading.Lock()
+
+    def _get_column_types(self, table_name: str) -> Dict[str, Any]:
+        """Get the reflected type of every column (served from the inspector cache)"""
+        return {col['name']: col['type'] for col in self.inspector.get_columns(table_name)}
+
+    def _convert_key(self, table_name: str, id_column: str, record_id: Any) -> Any:
+        """Convert a key value by the type of its column"""
+        column_type = self._get_column_types(table_name).get(id_column)
+        kind = column_kind(column_type) if column_type is not None else 'other'
+        return convert_value(record_id, kind, getattr(column_type, 'enums', None))
+
+    def _convert_params(self, specific_name: str, params: Sequence[Any]) -> List[Any]:
+        """Convert routine arguments by the declared types of the routine's IN/INOUT parameters"""
+        # Purpose: Same conversion as table columns; falls back to untyped cleaning (strip, empty -> NULL)
+        # when the parameter list is unknown or does not match the arguments
+        kinds = [kind_of_type_name(p['data_type']) for p in self.get_function_parameters(specific_name)
+                 if p['parameter_mode'].upper() in ('IN', 'INOUT')]
+        if len(kinds) != len(params):
+            kinds = ['other'] * len(params)
+        return [convert_value(value, kind) for value, kind in zip(params, kinds)]
+
+    def _get_statement_cache(self, raw_conn) -> PreparedStatementCache:
+        """Get the prepared statement cache bound to a pooled DBAPI connection"""
+        # Purpose: Prepared statements live in the server session, so the cache is stored in the
+        # connection's `info` dict, which lives exactly as long as the underlying DBAPI connection
+        cache = raw_conn.info.get('statement_cache')
+        if cache is None:
+            cache = PreparedStatementCache(self.statement_cache_size, self.statement_stats)
+            raw_conn.info['statement_cache'] = cache
+        return cache
+
+    def _execute_prepared(self, key: Tuple, sql_text: str, params: List[Any]) -> int:
+        """Execute a write statement through the prepared statement cache and commit"""
+        # Purpose: Shared hot path for insert/update/delete; returns the affected row count
+        raw_conn = self.engine.raw_connection()
+        try:
+            cache = self._get_statement_cache(raw_conn)
+            with raw_conn.cursor() as cursor:
+                try:
+                    cache.execute(cursor, key, sql_text, params)
+                    rowcount = cursor.rowcount
+                    raw_conn.commit()  # Commit transaction
+                    self._invalidate_written(key[1])  # Statement keys are (operation, table, ...)
+                    return rowcount
+                except Exception:
+                    raw_conn.rollback()  # Keep the pooled connection usable
+                    raise
+        finally:
+            raw_conn.close()  # Return connection (and its prepared statements) to the pool
+
+    def _get_column_names(self, table_name: str) -> List[str]:
+        """Get the column names of a table (served from the inspector cache)"""
+        return [col['name'] for col in self.inspector.get_columns(table_name)]
 
-    def _sanitize_value(self, value: Any) -> Any:
-        """Convert NumPy types to native Python types"""
-        # Purpose: Ensures values are compatible with database operations by converting NumPy types to native Python types
-        # Handles None/empty strings and strips whitespace from strings
-        if isinstance(value, np.generic):
-            return value.item()  # Convert NumPy scalar to Python native type
-        if value is None or value == "":
-            return None  # Convert empty strings or None to database NULL
-        if isinstance(value, str):
-            return value.strip()  # Remove leading/trailing whitespace from strings
-        return value
-
-    def _sanitize_dict(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Convert all NumPy types in a dictionary to native Python types"""
-        # Purpose: Applies _sanitize_value to all dictionary values to ensure database compatibility
-        return {k: self._sanitize_value(v) for k, v in data.items()}
-
-    def connect(self, connection_string: str) -> bool:
+    def get_statement_cache_stats(self) -> Dict[str, Any]:
+        """Get prepared statement cache statistics"""
+        # Purpose: Exposes hit rate and the estimated parse/plan time saved for the statistics page
+        stats = self.statement_stats.as_dict()
+        stats['capacity_per_connection'] = self.statement_cache_size
+        return stats
+
+    def connect(self, connection_string: str, pool_size: int = 5,
+                replica_strings: Optional[List[str]] = None) -> bool:
         """Connect to the database"""
-        # Purpose: Establishes a database connection using SQLAlchemy, sets up metadata and session, and tests connectivity
+        # Purpose: Establishes a database connection using SQLAlchemy, sets up the inspector, and tests connectivity
+        # Optional replica connection strings are used for read-only traffic (see read_engine)
         try:
-            self.engine = create_engine(
-                connection_string,
-                pool_pre_ping=True,  # Check connection health before use
-                pool_recycle=300,    # Recycle connections after 300 seconds to avoid timeouts
-                echo=False           # Disable SQL query logging
-            )
+            self.engine = self._create_engine(connection_string, pool_size)
 
             with self.engine.connect() as conn:
                 conn.execute(text("SELECT 1"))  # Test connection with a simple query
 
-            self.metadata = MetaData()  # Initialize metadata for schema reflection
+            self.replica_engines = []
+            for replica_string in replica_strings or []:
+                try:
+                    replica = self._create_engine(replica_string, pool_size)
+                    with replica.connect() as conn:
+                        conn.execute(text("SELECT 1"))
+                    self.replica_engines.append(replica)
+                except Exception as e:
+                    logger.warning(f"Skipping unreachable replica {replica_string.split('@')[-1]}: {str(e)}")
+
+            try:
+                self.result_cache = get_shared_cache()
+            except Exception as e:
+                logger.warning(f"Shared result cache unavailable: {str(e)}")
+                self.result_cache = None
+
             self.inspector = inspect(self.engine)  # Initialize inspector for schema details
+            self._sync_key_sequences()
 
-            Session = sessionmaker(bind=self.engine)  # Create session factory
-            self.session = Session()  # Create session for ORM operations
+            if os.environ.get(CAPTURE_LOG_ENV) and self.capture_log is None:
+                self.start_capture(os.environ[CAPTURE_LOG_ENV])
 
             logger.info("Successfully connected to the database")
             return True
@@ -66,17 +162,178 @@ class DatabaseManager:
             logger.error(f"Error connecting to the database: {str(e)}")
             return False
 
+    @staticmethod
+    def _create_engine(connection_string: str, pool_size: int):
+        """Create a pooled engine"""
+        return create_engine(
+            connection_string,
+            pool_size=pool_size,  # Persistent pooled connections (raise for concurrent workloads)
+            max_overflow=10,     # Extra connections allowed under bursts
+            pool_pre_ping=True,  # Check connection health before use
+            pool_recycle=300,    # Recycle connections after 300 seconds to avoid timeouts
+            echo=False           # Disable SQL query logging
+        )
+
+    def _engines(self) -> List[Any]:
+        return ([self.engine] if self.engine is not None else []) + list(self.replica_engines)
+
+    def _capture_connect(self, dialect, conn_rec, cargs, cparams) -> None:
+        """do_connect hook: new pooled connections record their statements while capture is on"""
+        if self.capture_log is not None:
+            cparams['connection_factory'] = self.capture_log.connection_factory()
+
+    def start_capture(self, path: str, session_id: Optional[str] = None,
+                      redact_params: Optional[bool] = None) -> str:
+        """Record every statement this manager issues (with parameters, timing and session ID) to a log"""
+        # Purpose: Production traffic for workload_capture.py replays. Pools are emptied so every
+        # connection from now on is a capturing one; returns the session ID written to the log.
+        # redact_params leaves the parameters out (default: DB_CAPTURE_REDACT).
+        from workload_capture import CaptureLog
+        self.stop_capture()
+        self.capture_log = CaptureLog(path, session_id, redact_params)
+        for engine in self._engines():
+            event.listen(engine, 'do_connect', self._capture_connect)
+            engine.dispose()
+        self._close_streaming_connections()
+        logger.info(f"Capturing statements of session {self.capture_log.session_id} to {path}")
+        return self.capture_log.session_id
+
+    def stop_capture(self) -> None:
+        """Stop recording statements and close the capture log"""
+        if self.capture_log is None:
+            return
+        for engine in self._engines():
+            if event.contains(engine, 'do_connect', self._capture_connect):
+                event.remove(engine, 'do_connect', self._capture_connect)
+            engine.dispose()
+        self._close_streaming_connections()
+        self.capture_log.close()
+        logger.info(f"Stopped capturing statements ({self.capture_log.events} events in {self.capture_log.path})")
+        self.capture_log = None
+
+    @staticmethod
+    def _engine_label(engine) -> str:
+        """Host and port of an engine (also for socket connections given as query parameters)"""
+        url = engine.url
+        return f"{url.host or url.query.get('host', 'localhost')}:{url.port or url.query.get('port', 5432)}"
+
+    def _measure_replica_lag(self, engine) -> Dict[str, Any]:
+        """Measure how far a replica is behind its primary (seconds)"""
+        # A standby that replayed everything it received is caught up; otherwise the lag is the age of
+        # the last replayed transaction. A server that is not in recovery is treated as current.
+        state = {'checked_at': time.monotonic(), 'lag_s': None, 'error': None}
+        try:
+            with engine.connect() as conn:
+                lag = conn.execute(text("""
+                    SELECT CASE
+                        WHEN NOT pg_is_in_recovery() THEN 0
+                        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    END
+                """)).scalar()
+            state['lag_s'] = float(lag)
+        except Exception as e:
+            state['error'] = str(e)
+            logger.warning(f"Replica {self._engine_label(engine)} unavailable: {str(e)}")
+        return state
+
+    def _replica_lag(self, engine) -> Optional[float]:
+        """Get the replica lag, measuring it at most once per replica_check_interval_s"""
+        with self._replica_lock:
+            state = self._replica_state.get(engine)
+        if state is None or time.monotonic() - state['checked_at'] > self.replica_check_interval_s:
+            state = self._measure_replica_lag(engine)
+            with self._replica_lock:
+                self._replica_state[engine] = state
+        return state['lag_s']
+
+    def read_engine(self):
+        """Choose the engine for a read-only statement"""
+        # Purpose: Spreads reads over replicas in round-robin order, skipping replicas that are
+        # unreachable or lag more than max_replica_lag_s; falls back to the primary
+        count = len(self.replica_engines)
+        if count:
+            start = next(self._replica_counter)
+            for offset in range(count):
+                engine = self.replica_engines[(start + offset) % count]
+                lag = self._replica_lag(engine)
+                if lag is not None and lag <= self.max_replica_lag_s:
+                    self._record_route('replica')
+                    return engine
+            self._record_route('fallback')
+        else:
+            self._record_route('primary')
+        return self.engine
+
+    def _record_route(self, route: str) -> None:
+        with self._replica_lock:
+            self.routing_stats[route] += 1
+
+    def get_replica_status(self) -> List[Dict[str, Any]]:
+        """Get the last known lag of every replica"""
+        status = []
+        for engine in self.replica_engines:
+            lag = self._replica_lag(engine)
+            with self._replica_lock:
+                state = self._replica_state.get(engine, {})
+            status.append({'replica': self._engine_label(engine), 'lag_s': lag,
+                           'healthy': lag is not None and lag <= self.max_replica_lag_s,
+                           'error': state.get('error')})
+        return status
+
+    def _cached(self, parts: Tuple, compute: Callable[[], Any], tags: Sequence[str],
+                ttl_s: Optional[float] = None) -> Any:
+        """Serve a value from the shared result cache, computing it on a miss"""
+        # Keys include the connection URL (without password), so databases and users never share entries
+        if self.result_cache is None:
+            return compute()
+        key = make_key(self.engine.url.render_as_string(hide_password=True), *parts)
+        return self.result_cache.get_or_compute(key, compute, tags, ttl_s)
+
+    def invalidate_cache(self, *tags: str) -> None:
+        """Drop shared cache entries for tables (or 'data' / 'schema') after a change"""
+        if self.result_cache is not None:
+            try:
+                self.result_cache.invalidate(*tags)
+            except Exception as e:
+                logger.warning(f"Could not invalidate cache entries {tags}: {str(e)}")
+
+    def _triggered_tables(self) -> List[str]:
+        """Tables with user triggers, whose writes can change other tables (rollups, cube, occupancy)"""
+        query = text("SELECT DISTINCT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid "
+                     "WHERE NOT t.tgisinternal AND c.relnamespace = ANY (current_schemas(false)::regnamespace[])")
+        def load() -> List[str]:
+            with self.engine.connect() as conn:
+                return [row[0] for row in conn.execute(query)]
+        return self._cached(('triggered_tables',), load, ('schema',), ttl_s=3600)
+
+    def _invalidate_written(self, table_name: str) -> None:
+        """Drop cache entries after a write; a trigger on the table may have written other tables too"""
+        try:
+            triggered = table_name in self._triggered_tables()
+        except Exception as e:
+            logger.warning(f"Could not list triggers, invalidating all data entries: {str(e)}")
+            triggered = True
+        self.invalidate_cache(*((table_name, 'data') if triggered else (table_name,)))
+
     def get_table_names(self) -> List[str]:
         """Get list of all tables and views"""
         # Purpose: Retrieves all table and view names from the database for exploration or validation
         try:
-            tables = self.inspector.get_table_names()  # Get all table names
-            views = self.inspector.get_view_names()   # Get all view names
-            return tables + views  # Combine tables and views into a single list
+            # Combine tables and views into a single list
+            return self._cached(('table_names',), lambda: self.inspector.get_table_names() + self.inspector.get_view_names(),
+                                ('schema',), ttl_s=3600)
         except Exception as e:
             logger.error(f"Error retrieving table names and views: {str(e)}")
             return []
 
+    def get_table_row_count(self, table_name: str) -> int:
+        """Get the number of rows in a table (shared cache, invalidated by writes to the table or any write with triggers)"""
+        def count() -> int:
+            with self.read_engine().connect() as conn:
+                return int(conn.execute(text(f"SELECT COUNT(*) FROM {quote_ident(table_name)}")).scalar())
+        return self._cached(('row_count', table_name), count, (table_name, 'data'))
+
     def get_table_info(self, table_name: str) -> Dict[str, Any]:
         """Get information about a table"""
         # Purpose: Fetches metadata (columns, primary keys, foreign keys) for a specific table
@@ -103,12 +360,128 @@ class DatabaseManager:
             return pd.DataFrame()  # Return empty DataFrame if table doesn't exist
 
         try:
-            query = text(f"SELECT * FROM {table_name} LIMIT :limit")  # Parameterized query for safety
-            return pd.read_sql(query, self.engine, params={"limit": limit})  # Execute query and return DataFrame
+            # Runs under the session resource policy, so a large limit cannot hog the server or the worker
+            df, info = self.run_guarded_query(f"SELECT * FROM {quote_ident(table_name)} LIMIT %s", [limit])
+            if info['status'] not in ('ok', 'truncated'):
+                logger.error(f"Error retrieving data from table {table_name}: {info['reason']}")
+            return df
         except Exception as e:
             logger.error(f"Error retrieving data from table {table_name}: {str(e)}")
             return pd.DataFrame()
 
+    def run_guarded_query(self, sql_text: str, params: Optional[Sequence[Any]] = None,
+                          policy: Optional[QueryPolicy] = None,
+                          query_id: Optional[str] = None,
+                          read_only: Optional[bool] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Run a user query under resource limits.
+
+        Args:
+            sql_text: The statement (psycopg2 %s placeholders for params)
+            params: Statement parameters
+            policy: Resource limits (defaults to the session policy, self.query_policy)
+            query_id: Identifier for cancel_query (generated if not given)
+            read_only: Route to a replica (defaults to True for statements that only read, such as SELECT,
+                EXPLAIN and SHOW); a statement rejected by the replica as a write is retried on the primary
+
+        Returns:
+            Tuple[pd.DataFrame, Dict[str, Any]]: (result rows, info with status, reason, rows, bytes,
+            rowcount, elapsed_ms). Status is 'ok', 'truncated', 'timeout', 'lock_timeout', 'cancelled' or 'error'
+
+        Enforcement:
+        - statement_timeout, lock_timeout and work_mem are set for the query's transaction only
+        - SELECT-like statements are read through a server-side cursor in batches and stop at the
+          row, byte or total time limit; other statements commit and report their row count
+        - Statements are classified by the SQL lexer, so leading comments and parentheses do not hide a SELECT
+        - Writes that return rows (RETURNING, data-modifying WITH) are wrapped so the server returns at most
+          max_rows + 1 rows; their rowcount is not reported, since the server no longer counts every row
+        - Other statements whose rows cannot be limited (e.g. a script ending in a SELECT) are refused while
+          max_rows or max_result_bytes is set, since psycopg2 would load their whole result
+        """
+        policy = policy or self.query_policy
+        query_id = query_id or uuid.uuid4().hex
+        info = {'query_id': query_id, 'status': 'ok', 'reason': None, 'rows': 0, 'bytes': 0,
+                'rowcount': None, 'elapsed_ms': 0.0}
+        df = pd.DataFrame()
+        shape = classify_statement(sql_text)
+        streamed = is_streamable(sql_text)
+        limited_sql = None if streamed else row_limited_sql(sql_text, policy.max_rows)
+        if (not streamed and limited_sql is None and shape['returns_rows'] and not shape['bounded']
+                and (policy.max_rows or policy.max_result_bytes)):
+            info['status'] = 'error'
+            info['reason'] = ("The rows of this statement cannot be limited (run one statement at a time), or "
+                              "set both result limits under Settings → Query Limits to 0")
+            self._log_guard_event(sql_text, info)
+            return df, info
+        read = is_read_statement(sql_text)
+        engine = self.read_engine() if (read if read_only is None else read_only) else self.engine
+
+        raw_conn = engine.raw_connection()
+        raw_conn.set_isolation_level(ISOLATION_LEVEL_DEFAULT)
+        started = time.perf_counter()
+        retry = False
+        try:
+            with self._running_lock:
+                self._running_queries[query_id] = (engine, raw_conn.get_backend_pid())
+            with raw_conn.cursor() as cursor:
+                apply_server_settings(cursor, policy)
+            cursor = raw_conn.cursor(name=f"guarded_{query_id}") if streamed else raw_conn.cursor()
+            try:
+                cursor.execute(limited_sql or sql_text, params)
+                if streamed or cursor.description:
+                    df, reason = fetch_limited(cursor, policy, started)
+                    if reason:
+                        info['status'], info['reason'] = 'truncated', reason
+                if not streamed and limited_sql is None:
+                    info['rowcount'] = cursor.rowcount if cursor.rowcount >= 0 else None
+            finally:
+                cursor.close()
+            raw_conn.commit()
+            if not read:
+                self.invalidate_cache('data')  # May have written to any table
+        except errors.ReadOnlySqlTransaction:
+            raw_conn.rollback()
+            if engine is self.engine:
+                raise
+            retry = True  # A write sent to a replica (e.g. a data-modifying WITH): run it on the primary
+        except psycopg2.Error as e:
+            raw_conn.rollback()
+            info['status'], info['reason'] = classify_error(e), str(e).strip()
+        finally:
+            with self._running_lock:
+                self._running_queries.pop(query_id, None)
+            raw_conn.close()
+        if retry:
+            return self.run_guarded_query(sql_text, params, policy, query_id, read_only=False)
+
+        info['elapsed_ms'] = (time.perf_counter() - started) * 1000
+        info['rows'] = len(df)
+        info['bytes'] = int(df.memory_usage(deep=True).sum()) if not df.empty else 0
+        if info['status'] != 'ok':
+            self._log_guard_event(sql_text, info)
+        return df, info
+
+    def _log_guard_event(self, sql_text: str, info: Dict[str, Any]) -> None:
+        """Record a query that was cut off or failed under the resource policy"""
+        event = dict(info, sql=sql_text, time=datetime.now())
+        self.guard_events.append(event)
+        if info['status'] == 'error':
+            logger.error(f"Guarded query failed: {info['reason']}")
+        else:
+            logger.warning(f"Query {info['status']} after {info['elapsed_ms']:.0f} ms "
+                           f"({info['rows']} rows): {info['reason']} | {' '.join(sql_text.split())[:200]}")
+
+    def cancel_query(self, query_id: str) -> bool:
+        """Cancel a running guarded query with pg_cancel_backend"""
+        with self._running_lock:
+            engine, pid = self._running_queries.get(query_id, (None, None))
+        if pid is None:
+            return False
+        with engine.connect() as conn:  # The backend lives on the server the query was routed to
+            cancelled = conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": pid}).scalar()
+        logger.info(f"Cancel requested for query {query_id} (backend {pid}): {cancelled}")
+        return bool(cancelled)
+
     def insert_record(self, table_name: str, data: Dict[str, Any]) -> bool:
         """Insert a new record"""
         # Purpose: Inserts a new record into the specified table with sanitized data
@@ -116,13 +489,20 @@ class DatabaseManager:
             logger.error(f"Table {table_name} does not exist")
             return False
         try:
-            data = self._sanitize_dict(data)  # Sanitize input data
-            table = Table(table_name, self.metadata, autoload_with=self.engine)  # Reflect table schema
-            insert_query = table.insert().values(**data)  # Build insert query
-
-            with self.engine.connect() as conn:
-                conn.execute(insert_query)  # Execute insert
-                conn.commit()  # Commit transaction
+            data = convert_record(data, self._get_column_types(table_name))  # Convert by column type
+            columns = list(data.keys())
+            unknown = set(columns) - set(self._get_column_names(table_name))
+            if unknown:
+                logger.error(f"Unknown columns for table {table_name}: {', '.join(sorted(unknown))}")
+                return False
+
+            # Statement shape: table + column set, so every insert with the same columns reuses one plan
+            if columns:
+                column_list = ', '.join(quote_ident(c) for c in columns)
+                sql_text = f"INSERT INTO {quote_ident(table_name)} ({column_list}) VALUES ({placeholders(len(columns))})"
+            else:
+                sql_text = f"INSERT INTO {quote_ident(table_name)} DEFAULT VALUES"
+            self._execute_prepared(('insert', table_name, tuple(columns)), sql_text, list(data.values()))
 
             logger.info(f"Record successfully inserted into table {table_name}")
             return True
@@ -131,6 +511,167 @@ class DatabaseManager:
             logger.error(f"Error inserting record into table {table_name}: {str(e)}")
             return False
 
+    def get_model_registry(self):
+        """Get the reflected ORM model registry of this connection"""
+        # Purpose: Imported and reflected on first use, so pages that do not need ORM models never pay for it
+        if self.models is None:
+            from models import get_registry
+            self.models = get_registry(self.engine)
+        return self.models
+
+    def get_key_allocator(self):
+        """Get the sequence-backed key allocator of this connection"""
+        if self.keys is None:
+            from key_allocation import KeyAllocator
+            self.keys = KeyAllocator(self.engine)
+        return self.keys
+
+    def _sync_key_sequences(self) -> None:
+        """Move the key sequences past keys loaded with explicit ids, so inserts that use them do not collide"""
+        # Purpose: The Phase1 scripts load leases with explicit LeaseIDs, which leaves lease_leaseid_seq at 1;
+        # Add Record, bulk inserts and the rental procedure all take lease keys from that sequence
+        from key_allocation import sync_key_sequences
+        conn = self.engine.raw_connection()
+        try:
+            sync_key_sequences(conn)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"Could not move key sequences past existing keys: {str(e)}")
+        finally:
+            conn.close()
+
+    def _key_column(self, table_name: str) -> Optional[str]:
+        """The single-column primary key of a table when it is filled from a sequence"""
+        key = self.inspector.get_pk_constraint(table_name).get('constrained_columns') or []
+        if len(key) != 1:
+            return None
+        return key[0] if self.get_key_allocator().sequence(table_name, key[0]) else None
+
+    def allocate_ids(self, table_name: str, count: int) -> List[int]:
+        """Reserve primary key values of a table with one nextval round trip"""
+        # Purpose: Keys are known before the insert (e.g. to build child rows) without MAX()+1 races
+        column = self._key_column(table_name)
+        if column is None:
+            raise ValueError(f"Table {table_name} has no sequence-backed primary key")
+        return self.get_key_allocator().allocate(table_name, column, count)
+
+    def _fill_keys(self, table_name: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Give rows without a primary key value one from the table's sequence, reserved as one block"""
+        # Rows of one executemany batch must all bind the same columns, so blank keys cannot be left out
+        column = self._key_column(table_name) if records else None
+        if column is None:
+            return records
+        missing = [record for record in records if record.get(column) is None]
+        if missing:
+            for record, key in zip(missing, self.get_key_allocator().allocate(table_name, column, len(missing))):
+                record[column] = key
+        return records
+
+    def get_free_rooms(self, check_in: Any, check_out: Any) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Get rooms with a place on every day of the stay (from the room_load capacity index)"""
+        # Purpose: A read like any other report, so it goes to a replica when one is configured
+        return self.run_guarded_query("SELECT * FROM free_rooms(%s, %s)", [check_in, check_out])
+
+    def get_best_rooms(self, student_id: int, check_in: Any, check_out: Any,
+                       limit: int = 10) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Get the free rooms that suit a student best, best first"""
+        return self.run_guarded_query("SELECT * FROM best_room_for_student(%s, %s, %s) LIMIT %s",
+                                      [student_id, check_in, check_out, limit])
+
+    def assign_room(self, student_id: int, room_id: Optional[int] = None, check_in: Any = None,
+                    check_out: Any = None) -> List[str]:
+        """Assign a student to a room (the best free one when room_id is None) and return the procedure's notices"""
+        # Purpose: Unset dates are left to the procedure's defaults (today, one year)
+        params = [student_id, room_id] + [value for value in (check_in, check_out) if value is not None]
+        if check_in is None and check_out is not None:
+            raise ValueError("A check-out date needs a check-in date")
+        _, notices = self.execute_routine('assign_rooms_to_students', 'PROCEDURE', 'assign_rooms_to_students',
+                                          params)
+        return notices
+
+    def has_maintenance_rollups(self) -> bool:
+        """Whether the maintenance rollups (maintenance_rollups.py --install) exist in this database"""
+        with self.engine.connect() as conn:
+            return bool(conn.execute(text("SELECT to_regclass('maintenance_by_priority') IS NOT NULL")).scalar())
+
+    def get_maintenance_summary(self, view: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Get one of the maintenance rollup views (by room, building, priority or month)"""
+        from maintenance_rollups import VIEWS
+        if view not in VIEWS:
+            raise ValueError(f"Unknown maintenance view: {view}")
+        return self.run_guarded_query(f"SELECT * FROM {view}")
+
+    def check_maintenance_rollups(self, sample: int = 20) -> Dict[str, Any]:
+        """Compare the maintenance rollups with a full recomputation from maintenance_request"""
+        # Purpose: Runs on the primary; a replica may lag the requests it would be compared with
+        from maintenance_rollups import check
+        raw_conn = self.engine.raw_connection()
+        try:
+            return check(raw_conn, sample)
+        finally:
+            raw_conn.close()
+
+    def has_revenue_cube(self) -> bool:
+        """Whether the revenue cube (revenue_cube.py --install) exists in this database"""
+        with self.engine.connect() as conn:
+            return bool(conn.execute(text("SELECT to_regclass('revenue_by_year') IS NOT NULL")).scalar())
+
+    def get_revenue_report(self, first_year: int, last_year: int,
+                           by: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Get revenue and discounts per academic year, optionally per 'manager' or 'building', in one query"""
+        # Purpose: Reads the revenue cube, so a multi-year dashboard costs one small aggregate instead of
+        # one calculate_annual_revenue_and_discounts loop over the leases per year
+        from revenue_cube import REPORT_VIEWS
+        if by not in REPORT_VIEWS:
+            raise ValueError(f"Unknown revenue breakdown: {by}")
+        return self.run_guarded_query(f"SELECT * FROM {REPORT_VIEWS[by]} WHERE academic_year BETWEEN %s AND %s "
+                                      f"ORDER BY 1, 2", [first_year, last_year])
+
+    def check_revenue_cube(self, sample: int = 20) -> Dict[str, Any]:
+        """Compare the revenue cubes with a full recomputation from the leases and stays"""
+        from revenue_cube import check
+        raw_conn = self.engine.raw_connection()
+        try:
+            return check(raw_conn, sample)
+        finally:
+            raw_conn.close()
+
+    def get_table_rules(self, table_name: str) -> TableRules:
+        """Get the validation rules of a table (derived once from its columns and CHECK constraints)"""
+        rules = self._table_rules.get(table_name)
+        if rules is None:
+            rules = TableRules.from_inspector(self.inspector, table_name)
+            self._table_rules[table_name] = rules
+        return rules
+
+    def validate_records(self, table_name: str, records: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Check rows against a table's constraints before loading them"""
+        # Purpose: Rejects a bad file up front with a per-row report, instead of failing part-way through
+        # a load on the first row the server refuses
+        if table_name not in self.get_table_names():
+            raise ValueError(f"Table {table_name} does not exist")
+        report, summary = validate_frame(self.get_table_rules(table_name), records)
+        logger.info(f"Validated {summary['rows']} rows for {table_name}: {summary['errors']} errors "
+                    f"in {summary['elapsed_ms']:.0f} ms")
+        return report, summary
+
+    def insert_records(self, table_name: str, records: List[Dict[str, Any]]) -> int:
+        """Insert many records in one transaction"""
+        # Purpose: Batched counterpart of insert_record for imports; all rows are inserted or none
+        if table_name not in self.get_table_names():
+            logger.error(f"Table {table_name} does not exist")
+            return 0
+        try:
+            records = convert_records(records, self._get_column_types(table_name))  # Column by column
+            records = self._fill_keys(table_name, records)
+            inserted = self.get_model_registry().bulk_insert(table_name, records)
+            self._invalidate_written(table_name)
+            return inserted
+        except Exception as e:
+            logger.error(f"Error inserting records into table {table_name}: {str(e)}")
+            return 0
+
     def update_record(self, table_name: str, record_id: Any, data: Dict[str, Any], id_column: str = 'id') -> bool:
         """Update a record"""
         # Purpose: Updates a record identified by `record_id` in the specified table
@@ -138,25 +679,31 @@ class DatabaseManager:
             logger.error(f"Table {table_name} does not exist")
             return False
         try:
-            data = self._sanitize_dict(data)  # Sanitize input data
-            record_id = self._sanitize_value(record_id)  # Sanitize record ID
-
-            table = Table(table_name, self.metadata, autoload_with=self.engine)  # Reflect table schema
-            update_query = table.update().where(
-                getattr(table.c, id_column) == record_id
-            ).values(**data)  # Build update query with condition
-
-            with self.engine.connect() as conn:
-                result = conn.execute(update_query)  # Execute update
-                conn.commit()  # Commit transaction
-
-                # Check if any rows were updated
-                if result.rowcount > 0:
-                    logger.info(f"Record successfully updated in table {table_name}")
-                    return True
-                else:
-                    logger.warning(f"No record found to update in table {table_name}")
-                    return False
+            data = convert_record(data, self._get_column_types(table_name))  # Convert by column type
+            record_id = self._convert_key(table_name, id_column, record_id)
+            columns = list(data.keys())
+            unknown = (set(columns) | {id_column}) - set(self._get_column_names(table_name))
+            if unknown:
+                logger.error(f"Unknown columns for table {table_name}: {', '.join(sorted(unknown))}")
+                return False
+            if not columns:
+                logger.warning(f"Nothing to update in table {table_name}")
+                return False
+
+            # Statement shape: table + updated column set + key column
+            assignments = ', '.join(f"{quote_ident(c)} = ${i}" for i, c in enumerate(columns, 1))
+            sql_text = (f"UPDATE {quote_ident(table_name)} SET {assignments} "
+                        f"WHERE {quote_ident(id_column)} = ${len(columns) + 1}")
+            rowcount = self._execute_prepared(('update', table_name, tuple(columns), id_column),
+                                              sql_text, list(data.values()) + [record_id])
+
+            # Check if any rows were updated
+            if rowcount > 0:
+                logger.info(f"Record successfully updated in table {table_name}")
+                return True
+            else:
+                logger.warning(f"No record found to update in table {table_name}")
+                return False
 
         except Exception as e:
             logger.error(f"Error updating record in table {table_name}: {str(e)}")
@@ -169,24 +716,22 @@ class DatabaseManager:
             logger.error(f"Table {table_name} does not exist")
             return False
         try:
-            record_id = self._sanitize_value(record_id)  # Sanitize record ID
-
-            table = Table(table_name, self.metadata, autoload_with=self.engine)  # Reflect table schema
-            delete_query = table.delete().where(
-                getattr(table.c, id_column) == record_id
-            )  # Build delete query with condition
-
-            with self.engine.connect() as conn:
-                result = conn.execute(delete_query)  # Fixed: was update_query
-                conn.commit()  # Commit transaction
-
-                # Check if any rows were deleted
-                if result.rowcount > 0:
-                    logger.info(f"Record successfully deleted from table {table_name}")
-                    return True
-                else:
-                    logger.warning(f"No record found to delete in table {table_name}")
-                    return False
+            record_id = self._convert_key(table_name, id_column, record_id)
+            if id_column not in self._get_column_names(table_name):
+                logger.error(f"Unknown column {id_column} for table {table_name}")
+                return False
+
+            # Statement shape: table + key column
+            sql_text = f"DELETE FROM {quote_ident(table_name)} WHERE {quote_ident(id_column)} = $1"
+            rowcount = self._execute_prepared(('delete', table_name, id_column), sql_text, [record_id])
+
+            # Check if any rows were deleted
+            if rowcount > 0:
+                logger.info(f"Record successfully deleted from table {table_name}")
+                return True
+            else:
+                logger.warning(f"No record found to delete in table {table_name}")
+                return False
 
         except Exception as e:
             logger.error(f"Error deleting record in table {table_name}: {str(e)}")
@@ -207,9 +752,9 @@ class DatabaseManager:
                            AND NOT routine_name LIKE 'log_changes'
                          ORDER BY routine_name
                          """)  # Query to get routines, filtering out system/trigger routines
-            with self.engine.connect() as conn:
-                result = pd.read_sql(query, self.engine)  # Execute query and return as DataFrame
-                return result.to_dict('records')  # Convert to list of dictionaries
+            # Execute query and convert to list of dictionaries
+            return self._cached(('routines',), lambda: pd.read_sql(query, self.engine).to_dict('records'),
+                                ('schema',), ttl_s=3600)
         except Exception as e:
             logger.error(f"Error retrieving routines: {str(e)}")
             return []
@@ -226,61 +771,116 @@ class DatabaseManager:
                            AND parameter_name IS NOT NULL
                          ORDER BY ordinal_position
                          """)  # Query to get parameter metadata
-            with self.engine.connect() as conn:
-                result = pd.read_sql(query, self.engine, params={"specific_name": specific_name})
-                return result.to_dict('records')  # Convert to list of dictionaries
+            return self._cached(
+                ('function_parameters', specific_name),
+                lambda: pd.read_sql(query, self.engine, params={"specific_name": specific_name}).to_dict('records'),
+                ('schema',), ttl_s=3600)
         except Exception as e:
             logger.error(f"Error retrieving parameters for function {specific_name}: {str(e)}")
             return []
 
+    def _load_routine_metadata(self) -> Dict[str, Dict[str, Any]]:
+        """Load pg_proc metadata for all public routines (cached)"""
+        # Purpose: Reads kind, SETOF flag, return type and OUT parameters of every routine in a single
+        # query, so the dispatcher and the routines page never need per-routine catalog round-trips
+        if self._routine_metadata is not None:
+            return self._routine_metadata
+        query = text("""
+                     SELECT p.proname || '_' || p.oid AS specific_name,
+                            p.proname AS routine_name,
+                            p.prokind,
+                            p.proretset,
+                            p.prorettype::regtype::text AS return_type,
+                            t.typtype = 'c' AS returns_composite,
+                            COALESCE(p.proargmodes && ARRAY['o', 'b', 't']::"char"[], FALSE) AS has_out_params
+                     FROM pg_proc p
+                     JOIN pg_namespace n ON n.oid = p.pronamespace
+                     JOIN pg_type t ON t.oid = p.prorettype
+                     WHERE n.nspname = 'public'
+                       AND p.prokind IN ('f', 'p')
+                     """)  # specific_name matches information_schema.routines.specific_name
+
+        def load() -> Dict[str, Dict[str, Any]]:
+            with self.engine.connect() as conn:
+                rows = conn.execute(query).mappings().all()
+            metadata = {}
+            for row in rows:
+                meta = dict(row)
+                meta['strategy'] = self._classify_routine(meta)
+                metadata[meta['specific_name']] = meta
+            return metadata
+
+        metadata = self._cached(('routine_metadata',), load, ('schema',), ttl_s=3600)
+        self._routine_metadata = metadata
+        logger.info(f"Loaded metadata for {len(metadata)} routines")
+        return metadata
+
+    @staticmethod
+    def _classify_routine(meta: Dict[str, Any]) -> str:
+        """Choose the single execution strategy for a routine from its pg_proc metadata"""
+        if meta['prokind'] == 'p':
+            return 'procedure'  # CALL ...
+        if meta['proretset']:
+            return 'setof'  # SELECT * FROM ... (SETOF / RETURNS TABLE)
+        if meta['return_type'] == 'refcursor':
+            return 'refcursor'  # SELECT ... → FETCH ALL IN <cursor>
+        if meta['has_out_params'] or meta['returns_composite'] or meta['return_type'] == 'record':
+            return 'out_params'  # SELECT * FROM ... (one row, one column per OUT parameter)
+        return 'scalar'  # SELECT ... AS result
+
+    def clear_routine_cache(self) -> None:
+        """Forget cached routine and schema metadata (call after creating or replacing routines or tables)"""
+        self._routine_metadata = None
+        self.inspector = inspect(self.engine)  # The inspector caches reflected schema too
+        self._table_rules = {}
+        if self.models is not None:
+            self.models.refresh()
+        if self.keys is not None:
+            self.keys.reset()
+        self.invalidate_cache('schema')
+
+    def get_routine_metadata(self, specific_name: str, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Get cached pg_proc metadata for a routine"""
+        # Purpose: Looks up by specific name, falling back to the routine name when it is not overloaded
+        try:
+            metadata = self._load_routine_metadata()
+        except Exception as e:
+            logger.warning(f"Could not load routine metadata: {e}")
+            return None
+        if specific_name in metadata:
+            return metadata[specific_name]
+        if name:
+            matches = [meta for meta in metadata.values() if meta['routine_name'] == name]
+            if len(matches) == 1:
+                return matches[0]
+        return None
+
     def _detect_refcursor_return(self, specific_name: str) -> bool:
         """Check if function returns REFCURSOR"""
-        # Purpose: Checks if a function returns a REF CURSOR by examining OUT parameters
+        # Purpose: Checks if a function returns a REF CURSOR using the cached pg_proc metadata
         # Importance: Enables automatic detection of REF CURSOR functions for proper handling in execute_routine
-        try:
-            with self.engine.connect() as conn:
-                query = text("""
-                             SELECT data_type
-                             FROM information_schema.parameters
-                             WHERE specific_name = :specific_name
-                               AND parameter_mode = 'OUT'
-                               AND data_type = 'refcursor'
-                             """)  # Query to check for REF CURSOR in OUT parameters
-                result = conn.execute(query, {"specific_name": specific_name})
-                return result.fetchone() is not None  # True if REF CURSOR is found
-        except Exception as e:
-            logger.warning(f"Could not detect REFCURSOR return type: {e}")
-            return False
+        meta = self.get_routine_metadata(specific_name)
+        return meta is not None and meta['strategy'] == 'refcursor'
 
     def _get_function_return_type(self, specific_name: str) -> Optional[str]:
         """Get the return type of a function"""
         # Purpose: Retrieves the return type of a function, handling standard and user-defined types
-        try:
-            with self.engine.connect() as conn:
-                query = text("""
-                             SELECT data_type, type_udt_name
-                             FROM information_schema.routines
-                             WHERE specific_name = :specific_name
-                             """)  # Query to get return type
-                result = conn.execute(query, {"specific_name": specific_name})
-                row = result.mappings().fetchone()
-                if row:
-                    return row['data_type'] if row['data_type'] != 'USER-DEFINED' else row['type_udt_name']
-        except Exception as e:
-            logger.warning(f"Could not get function return type: {e}")
-        return None
+        meta = self.get_routine_metadata(specific_name)
+        return meta['return_type'] if meta else None
 
     def execute_routine(self, name: str, routine_type: str, specific_name: str,
-                        params: List[Any] = None, refcursor_flag: bool = False) -> Tuple[pd.DataFrame, List[str]]:
+                        params: List[Any] = None, refcursor_flag: bool = False,
+                        notice_listener: Optional[Callable[[str], None]] = None) -> Tuple[pd.DataFrame, List[str]]:
         """
-        Enhanced execution of PostgreSQL procedures and functions with NOTICE support and REF CURSOR handling.
+        Execution of PostgreSQL procedures and functions with NOTICE support and REF CURSOR handling.
 
         Supports:
         - PROCEDURE: CALL ...
-        - FUNCTION: SELECT * FROM ... (for SETOF)
+        - FUNCTION (SETOF / RETURNS TABLE): SELECT * FROM ...
+        - FUNCTION (OUT parameters / composite): SELECT * FROM ... (single row)
+        - FUNCTION (scalar): SELECT ... AS result
         - FUNCTION (REFCURSOR): SELECT ... AS refname → FETCH ALL IN <refname>
-        - NOTICE message capture
-        - Automatic REF CURSOR detection and handling
+        - NOTICE message capture for every strategy
 
         Args:
             name: The routine name
@@ -288,135 +888,201 @@ class DatabaseManager:
             specific_name: The specific routine identifier
             params: List of parameters to pass
             refcursor_flag: Explicit flag to indicate REF CURSOR expected
+            notice_listener: Called with every NOTICE while the routine is still running
 
         Returns:
             Tuple[pd.DataFrame, List[str]]: (result_data, notice_messages)
 
-        REF CURSOR Complexity:
-        - REF CURSOR functions return a cursor object that must be fetched separately
-        - Requires transaction management (BEGIN/COMMIT) to keep the cursor open
-        - Uses psycopg2 for direct access to PostgreSQL's cursor and NOTICE features
-        - Automatically detects REF CURSOR via _detect_refcursor_return or explicit flag
-        - Fetches all rows from the cursor and closes it properly
+        Dispatch:
+        - The strategy is chosen once from cached pg_proc metadata (prokind, proretset, prorettype),
+          so a routine is executed exactly once and its side effects are never repeated
+        - Routines missing from the cache fall back to the declared routine_type
+        - REF CURSOR functions run inside one transaction so the cursor stays open until fetched
+        - SETOF / OUT-parameter functions are read from a replica when one is configured and
+          retried on the primary if they turn out to write
+
+        Notices:
+        - Collected in a NoticeBuffer: the newest notice_buffer_size messages are returned, the complete
+          output is written to last_notice_log when there are more
+        - With a notice_listener the routine runs on the manager's asynchronous streaming connection,
+          kept open between calls, so notices are delivered as they are raised instead of after the call
         """
         self.notices = []  # Reset notices list
 
         try:
             params = params or []
-            sanitized_params = [self._sanitize_value(p) for p in params]  # Sanitize input parameters
-
-            # Check if this is a REF CURSOR function
-            is_refcursor = refcursor_flag or self._detect_refcursor_return(specific_name)
-
-            # Try SQLAlchemy for non-REF CURSOR routines (simpler cases)
-            if not is_refcursor:
-                try:
-                    result_df = self._execute_routine_sqlalchemy(name, routine_type, specific_name, sanitized_params)
-                    return result_df, []  # No notices captured with SQLAlchemy
-                except Exception as sqlalchemy_error:
-                    logger.info(f"SQLAlchemy execution failed, trying psycopg2: {sqlalchemy_error}")
-
-            # Use psycopg2 for REF CURSOR or when SQLAlchemy fails
-            return self._execute_routine_psycopg2(name, routine_type, specific_name, sanitized_params, is_refcursor)
+            sanitized_params = self._convert_params(specific_name, params)  # Convert by parameter type
+            strategy = self._get_routine_strategy(name, routine_type, specific_name, refcursor_flag)
+            # Report functions (SETOF / OUT parameters) are reads and go to a replica when configured
+            engine = self.read_engine() if strategy in ('setof', 'out_params') else self.engine
+            writes = strategy not in ('setof', 'out_params')
+            try:
+                result_df, self.notices = self._execute_routine_psycopg2(name, strategy, sanitized_params,
+                                                                         notice_listener, engine)
+            except errors.ReadOnlySqlTransaction:
+                if engine is self.engine:
+                    raise
+                logger.info(f"{name} writes data, running it on the primary")
+                writes = True
+                result_df, self.notices = self._execute_routine_psycopg2(name, strategy, sanitized_params,
+                                                                         notice_listener, self.engine)
+            if writes:
+                self.invalidate_cache('data')  # The routine may have written to any table
+            return result_df, self.notices
 
         except Exception as e:
             logger.error(f"Error executing {routine_type} {name}: {str(e)}")
-            return pd.DataFrame(), [f"Error: {str(e)}"]
-
-    def _execute_routine_sqlalchemy(self, name: str, routine_type: str, specific_name: str, params: List[Any]) -> pd.DataFrame:
-        """Execute routine using SQLAlchemy (for compatibility with simple cases)"""
-        # Purpose: Handles procedures and non-REF CURSOR functions using SQLAlchemy
-        # Does not support NOTICE capture or REF CURSOR
-        param_dict = {f"param{i}": p for i, p in enumerate(params)}
-        placeholders = ', '.join([f":param{i}" for i in range(len(params))])
-
-        with self.engine.connect() as conn:
-            with conn.begin():
-                if routine_type.upper() == 'PROCEDURE':
-                    query = text(f"CALL {name}({placeholders})")  # Execute procedure
-                    conn.execute(query, param_dict)
-                    return pd.DataFrame()  # Procedures typically don't return data
-
-                elif routine_type.upper() == 'FUNCTION':
-                    # Try as SETOF function (returns multiple rows)
-                    try:
-                        query = text(f"SELECT * FROM {name}({placeholders})")
-                        result = conn.execute(query, param_dict)
-                        rows = result.fetchall()
-                        return pd.DataFrame(rows, columns=result.keys()) if rows else pd.DataFrame()
-                    except Exception:
-                        # Fallback to scalar function (returns single value)
-                        query = text(f"SELECT {name}({placeholders}) AS result")
-                        result = conn.execute(query, param_dict)
-                        row = result.fetchone()
-                        return pd.DataFrame([dict(row)]) if row else pd.DataFrame()
-
-                else:
-                    raise ValueError(f"Unsupported routine type: {routine_type}")
-
-    def _execute_routine_psycopg2(self, name: str, routine_type: str, specific_name: str,
-                                  sanitized_params: List[Any], is_refcursor: bool = False) -> Tuple[pd.DataFrame, List[str]]:
+            return pd.DataFrame(), self.notices + [f"Error: {str(e)}"]
+
+    def _get_routine_strategy(self, name: str, routine_type: str, specific_name: str,
+                              refcursor_flag: bool = False) -> str:
+        """Resolve the execution strategy of a routine"""
+        if refcursor_flag:
+            return 'refcursor'
+        meta = self.get_routine_metadata(specific_name, name)
+        if meta is not None:
+            return meta['strategy']
+        logger.warning(f"No pg_proc metadata for {name}, using declared type {routine_type}")
+        if routine_type.upper() == 'PROCEDURE':
+            return 'procedure'
+        if routine_type.upper() == 'FUNCTION':
+            return 'setof'
+        raise ValueError(f"Unsupported routine type: {routine_type}")
+
+    def _execute_routine_psycopg2(self, name: str, strategy: str, sanitized_params: List[Any],
+                                  notice_listener: Optional[Callable[[str], None]] = None,
+                                  engine=None) -> Tuple[pd.DataFrame, List[str]]:
         """
         Execute routine using psycopg2 with NOTICE capture and REF CURSOR support.
-        Purpose: Provides robust handling for procedures and functions, especially those returning REF CURSORs
+        Purpose: Runs the routine with exactly one strategy on one pooled connection
+        (or on the reusable streaming connection when notices are consumed live)
         """
-        # Create raw psycopg2 connection for advanced PostgreSQL features
-        raw_conn = self.engine.raw_connection()
-        raw_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        engine = engine or self.engine
+        notices = self._new_notice_buffer(name, notice_listener)
+        if notice_listener is not None:
+            raw_conn = self._checkout_streaming_connection(notices, engine)
+        else:
+            raw_conn = engine.raw_connection()
+            pooled_notices = raw_conn.dbapi_connection.notices
+            raw_conn.dbapi_connection.notices = notices  # Unbounded by psycopg2's 50-notice list trimming
+        # REF CURSOR needs a transaction to keep the cursor open; everything else runs in autocommit
+        raw_conn.set_isolation_level(ISOLATION_LEVEL_DEFAULT if strategy == 'refcursor' else ISOLATION_LEVEL_AUTOCOMMIT)
 
         try:
             with raw_conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                if routine_type.upper() == 'PROCEDURE':
-                    return self._execute_procedure_psycopg2(cursor, name, sanitized_params, raw_conn)
-                else:
-                    return self._execute_function_psycopg2(cursor, name, sanitized_params, is_refcursor, raw_conn)
+                try:
+                    if strategy == 'procedure':
+                        df = self._execute_procedure_psycopg2(cursor, name, sanitized_params, raw_conn)
+                    elif strategy == 'refcursor':
+                        df = self._execute_refcursor_function(cursor, name, sanitized_params, raw_conn)
+                    elif strategy == 'scalar':
+                        df = self._execute_scalar_function(cursor, name, sanitized_params, raw_conn)
+                    elif strategy in ('setof', 'out_params'):
+                        df = self._execute_setof_function(cursor, name, sanitized_params, raw_conn)
+                    else:
+                        raise ValueError(f"Unsupported execution strategy: {strategy}")
+                finally:
+                    # Capture NOTICE messages from PostgreSQL (also raised before an error)
+                    self.notices = self._collect_notices(notices)
+            return df, self.notices
 
         finally:
-            raw_conn.close()
-
-    def _execute_procedure_psycopg2(self, cursor, name: str, params: List[Any], raw_conn) -> Tuple[pd.DataFrame, List[str]]:
+            if notice_listener is None:
+                raw_conn.dbapi_connection.notices = pooled_notices
+                raw_conn.set_isolation_level(ISOLATION_LEVEL_DEFAULT)  # Return the connection to the pool unchanged
+                raw_conn.close()
+            else:
+                self._release_streaming_connection(raw_conn, engine)
+
+    def _new_notice_buffer(self, label: str, listener: Optional[Callable[[str], None]] = None) -> NoticeBuffer:
+        """Create a notice buffer with a unique spill file name"""
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        file_name = f"{label}_{stamp}_{uuid.uuid4().hex[:8]}.log"
+        return NoticeBuffer(self.notice_buffer_size, os.path.join(self.notice_log_dir, file_name), listener)
+
+    def _collect_notices(self, notices: NoticeBuffer) -> List[str]:
+        """Close a notice buffer and return its messages, pointing to the spill file if some were dropped"""
+        notices.close()
+        self.last_notice_log = notices.spill_path if notices.spilled else None
+        messages = notices.messages()
+        if notices.dropped:
+            messages.insert(0, f"{notices.dropped} earlier notices omitted, full output in {notices.spill_path}")
+        return messages
+
+    @staticmethod
+    def _streaming_connection(notices: NoticeBuffer, engine, capture_log=None) -> StreamingConnection:
+        """Open a dedicated asynchronous connection with the engine's connection parameters"""
+        connect_args, connect_kwargs = engine.dialect.create_connect_args(engine.url)
+        return StreamingConnection(connect_args, connect_kwargs, notices, capture_log=capture_log)
+
+    def _checkout_streaming_connection(self, notices: NoticeBuffer, engine) -> StreamingConnection:
+        """Take the idle streaming connection of an engine, opening one if there is none (or it is busy or old)"""
+        # Purpose: Like a pooled connection, the streaming connection outlives the call, so a routine run
+        # pays no connection setup and keeps the connection's prepared statement cache
+        with self._streaming_lock:
+            conn = self._streaming_conns.pop(engine, None)
+        if conn is not None and (time.monotonic() - conn.created_at > self.streaming_recycle_s or not conn.ping()):
+            conn.close()
+            conn = None
+        if conn is None:
+            return self._streaming_connection(notices, engine, self.capture_log)
+        conn.notices = notices
+        return conn
+
+    def _release_streaming_connection(self, conn: StreamingConnection, engine) -> None:
+        """Keep a streaming connection for the next call, or close it if it broke or another one is idle"""
+        if not conn.closed:
+            try:
+                conn.rollback()  # Leave no transaction open (a failed REF CURSOR call)
+                conn.set_isolation_level(ISOLATION_LEVEL_DEFAULT)
+                conn.notices = []  # Detach the call's buffer
+            except psycopg2.Error as e:
+                logger.warning(f"Discarding streaming connection: {e}")
+                conn.close()
+        with self._streaming_lock:
+            if not conn.closed and self._streaming_conns.get(engine) is None:
+                self._streaming_conns[engine] = conn
+                return
+        conn.close()
+
+    def _close_streaming_connections(self) -> None:
+        """Close the idle streaming connections (they were opened with the previous capture settings)"""
+        with self._streaming_lock:
+            conns, self._streaming_conns = list(self._streaming_conns.values()), {}
+        for conn in conns:
+            conn.close()
+
+    @staticmethod
+    def _format_notice(notice: str) -> str:
+        """Strip the severity prefix psycopg2 keeps in notice strings ("NOTICE:  ...")"""
+        return format_notice(notice)
+
+    @staticmethod
+    def _rows_to_dataframe(rows) -> pd.DataFrame:
+        """Convert RealDictCursor rows to a DataFrame"""
+        return pd.DataFrame([dict(row) for row in rows]) if rows else pd.DataFrame()
+
+    def _execute_procedure_psycopg2(self, cursor, name: str, params: List[Any], raw_conn) -> pd.DataFrame:
         """Execute a stored procedure"""
-        # Purpose: Executes a stored procedure using psycopg2 and captures NOTICE messages
-        param_placeholders = ', '.join(['%s'] * len(params))
-
-        if params:
-            query = f"CALL {name}({param_placeholders})"
-            cursor.execute(query, params)
-        else:
-            query = f"CALL {name}()"
-            cursor.execute(query)
-
-        # Capture NOTICE messages from PostgreSQL
-        notices = [notice.message.strip() for notice in raw_conn.notices if hasattr(notice, 'message')]
-        return pd.DataFrame(), notices  # Procedures typically don't return data
-
-    def _execute_function_psycopg2(self, cursor, name: str, params: List[Any],
-                                   is_refcursor: bool, raw_conn) -> Tuple[pd.DataFrame, List[str]]:
-        """Execute function with proper REF CURSOR handling"""
-        # Purpose: Routes function execution to appropriate handler based on REF CURSOR status
-        if is_refcursor:
-            return self._execute_refcursor_function(cursor, name, params, raw_conn)
-        else:
-            return self._execute_regular_function(cursor, name, params, raw_conn)
-
-    def _execute_refcursor_function(self, cursor, name: str, params: List[Any], raw_conn) -> Tuple[pd.DataFrame, List[str]]:
+        # Purpose: Executes a stored procedure using psycopg2; INOUT parameters come back as one row
+        # CALL cannot be prepared by PostgreSQL, so the cache counts it as bypassed and runs it directly
+        cache = self._get_statement_cache(raw_conn)
+        query = f"CALL {quote_ident(name)}({placeholders(len(params))})"
+        cache.execute(cursor, ('call', name, len(params)), query, params)
+        return self._rows_to_dataframe(cursor.fetchall()) if cursor.description else pd.DataFrame()
+
+    def _execute_refcursor_function(self, cursor, name: str, params: List[Any], raw_conn) -> pd.DataFrame:
         """Execute a function that returns REF CURSOR and fetch its results"""
-        # Purpose: Handles REF CURSOR functions by managing transactions, fetching results, and capturing notices
+        # Purpose: Handles REF CURSOR functions by managing transactions and fetching results
         # Complexity:
-        # - Requires explicit transaction (BEGIN/COMMIT) to keep cursor open
+        # - Runs in a transaction (opened implicitly by psycopg2) to keep the cursor open
         # - Retrieves dynamic cursor name and fetches all rows
-        # - Properly closes cursor and handles errors
+        # - COMMIT closes the cursor, ROLLBACK undoes everything on error
         try:
-            cursor.execute("BEGIN")  # Start transaction for REF CURSOR
-
             # Call function to get cursor name
-            param_placeholders = ', '.join(['%s'] * len(params))
-            if params:
-                query = f"SELECT {name}({param_placeholders}) AS cursor_name"
-                cursor.execute(query, params)
-            else:
-                query = f"SELECT {name}() AS cursor_name"
-                cursor.execute(query)
+            cache = self._get_statement_cache(raw_conn)
+            query = f"SELECT {quote_ident(name)}({placeholders(len(params))}) AS cursor_name"
+            cache.execute(cursor, ('refcursor', name, len(params)), query, params)
 
             result = cursor.fetchone()
             cursor_name = result['cursor_name']  # Get cursor name returned by function
@@ -424,81 +1090,275 @@ class DatabaseManager:
             logger.info(f"REF CURSOR returned: {cursor_name}")
 
             # Fetch all rows from the cursor
-            cursor.execute(f"FETCH ALL IN \"{cursor_name}\"")
+            cursor.execute(f"FETCH ALL IN {quote_ident(cursor_name)}")
             rows = cursor.fetchall()
-
-            # Close the cursor and commit transaction
-            cursor.execute(f"CLOSE \"{cursor_name}\"")
-            cursor.execute("COMMIT")
-
-            # Capture NOTICE messages
-            notices = [notice.message.strip() for notice in raw_conn.notices if hasattr(notice, 'message')]
+            raw_conn.commit()  # Commit transaction (closes the cursor)
 
             # Convert results to DataFrame
-            if rows:
-                df = pd.DataFrame([dict(row) for row in rows])
-                logger.info(f"REF CURSOR fetched {len(df)} rows with columns: {list(df.columns)}")
-            else:
-                df = pd.DataFrame()
+            df = self._rows_to_dataframe(rows)
+            if df.empty:
                 logger.info("REF CURSOR returned no data")
-
-            return df, notices
+            else:
+                logger.info(f"REF CURSOR fetched {len(df)} rows with columns: {list(df.columns)}")
+            return df
 
         except Exception as e:
-            cursor.execute("ROLLBACK")  # Rollback transaction on error
+            raw_conn.rollback()  # Rollback transaction on error
             logger.error(f"Error executing REF CURSOR function {name}: {str(e)}")
             raise
 
-    def _execute_regular_function(self, cursor, name: str, params: List[Any], raw_conn) -> Tuple[pd.DataFrame, List[str]]:
-        """Execute a regular function (SETOF or scalar)"""
-        # Purpose: Handles non-REF CURSOR functions, attempting SETOF (multiple rows) or scalar (single value)
-        param_placeholders = ', '.join(['%s'] * len(params))
+    def _execute_setof_function(self, cursor, name: str, params: List[Any], raw_conn) -> pd.DataFrame:
+        """Execute a SETOF / RETURNS TABLE function or a function with OUT parameters"""
+        cache = self._get_statement_cache(raw_conn)
+        query = f"SELECT * FROM {quote_ident(name)}({placeholders(len(params))})"
+        cache.execute(cursor, ('setof', name, len(params)), query, params)
+        return self._rows_to_dataframe(cursor.fetchall())
+
+    def _execute_scalar_function(self, cursor, name: str, params: List[Any], raw_conn) -> pd.DataFrame:
+        """Execute a function returning a single value"""
+        cache = self._get_statement_cache(raw_conn)
+        query = f"SELECT {quote_ident(name)}({placeholders(len(params))}) AS result"
+        cache.execute(cursor, ('scalar', name, len(params)), query, params)
+        result = cursor.fetchone()
+        return pd.DataFrame([dict(result)]) if result else pd.DataFrame()
+
+    def execute_routine_batch(self, name: str, routine_type: str, specific_name: str,
+                              param_sets: Union[pd.DataFrame, Sequence[Sequence[Any]]],
+                              chunk_size: int = 500, workers: int = 1) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Execute a procedure or function once for every parameter set.
 
-        # Try as SETOF function first
-        try:
-            if params:
-                query = f"SELECT * FROM {name}({param_placeholders})"
-                cursor.execute(query, params)
-            else:
-                query = f"SELECT * FROM {name}()"
-                cursor.execute(query)
+        Args:
+            name: The routine name
+            routine_type: 'PROCEDURE' or 'FUNCTION'
+            specific_name: The specific routine identifier
+            param_sets: DataFrame (one row per call, columns in parameter order) or list of tuples
+            chunk_size: Number of calls committed together in one transaction
+            workers: Number of pooled connections processing chunks in parallel
 
-            rows = cursor.fetchall()
-            notices = [notice.message.strip() for notice in raw_conn.notices if hasattr(notice, 'message')]
+        Returns:
+            Tuple[pd.DataFrame, Dict[str, Any]]: (per-row report, summary with throughput)
 
-            if rows:
-                df = pd.DataFrame([dict(row) for row in rows])
-            else:
-                df = pd.DataFrame()
+        Batching:
+        - Calls are pipelined over one connection per worker, committing once per chunk
+        - Every call runs under a savepoint sent in the same round-trip, so a failing row is rolled
+          back alone and the rest of the chunk still commits
+        - NOTICEs and errors are recorded for each row
+        """
+        if not isinstance(param_sets, pd.DataFrame):
+            param_sets = pd.DataFrame([tuple(p) for p in param_sets])
+        # Convert column by column, by the declared type of each parameter
+        kinds = [kind_of_type_name(p['data_type']) for p in self.get_function_parameters(specific_name)
+                 if p['parameter_mode'].upper() in ('IN', 'INOUT')]
+        if len(kinds) != len(param_sets.columns):
+            kinds = ['other'] * len(param_sets.columns)
+        try:
+            columns = [convert_series(param_sets.iloc[:, i], kind).tolist() for i, kind in enumerate(kinds)]
+        except ValueError as e:  # Let the server reject the bad rows one by one in the report
+            logger.warning(f"Batch parameters of {name} do not match their types, sending them unconverted: {e}")
+            columns = [convert_series(param_sets.iloc[:, i]).tolist() for i in range(len(param_sets.columns))]
+        rows = [list(row) for row in zip(*columns)] if columns else [[] for _ in range(len(param_sets))]
+
+        strategy = self._get_routine_strategy(name, routine_type, specific_name)
+        if strategy == 'refcursor':
+            raise ValueError("REF CURSOR functions cannot be executed in batch mode")
+
+        chunk_size = max(1, int(chunk_size))
+        chunks = [(start, rows[start:start + chunk_size]) for start in range(0, len(rows), chunk_size)]
+        workers = max(1, min(int(workers), len(chunks) or 1))
+
+        started = time.perf_counter()
+        if workers == 1:
+            reports = [self._execute_batch_chunk(name, strategy, start, chunk) for start, chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                reports = list(executor.map(lambda c: self._execute_batch_chunk(name, strategy, *c), chunks))
+        elapsed = time.perf_counter() - started
+
+        report = pd.DataFrame([entry for chunk_report in reports for entry in chunk_report],
+                              columns=['row', 'status', 'rows_returned', 'notices', 'error'])
+        succeeded = int((report['status'] == 'ok').sum()) if not report.empty else 0
+        summary = {
+            'rows': len(rows),
+            'succeeded': succeeded,
+            'failed': len(rows) - succeeded,
+            'chunks': len(chunks),
+            'workers': workers,
+            'elapsed_s': elapsed,
+            'rows_per_s': len(rows) / elapsed if elapsed > 0 else 0.0
+        }
+        logger.info(f"Batch {name}: {succeeded}/{len(rows)} rows in {elapsed:.2f}s "
+                    f"({summary['rows_per_s']:.0f} rows/s, {workers} workers)")
+        return report, summary
+
+    def _execute_batch_chunk(self, name: str, strategy: str, start: int,
+                             chunk: List[List[Any]]) -> List[Dict[str, Any]]:
+        """Run one chunk of a batch in a single transaction on one pooled connection"""
+        if strategy == 'procedure':
+            template = "CALL {name}({args})"
+        elif strategy == 'scalar':
+            template = "SELECT {name}({args}) AS result"
+        else:
+            template = "SELECT * FROM {name}({args})"
 
-            return df, notices
+        report = []
+        raw_conn = self.engine.raw_connection()
+        raw_conn.set_isolation_level(ISOLATION_LEVEL_DEFAULT)
+        try:
+            with raw_conn.cursor() as cursor:
+                savepoint_open = False
+                for offset, params in enumerate(chunk):
+                    query = template.format(name=quote_ident(name), args=', '.join(['%s'] * len(params)))
+                    # Release the previous savepoint and open a new one in the same round-trip as the call
+                    prefix = "RELEASE SAVEPOINT batch_row; SAVEPOINT batch_row; " if savepoint_open else "SAVEPOINT batch_row; "
+                    del raw_conn.notices[:]
+                    entry = {'row': start + offset, 'status': 'ok', 'rows_returned': 0, 'notices': '', 'error': None}
+                    try:
+                        cursor.execute(prefix + query, params)
+                        savepoint_open = True
+                        if cursor.description:
+                            entry['rows_returned'] = len(cursor.fetchall())
+                    except psycopg2.Error as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT batch_row")  # Undo only this row
+                        savepoint_open = True
+                        entry['status'] = 'error'
+                        entry['error'] = str(e).strip()
+                    entry['notices'] = '\n'.join(self._format_notice(n) for n in raw_conn.notices)
+                    report.append(entry)
+            raw_conn.commit()  # One commit per chunk
+            self.invalidate_cache('data')
+        except Exception as e:
+            raw_conn.rollback()
+            logger.error(f"Batch chunk starting at row {start} failed: {str(e)}")
+            done = {entry['row'] for entry in report}
+            for offset in range(len(chunk)):
+                if start + offset not in done:
+                    report.append({'row': start + offset, 'status': 'error', 'rows_returned': 0,
+                                   'notices': '', 'error': str(e)})
+            for entry in report:
+                if entry['status'] == 'ok':
+                    entry['status'] = 'rolled back'  # The chunk transaction was not committed
+        finally:
+            raw_conn.close()
+        return report
 
-        except Exception as setof_error:
-            logger.info(f"SETOF execution failed, trying scalar: {setof_error}")
+    def run_sql_program(self, sql_content: str, stop_on_error: bool = True,
+                        explain: bool = True) -> Tuple[pd.DataFrame, Dict[int, pd.DataFrame], Dict[str, Any]]:
+        """
+        Run a multi-statement SQL script statement by statement in one transaction.
 
-            # Try as scalar function
-            try:
-                if params:
-                    query = f"SELECT {name}({param_placeholders}) AS result"
-                    cursor.execute(query, params)
-                else:
-                    query = f"SELECT {name}() AS result"
-                    cursor.execute(query)
+        Args:
+            sql_content: The script text (e.g. main_program_1.sql)
+            stop_on_error: Roll back the whole program at the first failing statement; otherwise the
+                failing statement is rolled back alone and the program continues
+            explain: Capture the EXPLAIN plan of every plannable statement before running it
 
-                result = cursor.fetchone()
-                notices = [notice.message.strip() for notice in raw_conn.notices if hasattr(notice, 'message')]
+        Returns:
+            Tuple[pd.DataFrame, Dict[int, pd.DataFrame], Dict[str, Any]]:
+            (one row per statement, result sets keyed by step, summary)
 
-                df = pd.DataFrame([dict(result)]) if result else pd.DataFrame()
-                return df, notices
+        Step columns: step, line, statement, status, start_ms, duration_ms, rowcount, notices, plan, error
+        """
+        statements = split_sql(sql_content)
+        steps = [{'step': i, 'line': stmt['line'], 'statement': stmt['sql'], 'status': 'not run',
+                  'start_ms': None, 'duration_ms': None, 'rowcount': None, 'notices': '', 'plan': '', 'error': None}
+                 for i, stmt in enumerate(statements, 1)]
+        results = {}
+        committed = False
 
-            except Exception as scalar_error:
-                logger.error(f"Both SETOF and scalar execution failed: {scalar_error}")
-                raise
+        raw_conn = self.engine.raw_connection()
+        raw_conn.set_isolation_level(ISOLATION_LEVEL_DEFAULT)
+        pooled_notices = raw_conn.dbapi_connection.notices
+        started = time.perf_counter()
+        try:
+            with raw_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                for stmt, step in zip(statements, steps):
+                    command = stmt['sql'].lstrip().split(None, 1)[0].upper().rstrip(';')
+                    if command in ('BEGIN', 'START', 'COMMIT', 'END', 'ROLLBACK', 'ABORT'):
+                        step['status'] = 'skipped'  # The runner owns the transaction
+                        continue
+                    if explain and command in PREPARABLE_COMMANDS + ('TABLE',):
+                        step['plan'] = self._explain_program_statement(cursor, stmt['sql'])
+                    if not stop_on_error:
+                        cursor.execute("SAVEPOINT program_step")
+                    notices = self._new_notice_buffer(f"program_step{step['step']}")
+                    raw_conn.dbapi_connection.notices = notices  # DO blocks may raise far more than 50 notices
+                    step['start_ms'] = (time.perf_counter() - started) * 1000
+                    try:
+                        if 'copy_data' in stmt:
+                            cursor.copy_expert(stmt['sql'], io.StringIO(stmt['copy_data']))
+                        else:
+                            cursor.execute(stmt['sql'])
+                        if cursor.description:
+                            results[step['step']] = self._rows_to_dataframe(cursor.fetchall())
+                        step['duration_ms'] = (time.perf_counter() - started) * 1000 - step['start_ms']
+                        step['rowcount'] = cursor.rowcount if cursor.rowcount >= 0 else None
+                        step['status'] = 'ok'
+                        if not stop_on_error:
+                            cursor.execute("RELEASE SAVEPOINT program_step")
+                    except psycopg2.Error as e:
+                        step['duration_ms'] = (time.perf_counter() - started) * 1000 - step['start_ms']
+                        step['status'] = 'error'
+                        step['error'] = str(e).strip()
+                        if stop_on_error:
+                            break
+                        cursor.execute("ROLLBACK TO SAVEPOINT program_step")  # Undo only this statement
+                    finally:
+                        step['notices'] = '\n'.join(self._collect_notices(notices))
+
+            if stop_on_error and any(step['status'] == 'error' for step in steps):
+                raw_conn.rollback()
+            else:
+                raw_conn.commit()
+                committed = True
+                self.invalidate_cache('data')
+        except Exception as e:
+            raw_conn.rollback()
+            logger.error(f"SQL program failed: {str(e)}")
+            raise
+        finally:
+            raw_conn.dbapi_connection.notices = pooled_notices
+            raw_conn.close()
+
+        elapsed = time.perf_counter() - started
+        if not committed:
+            for step in steps:
+                if step['status'] == 'ok':
+                    step['status'] = 'rolled back'
+        steps_df = pd.DataFrame(steps, columns=['step', 'line', 'statement', 'status', 'start_ms', 'duration_ms',
+                                                'rowcount', 'notices', 'plan', 'error'])
+        summary = {
+            'statements': len(steps),
+            'succeeded': sum(step['status'] == 'ok' for step in steps),
+            'failed': sum(step['status'] == 'error' for step in steps),
+            'committed': committed,
+            'elapsed_ms': elapsed * 1000
+        }
+        logger.info(f"SQL program: {summary['succeeded']}/{len(steps)} statements in {elapsed:.2f}s "
+                    f"({'committed' if committed else 'rolled back'})")
+        return steps_df, results, summary
+
+    @staticmethod
+    def _explain_program_statement(cursor, sql_text: str) -> str:
+        """Return the EXPLAIN plan of a statement, or an empty string if it cannot be planned"""
+        # Purpose: Plans without executing; runs under its own savepoint so a failing EXPLAIN
+        # does not abort the program transaction
+        cursor.execute("SAVEPOINT program_plan")
+        try:
+            cursor.execute("EXPLAIN " + sql_text)
+            plan = '\n'.join(row['QUERY PLAN'] for row in cursor.fetchall())
+            cursor.execute("RELEASE SAVEPOINT program_plan")
+            return plan
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT program_plan")
+            return ''
 
     def close(self):
         """Close the connection"""
-        # Purpose: Properly closes the SQLAlchemy session and engine to free resources
-        if self.session:
-            self.session.close()
+        # Purpose: Properly disposes the SQLAlchemy engines to free resources
+        self.stop_capture()
+        self._close_streaming_connections()
         if self.engine:
-            self.engine.dispose()
\ No newline at end of file
+            self.engine.dispose()
+        for replica in self.replica_engines:
+            replica.dispose()
\ No newline at end of file
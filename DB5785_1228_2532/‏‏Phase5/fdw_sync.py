@@ -0,0 +1,270 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import csv
+import io
+import logging
+import re
+import time
+import psycopg2
+from statement_cache import quote_ident
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Foreign tables imported by Phase3/Integrate.sql that the views and queries of Phase3/Views.sql join
+DEFAULT_TABLES = ('employee_remote', 'department_remote', 'position_remote', 'contract_remote',
+                  'attendance_log_remote')
+DEFAULT_SCHEMA = 'fdw_local'
+_CREATE_VIEW = re.compile(r'CREATE\s+(OR\s+REPLACE\s+)?VIEW\s+("[^"]+"|\w+)(?![\w".])', re.IGNORECASE)
+
+
+def _qualified(schema: str, table: str) -> str:
+    return f"{quote_ident(schema)}.{quote_ident(table)}"
+
+
+def table_definition(conn, table: str, schema: str = 'public') -> Tuple[List[Tuple[str, str]], List[str]]:
+    """Read the column definitions and primary key columns of a table"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+                       SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+                       FROM pg_attribute a
+                       WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+                       ORDER BY a.attnum
+                       """, [_qualified(schema, table)])
+        columns = cursor.fetchall()
+        cursor.execute("""
+                       SELECT a.attname
+                       FROM pg_index i
+                       JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY (i.indkey)
+                       WHERE i.indrelid = %s::regclass AND i.indisprimary
+                       ORDER BY array_position(i.indkey, a.attnum)
+                       """, [_qualified(schema, table)])
+        primary_key = [row[0] for row in cursor.fetchall()]
+    if not columns:
+        raise ValueError(f"Table {schema}.{table} has no columns")
+    return columns, primary_key
+
+
+def ensure_local_table(conn, schema: str, table: str, columns: List[Tuple[str, str]],
+                       primary_key: List[str]) -> None:
+    """Create the local copy with the source's column types, or check that an existing copy matches"""
+    # Purpose: The row hashes of both sides only agree when column order and types are identical
+    with conn.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_ident(schema)}")
+        cursor.execute("SELECT to_regclass(%s)", [_qualified(schema, table)])
+        if cursor.fetchone()[0] is None:
+            definitions = [f"{quote_ident(name)} {data_type}" for name, data_type in columns]
+            definitions.append(f"PRIMARY KEY ({', '.join(quote_ident(c) for c in primary_key)})")
+            cursor.execute(f"CREATE TABLE {_qualified(schema, table)} ({', '.join(definitions)})")
+            logger.info(f"Created local copy {schema}.{table}")
+            return
+    local_columns, _ = table_definition(conn, table, schema)
+    if list(local_columns) != list(columns):
+        raise ValueError(f"Local copy {schema}.{table} no longer matches the source; drop it to rebuild")
+
+
+def _copy_out(conn, query: str) -> Iterator[List[str]]:
+    """Run COPY (query) TO STDOUT in CSV format and yield the parsed rows"""
+    buffer = io.StringIO()
+    with conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+    yield from csv.reader(buffer)
+
+
+def fetch_hashes(conn, qualified_table: str, primary_key: List[str]) -> Dict[Tuple[str, ...], str]:
+    """Primary key -> md5 of the row's text form, for every row of a table"""
+    keys = ', '.join(quote_ident(c) for c in primary_key)
+    query = f"SELECT {keys}, md5(t::text) FROM {qualified_table} t"
+    return {tuple(row[:-1]): row[-1] for row in _copy_out(conn, query)}
+
+
+def _key_filter(primary_key: List[str], key_types: List[str]) -> str:
+    """WHERE clause matching a list of keys passed as one array parameter per key column"""
+    columns = ', '.join(quote_ident(c) for c in primary_key)
+    arrays = ', '.join(f"%s::{data_type}[]" for data_type in key_types)
+    return f"({columns}) IN (SELECT * FROM unnest({arrays}))"
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sync_table(source, local, table: str, schema: str = DEFAULT_SCHEMA, source_schema: str = 'public',
+               batch_size: int = 5000, commit: bool = True) -> Dict[str, Any]:
+    """
+    Bring the local copy of one table up to date with the source.
+
+    Args:
+        source: psycopg2 connection to the source database (the database behind the foreign server); the
+            caller owns its transaction, so several tables can be read from one snapshot
+        local: psycopg2 connection to the local database
+        table: Table name (the same on both sides)
+        schema: Local schema of the copies
+        source_schema: Schema of the table in the source database
+        batch_size: Keys per COPY batch
+        commit: Commit the local changes; False leaves them in the caller's transaction
+
+    Returns:
+        Dict[str, Any]: Row counts (source, inserted, updated, deleted, unchanged) and elapsed time
+
+    Diff:
+    - Only primary keys and md5 row hashes are read from both sides to find the changes
+    - New and changed rows are copied from the source in batches with COPY ... TO STDOUT and loaded
+      with COPY ... FROM STDIN into a staging table, then swapped in with DELETE + INSERT
+    - All changes to a table are applied in one local transaction, so views never see a half-synced table
+    """
+    started = time.perf_counter()
+    try:
+        columns, primary_key = table_definition(source, table, source_schema)
+        if not primary_key:
+            raise ValueError(f"Table {source_schema}.{table} has no primary key to diff by")
+        ensure_local_table(local, schema, table, columns, primary_key)
+        target = _qualified(schema, table)
+        types = dict(columns)
+        key_filter = _key_filter(primary_key, [types[c] for c in primary_key])
+        column_list = ', '.join(quote_ident(name) for name, _ in columns)
+
+        # The source transaction is REPEATABLE READ, so hashes and copied rows come from one snapshot
+        source_hashes = fetch_hashes(source, _qualified(source_schema, table), primary_key)
+        local_hashes = fetch_hashes(local, target, primary_key)
+        new = [key for key in source_hashes if key not in local_hashes]
+        changed = [key for key, digest in source_hashes.items()
+                   if key in local_hashes and local_hashes[key] != digest]
+        deleted = [key for key in local_hashes if key not in source_hashes]
+
+        with local.cursor() as cursor:
+            for batch in _chunks(deleted, batch_size):
+                cursor.execute(f"DELETE FROM {target} WHERE {key_filter}", [list(k) for k in zip(*batch)])
+            if new or changed:
+                cursor.execute(f"CREATE TEMP TABLE sync_staging (LIKE {target}) ON COMMIT DROP")
+                for batch in _chunks(new + changed, batch_size):
+                    rows = io.StringIO()
+                    with source.cursor() as source_cursor:
+                        query = source_cursor.mogrify(
+                            f"COPY (SELECT {column_list} FROM {_qualified(source_schema, table)} "
+                            f"WHERE {key_filter}) TO STDOUT", [list(k) for k in zip(*batch)]).decode()
+                        source_cursor.copy_expert(query, rows)
+                    rows.seek(0)
+                    cursor.copy_expert(f"COPY sync_staging ({column_list}) FROM STDIN", rows)
+                matches = ' AND '.join(f"t.{quote_ident(c)} = s.{quote_ident(c)}" for c in primary_key)
+                cursor.execute(f"DELETE FROM {target} t USING sync_staging s WHERE {matches}")
+                cursor.execute(f"INSERT INTO {target} ({column_list}) SELECT {column_list} FROM sync_staging")
+                cursor.execute("DROP TABLE sync_staging")  # The next table may share this transaction
+            stats = {'table': table, 'source_rows': len(source_hashes), 'inserted': len(new),
+                     'updated': len(changed), 'deleted': len(deleted),
+                     'unchanged': len(source_hashes) - len(new) - len(changed),
+                     'elapsed_ms': (time.perf_counter() - started) * 1000}
+            _record_sync(cursor, schema, stats)
+            if new or changed or deleted:  # Keep planner statistics current for the view joins
+                cursor.execute(f"ANALYZE {target}")
+        if commit:
+            local.commit()
+    except Exception:
+        local.rollback()
+        raise
+    logger.info(f"Synced {table}: {stats['inserted']} inserted, {stats['updated']} updated, "
+                f"{stats['deleted']} deleted, {stats['unchanged']} unchanged in {stats['elapsed_ms']:.0f} ms")
+    return stats
+
+
+def _record_sync(cursor, schema: str, stats: Dict[str, Any]) -> None:
+    """Append a run to the sync log table in the local schema"""
+    log_table = _qualified(schema, 'sync_log')
+    cursor.execute(f"""
+                   CREATE TABLE IF NOT EXISTS {log_table} (
+                       synced_at   timestamptz NOT NULL DEFAULT now(),
+                       table_name  text NOT NULL,
+                       source_rows integer NOT NULL,
+                       inserted    integer NOT NULL,
+                       updated     integer NOT NULL,
+                       deleted     integer NOT NULL,
+                       elapsed_ms  double precision NOT NULL
+                   )""")
+    cursor.execute(f"INSERT INTO {log_table} (table_name, source_rows, inserted, updated, deleted, elapsed_ms) "
+                   f"VALUES (%s, %s, %s, %s, %s, %s)",
+                   [stats['table'], stats['source_rows'], stats['inserted'], stats['updated'],
+                    stats['deleted'], stats['elapsed_ms']])
+
+
+def rebind_views(local, views_file: str, tables: Sequence[str], schema: str = DEFAULT_SCHEMA,
+                 view_schema: str = 'public') -> List[str]:
+    """
+    Re-create the CREATE VIEW statements of a SQL file so they read the local copies.
+
+    Unqualified table names (Employee_remote) resolve through search_path = <schema>, public, and
+    references qualified with public. to a synced table are pointed at the local schema. Tables that
+    are not synced still resolve to the foreign tables. The views themselves stay in view_schema.
+    """
+    from sql_parser import parse_sql_file
+
+    qualified = re.compile(r'\bpublic\.(' + '|'.join(re.escape(t) for t in tables) + r')\b', re.IGNORECASE)
+    created = []
+    try:
+        with local.cursor() as cursor:
+            cursor.execute(f"SET LOCAL search_path = {quote_ident(schema)}, public")
+            for statement in parse_sql_file(views_file):
+                sql_text = statement['sql']
+                match = _CREATE_VIEW.search(sql_text)
+                if not match:
+                    continue
+                sql_text = (sql_text[:match.start(2)] + f"{quote_ident(view_schema)}." +
+                            qualified.sub(lambda m: f"{quote_ident(schema)}.{m.group(1)}", sql_text[match.start(2):]))
+                cursor.execute(sql_text)
+                created.append(match.group(2))
+        local.commit()
+    except Exception:
+        local.rollback()
+        raise
+    logger.info(f"Re-created views on local copies: {', '.join(created)}")
+    return created
+
+
+def sync_tables(source_dsn: str, local_dsn: str, tables: Sequence[str] = DEFAULT_TABLES,
+                schema: str = DEFAULT_SCHEMA, source_schema: str = 'public', batch_size: int = 5000,
+                views_file: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Sync several tables from the source database into local copies"""
+    # Purpose: All tables are read in one REPEATABLE READ transaction and written in one local
+    # transaction, so the copies of related tables (employee, contract) match each other's keys
+    source = psycopg2.connect(source_dsn)
+    local = psycopg2.connect(local_dsn)
+    try:
+        source.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        results = [sync_table(source, local, table, schema, source_schema, batch_size, commit=False)
+                   for table in tables]
+        local.commit()
+        if views_file:
+            rebind_views(local, views_file, tables, schema)
+        return results
+    finally:
+        source.rollback()  # End the read-only snapshot
+        source.close()
+        local.close()
+
+
+def main():
+    """Incremental sync of foreign tables into local copies"""
+    parser = argparse.ArgumentParser(description="Keep local copies of the integrated HR tables current")
+    parser.add_argument("--source-dsn", required=True,
+                        help="Connection string of the source database (the one behind otherdatabase_server)")
+    parser.add_argument("--local-dsn", required=True, help="Connection string of the local database")
+    parser.add_argument("--tables", default=','.join(DEFAULT_TABLES), help="Comma-separated tables to sync")
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA, help="Local schema of the copies")
+    parser.add_argument("--source-schema", default='public', help="Schema of the tables in the source database")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Keys per COPY batch")
+    parser.add_argument("--views", help="SQL file whose CREATE VIEW statements are re-created on the local copies "
+                                        "(e.g. Phase3/Views.sql)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    tables = [t.strip() for t in args.tables.split(',') if t.strip()]
+    results = sync_tables(args.source_dsn, args.local_dsn, tables, args.schema, args.source_schema,
+                          args.batch_size, args.views)
+    for stats in results:
+        print(f"{stats['table']:<24} {stats['source_rows']:>8,} rows  +{stats['inserted']:,} "
+              f"~{stats['updated']:,} -{stats['deleted']:,}  {stats['elapsed_ms']:,.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
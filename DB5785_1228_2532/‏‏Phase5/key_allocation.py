@@ -0,0 +1,222 @@
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from psycopg2 import errors
+from psycopg2.extras import execute_values
+from statement_cache import quote_ident
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Surrogate key of every table whose rows are numbered by the application
+SURROGATE_KEYS = {
+    'student': 'studentid',
+    'dorm_management': 'managerid',
+    'building': 'buildingid',
+    'room': 'roomid',
+    'lease': 'leaseid',
+    'maintenance_request': 'requestid',
+    'change_log': 'log_id',
+}
+STRESS_TABLE = 'key_allocation_stress'
+
+
+def key_sequence(conn, table: str, column: str) -> Optional[str]:
+    """Sequence behind a serial or identity column, or None"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [quote_ident(table), column])
+        return cursor.fetchone()[0]
+
+
+def sync_key_sequence(conn, table: str, column: str) -> Optional[int]:
+    """Move a key's sequence past the largest existing key; returns the next value, or None without a sequence"""
+    # Rows inserted with explicit ids (the Phase1 scripts, imports, restores) never advance the sequence;
+    # without this nextval would hand out keys that already exist. The sequence is never moved back.
+    sequence = key_sequence(conn, table, column)
+    if sequence is None:
+        return None
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT setval(%s, GREATEST(COALESCE(MAX({quote_ident(column)}), 0), "
+                       f"(SELECT last_value FROM {sequence}), 1), true) FROM {quote_ident(table)}",
+                       [sequence])
+        return cursor.fetchone()[0] + 1
+
+
+def sync_key_sequences(conn, keys: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """Move the sequence of every existing surrogate key past its largest key (no schema changes)"""
+    next_values = {}
+    with conn.cursor() as cursor:
+        for table, column in (keys or SURROGATE_KEYS).items():
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [quote_ident(table)])
+            if cursor.fetchone()[0]:
+                next_value = sync_key_sequence(conn, table, column)
+                if next_value is not None:
+                    next_values[table] = next_value
+    return next_values
+
+
+def ensure_key_defaults(conn, keys: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Give every surrogate key a sequence default and move each sequence past the largest existing key.
+
+    Columns without one become GENERATED BY DEFAULT AS IDENTITY, so explicit ids (imports, restores) are still
+    accepted; serial columns keep their sequence. Safe to run again.
+    """
+    results = []
+    with conn.cursor() as cursor:
+        for table, column in (keys or SURROGATE_KEYS).items():
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [quote_ident(table)])
+            if not cursor.fetchone()[0]:
+                logger.info(f"Table {table} does not exist; skipped")
+                continue
+            sequence, action = key_sequence(conn, table, column), 'existing'
+            if sequence is None:
+                cursor.execute(f"ALTER TABLE {quote_ident(table)} ALTER COLUMN {quote_ident(column)} "
+                               f"ADD GENERATED BY DEFAULT AS IDENTITY")
+                sequence, action = key_sequence(conn, table, column), 'identity added'
+            results.append({'table': table, 'column': column, 'sequence': sequence, 'action': action,
+                            'next_value': sync_key_sequence(conn, table, column)})
+    conn.commit()
+    logger.info(f"Key defaults checked for {len(results)} tables")
+    return results
+
+
+def allocate_ids(conn, sequence: str, count: int) -> List[int]:
+    """Reserve count values of a sequence in one round trip"""
+    # nextval is not transactional: the values stay reserved even if the caller's insert rolls back
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [sequence, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class KeyAllocator:
+    """Reserves surrogate keys with one nextval round trip per bulk insert"""
+    def __init__(self, engine):
+        self.engine = engine
+        self._sequences: Dict[Tuple[str, str], Optional[str]] = {}
+
+    def sequence(self, table: str, column: str) -> Optional[str]:
+        """Sequence of a key column (cached; None when the column has no sequence default)"""
+        key = (table, column)
+        if key not in self._sequences:
+            conn = self.engine.raw_connection()
+            try:
+                self._sequences[key] = key_sequence(conn, table, column)
+            finally:
+                conn.close()
+        return self._sequences[key]
+
+    def allocate(self, table: str, column: str, count: int) -> List[int]:
+        """Reserve count keys for a bulk insert"""
+        sequence = self.sequence(table, column)
+        if sequence is None:
+            raise ValueError(f"{table}.{column} has no sequence; run key_allocation.py --apply first")
+        conn = self.engine.raw_connection()
+        try:
+            ids = allocate_ids(conn, sequence, count)
+            conn.commit()
+        finally:
+            conn.close()
+        return ids
+
+    def reset(self) -> None:
+        """Forget cached sequences (after schema changes)"""
+        self._sequences.clear()
+
+
+def _stress_session(dsn: str, mode: str, session: int, rows: int, block: int) -> Tuple[int, int]:
+    """Insert rows from one session; returns (inserted, duplicate-key failures)"""
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    table, inserted, failures = quote_ident(STRESS_TABLE), 0, 0
+    try:
+        with conn.cursor() as cursor:
+            if mode == 'max':  # The old pattern: read the largest key, then insert the next one
+                for _ in range(rows):
+                    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+                    try:
+                        cursor.execute(f"INSERT INTO {table} (id, session) VALUES (%s, %s)",
+                                       [cursor.fetchone()[0], session])
+                        inserted += 1
+                    except errors.UniqueViolation:
+                        failures += 1
+            elif mode == 'default':
+                for _ in range(rows):
+                    cursor.execute(f"INSERT INTO {table} (session) VALUES (%s)", [session])
+                    inserted += 1
+            else:  # 'block': reserve keys in blocks, then insert each block in one statement
+                sequence = key_sequence(conn, STRESS_TABLE, 'id')
+                for start in range(0, rows, block):
+                    ids = allocate_ids(conn, sequence, min(block, rows - start))
+                    execute_values(cursor, f"INSERT INTO {table} (id, session) VALUES %s",
+                                   [(i, session) for i in ids])
+                    inserted += len(ids)
+    finally:
+        conn.close()
+    return inserted, failures
+
+
+def stress_test(dsn: str, mode: str, sessions: int = 16, rows: int = 200, block: int = 100) -> Dict[str, Any]:
+    """Insert from many sessions at once into a scratch table and count duplicate-key failures"""
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {quote_ident(STRESS_TABLE)}")
+            identity = "" if mode == 'max' else " GENERATED BY DEFAULT AS IDENTITY"
+            cursor.execute(f"CREATE TABLE {quote_ident(STRESS_TABLE)} (id int{identity} PRIMARY KEY, session int)")
+        conn.commit()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            results = list(pool.map(lambda s: _stress_session(dsn, mode, s, rows, block), range(sessions)))
+        elapsed = time.perf_counter() - started
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT count(*), count(DISTINCT id) FROM {quote_ident(STRESS_TABLE)}")
+            stored, distinct = cursor.fetchone()
+            cursor.execute(f"DROP TABLE {quote_ident(STRESS_TABLE)}")
+        conn.commit()
+    finally:
+        conn.close()
+    inserted = sum(r[0] for r in results)
+    return {'mode': mode, 'sessions': sessions, 'attempted': sessions * rows, 'inserted': inserted,
+            'duplicate_key_failures': sum(r[1] for r in results), 'stored': stored, 'distinct_ids': distinct,
+            'elapsed_ms': round(elapsed * 1000, 1), 'rows_per_second': round(inserted / elapsed, 1)}
+
+
+def main():
+    """Put sequence defaults on the surrogate keys and check concurrent inserts"""
+    parser = argparse.ArgumentParser(description="Sequence-backed key allocation for the dorm tables")
+    parser.add_argument("--dsn", required=True, help="Connection string of the database")
+    parser.add_argument("--apply", action="store_true",
+                        help="Add identity defaults where missing and move sequences past existing keys")
+    parser.add_argument("--stress", action="store_true",
+                        help="Compare MAX()+1, sequence defaults and block allocation under concurrent inserts")
+    parser.add_argument("--sessions", type=int, default=16, help="Concurrent sessions for --stress")
+    parser.add_argument("--rows", type=int, default=200, help="Rows per session for --stress")
+    parser.add_argument("--block", type=int, default=100, help="Keys reserved per nextval round trip")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.apply:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            for row in ensure_key_defaults(conn):
+                print(f"{row['table']:<22} {row['column']:<12} {row['action']:<16} next {row['next_value']}")
+        finally:
+            conn.close()
+    if args.stress:
+        failed = False
+        for mode in ('max', 'default', 'block'):
+            result = stress_test(args.dsn, mode, args.sessions, args.rows, args.block)
+            print(f"{mode:<8} {result['inserted']:>7,}/{result['attempted']:,} inserted  "
+                  f"{result['duplicate_key_failures']:>6,} duplicate-key failures  "
+                  f"{result['rows_per_second']:>10,.0f} rows/s")
+            failed |= mode != 'max' and (result['duplicate_key_failures'] or result['inserted'] != result['attempted'])
+        if failed:
+            raise SystemExit("Sequence-backed inserts failed under concurrency")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+import numpy as np
+import pandas as pd
+import psutil
+import psycopg2
+import streamlit
+from streamlit import config as st_config
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+FLOWS = ('view', 'edit', 'routines')
+# Streamlit release whose AppTest and Runtime internals _share_process_state patches (major.minor)
+SUPPORTED_STREAMLIT = '1.66'
+
+
+def _check_streamlit_version() -> None:
+    """Refuse to patch a Streamlit release other than SUPPORTED_STREAMLIT"""
+    # Purpose: Runtime._instance, Runtime.instance/exists and app_test.ScriptCache are private; in another
+    # release they may be gone or mean something else, and a patch that silently misses would measure
+    # sessions that tear each other's runtime down instead of the app
+    installed = '.'.join(streamlit.__version__.split('.')[:2])
+    if installed != SUPPORTED_STREAMLIT:
+        raise RuntimeError(f"load_test.py supports Streamlit {SUPPORTED_STREAMLIT}.x, found {streamlit.__version__}; "
+                           f"install streamlit=={SUPPORTED_STREAMLIT}.* or update _share_process_state")
+
+
+def _share_process_state() -> None:
+    """Share one Runtime, script cache and app-test config between all sessions, as in a served process"""
+    # Purpose: AppTest installs a mock Runtime and patches global.appTest on for each run, undoing both when the
+    # run ends; with sessions rerunning concurrently that pulls them from under the others, so pin the option
+    # and fall back to the last Runtime installed. It also compiles app.py afresh on every run, which a server
+    # does once (and which concurrent threads can trip over in ast.parse), so every run gets one shared cache.
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.testing.v1 import app_test, local_script_runner
+    if getattr(Runtime, '_load_test_shared', False):
+        return
+    _check_streamlit_version()
+    st_config.set_option("global.appTest", True)
+    script_cache = app_test.ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    latest = []
+
+    def current(cls):
+        if cls._instance is not None:
+            latest[:] = [cls._instance]
+        return latest[0] if latest else None
+
+    def instance(cls):
+        if current(cls) is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return latest[0]
+
+    def exists(cls):
+        return current(cls) is not None
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+    Runtime._load_test_shared = True
+
+
+class SimulatedUser:
+    """One browser session: its own AppTest script run and its own DatabaseManager, as after login"""
+    # Purpose: Streamlit runs every session's script in a thread of the same process, so N users each
+    # rerunning their AppTest in a thread load one app process the way N browsers would.
+    def __init__(self, dsn: str, number: int, rng: random.Random, pool_size: int = 5, timeout_s: float = 120):
+        from database_manager import DatabaseManager
+        _share_process_state()
+        self.number = number
+        self.rng = rng
+        self.db_manager = DatabaseManager()
+        if not self.db_manager.connect(dsn, pool_size=pool_size):
+            raise RuntimeError(f"User {number} could not connect")
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout_s)
+        self.app.session_state.authenticated = True
+        self.app.session_state.db_manager = self.db_manager
+        self.app.session_state.connection_string = dsn
+        self.app.session_state.current_page = "home"
+        self._row_counts = {}
+
+    def rerun(self, step: str, action: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+        """Run one rerun (a widget interaction, or a plain rerun) and time it"""
+        started = time.perf_counter()
+        error = None
+        try:
+            (action or self.app.run)()
+            if self.app.exception:
+                error = self.app.exception[0].value
+        except Exception as e:  # Timeouts and harness errors count like app errors
+            error = f"{type(e).__name__}: {str(e)}"
+        return {'user': self.number, 'step': step, 'latency_ms': (time.perf_counter() - started) * 1000,
+                'error': error}
+
+    def _open(self, page: str, table: Optional[str] = None, operation: str = "View") -> None:
+        self.app.session_state.current_page = page
+        if table is not None:
+            self.app.session_state.selected_table = table
+            self.app.session_state.table_operation = operation
+
+    def view(self, tables: List[str], **_) -> List[Dict[str, Any]]:
+        """Home page, View operation on a table (view_table_data)"""
+        self._open("home", self.rng.choice(tables), "View")
+        return [self.rerun('view_table_data')]
+
+    def edit(self, edit_tables: List[str], writes: bool = True, **_) -> List[Dict[str, Any]]:
+        """Home page, Edit operation: open the table, select a row, submit the form unchanged (edit_record)"""
+        table = self.rng.choice(edit_tables)
+        editor_key = f"edit_select_{table}"
+        self._open("home", table, "Edit")
+        self.app.session_state[editor_key] = {'edited_rows': {}, 'added_rows': [], 'deleted_rows': []}
+        samples = [self.rerun('edit_record:open')]
+        if table not in self._row_counts:
+            self._row_counts[table] = min(self.db_manager.get_table_row_count(table), 1000)
+        if not self._row_counts[table]:
+            return samples
+        row = self.rng.randrange(self._row_counts[table])
+        self.app.session_state[editor_key] = {'edited_rows': {row: {'Select': True}}, 'added_rows': [],
+                                              'deleted_rows': []}
+        samples.append(self.rerun('edit_record:select'))
+        submit = [button for button in self.app.button if 'Update Record' in button.label]
+        if writes and submit:
+            samples.append(self.rerun('edit_record:submit', lambda: submit[0].click().run()))
+        return samples
+
+    def routines(self, routines: List[str], **_) -> List[Dict[str, Any]]:
+        """Routines page: render every routine, then run one (run_routines)"""
+        self._open("routines")
+        samples = [self.rerun('run_routines:open')]
+        name = self.rng.choice(routines)
+        buttons = [button for button in self.app.button if button.key and button.key.startswith(f"run_{name}")]
+        if buttons:
+            samples.append(self.rerun('run_routines:run', lambda: buttons[0].click().run()))
+        else:
+            samples.append({'user': self.number, 'step': 'run_routines:run', 'latency_ms': 0.0,
+                            'error': f"No run button for routine {name}"})
+        return samples
+
+    def pool_in_use(self) -> int:
+        """Connections this session has checked out of its pool right now"""
+        try:
+            return self.db_manager.engine.pool.checkedout()
+        except Exception:
+            return 0
+
+    def close(self) -> None:
+        self.db_manager.close()
+
+
+class _ConnectionSampler(threading.Thread):
+    """Samples server connections to the database and pooled connections in use while a level runs"""
+    def __init__(self, dsn: str, users: List[SimulatedUser], interval_s: float = 0.5):
+        super().__init__(daemon=True)
+        from backup_manager import libpq_dsn
+        from sqlalchemy.engine import make_url
+        self._conn = psycopg2.connect(libpq_dsn(make_url(dsn)))
+        self._conn.autocommit = True
+        self.users = users
+        self.interval_s = interval_s
+        self.samples = []
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        try:
+            with self._conn.cursor() as cursor:
+                while not self._done.is_set():
+                    cursor.execute("""
+                        SELECT count(*), count(*) FILTER (WHERE state = 'active')
+                        FROM pg_stat_activity
+                        WHERE datname = current_database() AND pid <> pg_backend_pid()""")
+                    server, active = cursor.fetchone()
+                    self.samples.append({'server': server, 'active': active,
+                                         'pooled_in_use': sum(user.pool_in_use() for user in self.users)})
+                    self._done.wait(self.interval_s)
+        finally:
+            self._conn.close()
+
+    def stop(self) -> Dict[str, float]:
+        self._done.set()
+        self.join()
+        frame = pd.DataFrame(self.samples or [{'server': 0, 'active': 0, 'pooled_in_use': 0}])
+        return {'peak_connections': int(frame['server'].max()), 'mean_connections': float(frame['server'].mean()),
+                'peak_active': int(frame['active'].max()), 'peak_pooled_in_use': int(frame['pooled_in_use'].max())}
+
+
+def _rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+
+def _user_loop(user: SimulatedUser, mix: Dict[str, float], options: Dict[str, Any], think_s: float,
+               deadline: float, samples: List[Dict[str, Any]], lock: threading.Lock) -> None:
+    """Pick flows by the mix and pause for an exponentially distributed think time between them"""
+    flows, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        flow = user.rng.choices(flows, weights)[0]
+        results = getattr(user, flow)(**options)
+        with lock:
+            samples.extend(dict(result, flow=flow) for result in results)
+        if think_s > 0:
+            time.sleep(min(user.rng.expovariate(1 / think_s), think_s * 5, max(0.0, deadline - time.perf_counter())))
+
+
+def run_level(dsn: str, users: int, duration_s: float, mix: Dict[str, float], options: Dict[str, Any],
+              think_s: float = 2.0, pool_size: int = 5, seed: int = 7) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Run one concurrency level: start N sessions, let them work for duration_s, then close them.
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, Any]]: (every rerun with user, flow, step, latency_ms and error; summary
+        with rerun rate, latency percentiles, connections and memory per session)
+    """
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    sessions = [SimulatedUser(dsn, number, random.Random(seed * 1000 + number), pool_size)
+                for number in range(users)]
+    for session in sessions:  # First render, as after login
+        session.rerun('home')
+    rss_sessions = _rss_mb()
+    setup_s = time.perf_counter() - started
+
+    samples, lock = [], threading.Lock()
+    sampler = _ConnectionSampler(dsn, sessions)
+    sampler.start()
+    deadline = time.perf_counter() + duration_s
+    threads = [threading.Thread(target=_user_loop, args=(session, mix, options, think_s, deadline, samples, lock),
+                                daemon=True) for session in sessions]
+    # Stagger the starts over one think time, as users do not all click at once
+    for thread in threads:
+        thread.start()
+        time.sleep(think_s / max(1, users) if think_s > 0 else 0)
+    for thread in threads:
+        thread.join()
+    elapsed_s = time.perf_counter() - (deadline - duration_s)
+    connections = sampler.stop()
+    rss_peak = _rss_mb()
+    for session in sessions:
+        session.close()
+
+    frame = pd.DataFrame(samples, columns=['user', 'flow', 'step', 'latency_ms', 'error'])
+    ok = frame.loc[frame['error'].isna(), 'latency_ms'].to_numpy()
+    p50, p95, p99 = np.percentile(ok, [50, 95, 99]) if len(ok) else (np.nan, np.nan, np.nan)
+    summary = dict({
+        'users': users, 'reruns': len(frame), 'errors': int(frame['error'].notna().sum()),
+        'reruns_per_s': len(frame) / elapsed_s if elapsed_s > 0 else 0.0,
+        'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'setup_s': setup_s,
+        'mb_per_session': (rss_sessions - rss_before) / users, 'rss_peak_mb': rss_peak,
+    }, **connections)
+    logger.info(f"{users} users: {summary['reruns']} reruns ({summary['reruns_per_s']:.1f}/s), "
+                f"p95 {p95:.0f} ms, {summary['errors']} errors, {summary['peak_connections']} connections")
+    return frame, summary
+
+
+def step_report(frame: pd.DataFrame) -> pd.DataFrame:
+    """Rerun latency distribution per step (milliseconds)"""
+    rows = []
+    for (users, step), group in frame.groupby(['users', 'step'], sort=False):
+        ok = group.loc[group['error'].isna(), 'latency_ms'].to_numpy()
+        row = {'users': users, 'step': step, 'reruns': len(group), 'errors': int(group['error'].notna().sum())}
+        if len(ok):
+            row.update(dict(zip(('p50_ms', 'p95_ms', 'max_ms'), (*np.percentile(ok, [50, 95]), ok.max()))))
+        if row['errors']:
+            row['first_error'] = str(group['error'].dropna().iloc[0])[:120]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def find_limit(dsn: str, levels: List[int], duration_s: float, mix: Dict[str, float], options: Dict[str, Any],
+               think_s: float = 2.0, slo_p95_ms: float = 2000.0, max_error_rate: float = 0.01,
+               pool_size: int = 5) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[int]]:
+    """
+    Run increasing concurrency levels until one misses the latency objective or errors too often.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, Optional[int]]: (summary per level, latency per level and step,
+        highest level within the objective, or None when even the first level misses it)
+    """
+    warm_up = SimulatedUser(dsn, -1, random.Random(0), pool_size)  # Load the app's imports and caches once,
+    warm_up.rerun('home')                                           # so they do not count as the first level's
+    warm_up.close()                                                 # memory per session
+    summaries, frames, limit = [], [], None
+    for users in levels:
+        frame, summary = run_level(dsn, users, duration_s, mix, options, think_s, pool_size)
+        summary['within_slo'] = bool(summary['p95_ms'] <= slo_p95_ms
+                                     and summary['errors'] <= max_error_rate * max(1, summary['reruns']))
+        summaries.append(summary)
+        frames.append(frame.assign(users=users))
+        if not summary['within_slo']:
+            break
+        limit = users
+    return pd.DataFrame(summaries), step_report(pd.concat(frames, ignore_index=True)), limit
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in FLOWS:
+            raise argparse.ArgumentTypeError(f"Unknown flow {name.strip()} (choose from {', '.join(FLOWS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    """Headless multi-user load test of the Streamlit pages"""
+    parser = argparse.ArgumentParser(description="Simulate concurrent app users and find one process's limit")
+    parser.add_argument("--dsn", required=True, help="Connection string of the database the app uses")
+    parser.add_argument("--users", default="1,2,4,8,16", help="Comma-separated concurrency levels, run in order")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds each level runs")
+    parser.add_argument("--think", type=float, default=2.0, help="Mean think time between flows (seconds)")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("view=5,edit=2,routines=3"),
+                        help="Flow weights, e.g. view=5,edit=2,routines=3")
+    parser.add_argument("--tables", default="student,room,lease,rental,building",
+                        help="Tables opened by the view flow")
+    parser.add_argument("--edit-tables", default="dorm_management", help="Tables opened by the edit flow")
+    parser.add_argument("--routines", default="count_maintenance_by_priority",
+                        help="Routines run by the routines flow (comma-separated names)")
+    parser.add_argument("--no-writes", action="store_true", help="Open and select in the edit flow, never submit")
+    parser.add_argument("--slo", type=float, default=2000, help="p95 rerun latency objective (ms)")
+    parser.add_argument("--pool-size", type=int, default=5, help="Connection pool size of each session")
+    parser.add_argument("--output", help="Write the per-step latency report to this CSV file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Streamlit applies logger.level when it first parses its config; parse it now, then quiet it: user threads
+    # have no ScriptRunContext, which it warns about on every cache lookup, as it does about deprecations
+    st_config.get_option("logger.level")
+    set_log_level("error")
+    for noisy in ('database_manager', 'sql_parser'):
+        logging.getLogger(noisy).setLevel(logging.ERROR)
+    options = {'tables': [t.strip() for t in args.tables.split(',') if t.strip()],
+               'edit_tables': [t.strip() for t in args.edit_tables.split(',') if t.strip()],
+               'routines': [r.strip() for r in args.routines.split(',') if r.strip()],
+               'writes': not args.no_writes}
+    levels = [int(level) for level in args.users.split(',') if level.strip()]
+    summary, steps, limit = find_limit(args.dsn, levels, args.duration, args.mix, options, args.think, args.slo,
+                                       pool_size=args.pool_size)
+    with pd.option_context('display.width', 220, 'display.max_columns', None):
+        print(summary[['users', 'reruns', 'errors', 'reruns_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_connections',
+                       'peak_active', 'peak_pooled_in_use', 'mb_per_session', 'rss_peak_mb', 'within_slo']]
+              .round(1).to_string(index=False))
+        print()
+        print(steps.round(1).to_string(index=False))
+    if limit is None:
+        print(f"\nEven {levels[0]} users miss the p95 objective of {args.slo:.0f} ms")
+    else:
+        print(f"\nHighest level within p95 {args.slo:.0f} ms: {limit} users"
+              + ("" if limit < levels[-1] else " (every level passed; try more users)"))
+    if args.output:
+        steps.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import streamlit as st
+from utils import authenticate_user
+
+# Purpose: The login page lives in its own module so the first render does not import pandas,
+# SQLAlchemy, psycopg2 or the other pages; DatabaseManager is only imported when Login is clicked
+
+def login_page():
+    """Login page"""
+    st.markdown('<div class="ltr">', unsafe_allow_html=True)
+    st.markdown('<h1 class="main-header">🗄️ Database Management System</h1>', unsafe_allow_html=True)
+    with st.container():
+        st.markdown("### 🔐 System Login")
+        col1, col2 = st.columns(2)
+        with col1:
+            host = st.text_input("🖥️ Server Address", value="localhost", key="host")
+            database = st.text_input("🗄️ Database Name", value="mydatabase", key="database")
+        with col2:
+            port = st.text_input("🔌 Port", value="5432", key="port")
+            username = st.text_input("👤 Username", key="username")
+        password = st.text_input("🔑 Password", type="password", key="password")
+        replicas = st.text_input("🪞 Read Replicas (optional, host:port separated by commas)", key="replicas")
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            if st.button("🚪 Login", use_container_width=True):
+                if username and password:
+                    with st.spinner("Connecting..."):
+                        if authenticate_user(username, password, host, port, database, replicas):
+                            st.success("✅ Login successful")
+                            st.session_state.current_page = "home"
+                            st.rerun()
+                        else:
+                            st.error("❌ Login failed. Please check your credentials.")
+                else:
+                    st.warning("⚠️ Please enter username and password.")
+    st.markdown('</div>', unsafe_allow_html=True)
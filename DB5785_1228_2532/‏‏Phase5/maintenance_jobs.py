@@ -0,0 +1,257 @@
+from typing import Any, Dict, List, Optional
+import argparse
+import logging
+import time
+from datetime import date
+import psycopg2
+from result_cache import invalidate_shared
+from statement_cache import quote_ident
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LEDGER_SCHEMA = 'maintenance'
+# Rows already changed by an incrementing job in a run; re-running the same run skips them
+_LEDGER_DDL = f"""
+CREATE SCHEMA IF NOT EXISTS {LEDGER_SCHEMA};
+CREATE TABLE IF NOT EXISTS {LEDGER_SCHEMA}.job_ledger (
+    job        text        NOT NULL,
+    run_id     text        NOT NULL,
+    row_key    text        NOT NULL,
+    applied_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (job, run_id, row_key)
+)
+"""
+# Managers who handled no maintenance requests and issued no leases (Deletion Query 2);
+# matches both dorm_management rows and the buildings they manage, as both name the column managerid
+_INACTIVE_MANAGER = """
+t.managerid <> %(interim_manager_id)s
+AND NOT EXISTS (SELECT 1 FROM maintenance_request mr WHERE mr.managerid = t.managerid)
+AND NOT EXISTS (SELECT 1 FROM lease l WHERE l.managerid = t.managerid)
+"""
+
+
+def step(table: str, key: str, predicate: str, assignment: Optional[str] = None, ledger: bool = False,
+         guard: str = "TRUE") -> Dict[str, Any]:
+    """
+    One chunked statement of a job.
+
+    Args:
+        table: Table that is updated or deleted from (alias t in the SQL fragments)
+        key: Single-column primary key the chunks are ranged over
+        predicate: Rows that still need the change; an update must make it false (or use the ledger)
+        assignment: SET list of an UPDATE; None deletes the matching rows
+        ledger: Record changed keys so that re-running the same run_id changes nothing (for increments)
+        guard: Extra condition checked only when the change is applied, not in dry runs
+    """
+    return {'table': table, 'key': key, 'predicate': predicate, 'assignment': assignment,
+            'ledger': ledger, 'guard': guard}
+
+
+def job(name: str, description: str, steps: List[Dict[str, Any]], params: Dict[str, Any]) -> Dict[str, Any]:
+    """A maintenance job: steps run in order, each over all its chunks, with default parameters"""
+    return {'name': name, 'description': description, 'steps': steps, 'params': params}
+
+
+# Set-based rewrites of Phase2/UpdateAndDelete.sql
+JOBS = {j['name']: j for j in (
+    job('lease_discount_bump',
+        "Raise the discount of leases whose students have no maintenance requests, up to a cap (Update Query 1)",
+        [step('lease', 'leaseid',
+              """t.discountpercent < %(cap)s
+                 AND EXISTS (SELECT 1 FROM rental r
+                             WHERE r.leaseid = t.leaseid
+                             AND NOT EXISTS (SELECT 1 FROM rental r2
+                                             JOIN maintenance_request mr ON mr.roomid = r2.roomid
+                                             WHERE r2.leaseid = r.leaseid AND r2.studentid = r.studentid))""",
+              "discountpercent = LEAST(t.discountpercent + %(step)s, %(cap)s)", ledger=True)],
+        {'step': 3, 'cap': 15}),
+    job('vacant_room_capacity',
+        "Add occupants to the rooms of apartments with no current rental (Update Query 2)",
+        [step('room', 'roomid',
+              """NOT EXISTS (SELECT 1 FROM rental rt
+                             JOIN room r2 ON rt.roomid = r2.roomid
+                             WHERE r2.apartmentid = t.apartmentid AND r2.buildingid = t.buildingid
+                             AND %(as_of)s::date BETWEEN rt.checkindate AND rt.checkoutdate)""",
+              "maxpeople = t.maxpeople + %(step)s", ledger=True)],
+        {'step': 1, 'as_of': None}),
+    job('top_floor_balconies',
+        "Add balconies to rooms on the top floor of buildings in a city (Update Query 3)",
+        [step('room', 'roomid',
+              """NOT t.hasbalcony
+                 AND EXISTS (SELECT 1 FROM apartment a
+                             JOIN building b ON a.buildingid = b.buildingid
+                             WHERE a.apartmentid = t.apartmentid AND a.buildingid = t.buildingid
+                             AND b.address LIKE '%%' || %(city)s || '%%'
+                             AND a.floornumber = (SELECT MAX(a2.floornumber) FROM apartment a2
+                                                  WHERE a2.buildingid = b.buildingid))""",
+              "hasbalcony = TRUE")],
+        {'city': 'Jerusalem'}),
+    job('inactive_managers',
+        "Move the buildings of inactive managers to an interim manager, then delete them (Deletion Query 2)",
+        [step('building', 'buildingid', _INACTIVE_MANAGER, "managerid = %(interim_manager_id)s"),
+         step('dorm_management', 'managerid', _INACTIVE_MANAGER,
+              guard="NOT EXISTS (SELECT 1 FROM building b WHERE b.managerid = t.managerid)")],
+        {'interim_manager_id': 101}),
+)}
+
+
+def _params(job_def: Dict[str, Any], overrides: Optional[Dict[str, Any]], run_id: Optional[str]) -> Dict[str, Any]:
+    params = dict(job_def['params'])
+    params.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    if 'as_of' in params and params['as_of'] is None:
+        params['as_of'] = date.today()
+    params['job'] = job_def['name']
+    params['run_id'] = run_id or date.today().isoformat()  # One run per day unless a run id is given
+    return params
+
+
+def _not_applied(step_def: Dict[str, Any]) -> str:
+    if not step_def['ledger']:
+        return "TRUE"
+    return (f"NOT EXISTS (SELECT 1 FROM {LEDGER_SCHEMA}.job_ledger jl WHERE jl.job = %(job)s "
+            f"AND jl.run_id = %(run_id)s AND jl.row_key = t.{quote_ident(step_def['key'])}::text)")
+
+
+def _ledger_exists(cursor) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [f"{LEDGER_SCHEMA}.job_ledger"])
+    return cursor.fetchone()[0]
+
+
+def count_affected(conn, step_def: Dict[str, Any], params: Dict[str, Any]) -> int:
+    """Rows the step would change now (the dry run)"""
+    with conn.cursor() as cursor:
+        pending = _not_applied(step_def) if _ledger_exists(cursor) else "TRUE"
+        cursor.execute(f"SELECT count(*) FROM {quote_ident(step_def['table'])} t "
+                       f"WHERE ({step_def['predicate']}) AND {pending}", params)
+        count = cursor.fetchone()[0]
+    conn.rollback()
+    return count
+
+
+def _apply_sql(step_def: Dict[str, Any]) -> str:
+    """Statement changing the matching rows of one key range, returning the count of changed rows"""
+    table, key = quote_ident(step_def['table']), quote_ident(step_def['key'])
+    where = (f"(%(lower)s IS NULL OR t.{key} > %(lower)s) AND t.{key} <= %(upper)s "
+             f"AND ({step_def['predicate']}) AND ({step_def['guard']}) AND {_not_applied(step_def)}")
+    if step_def['assignment'] is None:
+        change = f"DELETE FROM {table} t WHERE {where} RETURNING t.{key}"
+    else:
+        change = f"UPDATE {table} t SET {step_def['assignment']} WHERE {where} RETURNING t.{key}"
+    if not step_def['ledger']:
+        return f"WITH changed AS ({change}) SELECT count(*) FROM changed"
+    return (f"WITH changed AS ({change}), logged AS ("
+            f"INSERT INTO {LEDGER_SCHEMA}.job_ledger (job, run_id, row_key) "
+            f"SELECT %(job)s, %(run_id)s, {key}::text FROM changed) SELECT count(*) FROM changed")
+
+
+def run_step(conn, step_def: Dict[str, Any], params: Dict[str, Any], chunk_size: int = 1000,
+             lock_timeout_ms: int = 2000, pause_ms: int = 0) -> Dict[str, Any]:
+    """
+    Apply one step over its table in key-range chunks, committing after each chunk.
+
+    Each chunk covers the next chunk_size keys of the table, so locks are held and WAL is written for at most
+    that many rows at a time. A failed chunk rolls back alone; earlier chunks stay applied and re-running
+    continues with the rows that still match.
+    """
+    table, key = quote_ident(step_def['table']), quote_ident(step_def['key'])
+    apply_sql, chunks, lower = _apply_sql(step_def), [], None
+    started = time.perf_counter()
+    while True:
+        chunk_started = time.perf_counter()
+        with conn.cursor() as cursor:
+            cursor.execute(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}")
+            cursor.execute(f"SELECT max({key}), count(*) FROM (SELECT {key} FROM {table} "
+                           f"WHERE %(lower)s IS NULL OR {key} > %(lower)s ORDER BY {key} LIMIT %(limit)s) s",
+                           {'lower': lower, 'limit': chunk_size})
+            upper, scanned = cursor.fetchone()
+            if upper is None:
+                conn.rollback()
+                break
+            cursor.execute(apply_sql, {**params, 'lower': lower, 'upper': upper})
+            changed = cursor.fetchone()[0]
+        conn.commit()
+        elapsed_ms = (time.perf_counter() - chunk_started) * 1000
+        chunks.append({'chunk': len(chunks) + 1, 'from_key': lower, 'to_key': upper, 'scanned': scanned,
+                       'changed': changed, 'elapsed_ms': round(elapsed_ms, 2)})
+        lower = upper
+        if pause_ms:
+            time.sleep(pause_ms / 1000)
+    elapsed = time.perf_counter() - started
+    changed = sum(chunk['changed'] for chunk in chunks)
+    logger.info(f"{params['job']}: {changed} rows changed in {step_def['table']} over {len(chunks)} chunks")
+    return {'table': step_def['table'], 'changed': changed, 'chunks': chunks, 'elapsed_ms': elapsed * 1000,
+            'rows_per_second': round(changed / elapsed, 1) if elapsed > 0 else 0.0}
+
+
+def run_job(conn, name: str, params: Optional[Dict[str, Any]] = None, run_id: Optional[str] = None,
+            dry_run: bool = False, chunk_size: int = 1000, lock_timeout_ms: int = 2000,
+            pause_ms: int = 0) -> Dict[str, Any]:
+    """
+    Run a maintenance job, or count the rows it would change with dry_run.
+
+    Returns:
+        Dict[str, Any]: job, run_id, params and one result per step (affected for a dry run,
+        changed/chunks/rows_per_second otherwise)
+    """
+    job_def = JOBS[name]
+    values = _params(job_def, params, run_id)
+    if not dry_run and any(s['ledger'] for s in job_def['steps']):
+        with conn.cursor() as cursor:
+            cursor.execute(_LEDGER_DDL)
+        conn.commit()
+    steps = []
+    try:
+        for step_def in job_def['steps']:
+            if dry_run:
+                steps.append({'table': step_def['table'], 'affected': count_affected(conn, step_def, values)})
+            else:
+                steps.append(run_step(conn, step_def, values, chunk_size, lock_timeout_ms, pause_ms))
+    finally:
+        if not dry_run:  # Chunks are committed as they go, so even a failed job has changed rows
+            invalidate_shared('data')
+    return {'job': name, 'run_id': values['run_id'], 'dry_run': dry_run,
+            'params': {k: v for k, v in values.items() if k not in ('job', 'run_id')}, 'steps': steps}
+
+
+def main():
+    """Run the Phase2 update and delete operations as chunked maintenance jobs"""
+    parser = argparse.ArgumentParser(description="Chunked, repeatable versions of Phase2/UpdateAndDelete.sql")
+    parser.add_argument("--dsn", required=True, help="Connection string of the database")
+    parser.add_argument("job", nargs='?', choices=sorted(JOBS), help="Job to run (omit to list the jobs)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would change")
+    parser.add_argument("--run-id", help="Run identifier; re-running an incrementing job with the same id "
+                                         "changes nothing (default: today's date)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Keys per chunk (one transaction each)")
+    parser.add_argument("--lock-timeout-ms", type=int, default=2000, help="Lock timeout of each chunk")
+    parser.add_argument("--pause-ms", type=int, default=0, help="Pause between chunks")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a job parameter (e.g. cap=20, city=Haifa, interim_manager_id=102)")
+    args = parser.parse_args()
+
+    if not args.job:
+        for job_def in JOBS.values():
+            defaults = ', '.join(f"{k}={v}" for k, v in job_def['params'].items())
+            print(f"{job_def['name']:<24} {job_def['description']} ({defaults})")
+        return
+    logging.basicConfig(level=logging.INFO)
+    overrides = dict(item.split('=', 1) for item in args.param)
+    conn = psycopg2.connect(args.dsn)
+    try:
+        result = run_job(conn, args.job, overrides, args.run_id, args.dry_run, args.chunk_size,
+                         args.lock_timeout_ms, args.pause_ms)
+    finally:
+        conn.close()
+    for step_result in result['steps']:
+        if args.dry_run:
+            print(f"{step_result['table']:<20} {step_result['affected']:>8,} rows would change")
+            continue
+        for chunk in step_result['chunks']:
+            print(f"  {step_result['table']:<18} chunk {chunk['chunk']:>4} keys {chunk['from_key']}..{chunk['to_key']}"
+                  f"  {chunk['changed']:>6,} changed  {chunk['elapsed_ms']:>8,.1f} ms")
+        print(f"{step_result['table']:<20} {step_result['changed']:>8,} rows in {step_result['elapsed_ms']:,.0f} ms "
+              f"({step_result['rows_per_second']:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
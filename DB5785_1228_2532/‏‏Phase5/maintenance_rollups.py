@@ -0,0 +1,420 @@
+from typing import Any, Dict, Tuple
+import argparse
+import io
+import logging
+import random
+import time
+from datetime import date, timedelta
+import psycopg2
+from result_cache import invalidate_shared
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Summary tables over maintenance_request, each a count of requests (and of unresolved ones) per grain:
+# buildings for the per-building, per-priority and per-month reports, rooms for the per-room reports.
+# Requests without a room count under a NULL building, hence NULLS NOT DISTINCT on the grain.
+_MONTH = "date_trunc('month', {r}.requestdate)::DATE"
+ROLLUPS = {
+    'maintenance_rollup_building': {
+        'columns': [('month', _MONTH, 'DATE NOT NULL'), ('buildingid', 'rm.buildingid', 'INT'),
+                    ('priority', '{r}.priority', 'priority_type NOT NULL'),
+                    ('issuedescription', '{r}.issuedescription', 'TEXT NOT NULL')],
+        'where': 'TRUE'},
+    'maintenance_rollup_room': {
+        'columns': [('month', _MONTH, 'DATE NOT NULL'), ('roomid', '{r}.roomid', 'INT NOT NULL'),
+                    ('buildingid', 'rm.buildingid', 'INT'),
+                    ('issuedescription', '{r}.issuedescription', 'TEXT NOT NULL')],
+        'where': '{r}.roomid IS NOT NULL'},
+}
+
+
+def _table_ddl(name: str, spec: Dict[str, Any]) -> str:
+    """CREATE TABLE of one rollup"""
+    columns = ',\n    '.join(f"{column} {sql_type}" for column, _, sql_type in spec['columns'])
+    grain = ', '.join(column for column, _, _ in spec['columns'])
+    return f"""
+DROP TABLE IF EXISTS {name} CASCADE;
+CREATE TABLE {name} (
+    {columns},
+    request_count INT NOT NULL,
+    unresolved_count INT NOT NULL,
+    CONSTRAINT {name}_grain UNIQUE NULLS NOT DISTINCT ({grain})
+);
+CREATE INDEX idx_{name}_empty ON {name} (month) WHERE request_count = 0;
+"""
+
+
+def _aggregate_sql(spec: Dict[str, Any], source: str, alias: str, weight: str = '1') -> str:
+    """Rollup rows of a set of requests; weight is +1 / -1 per row for trigger deltas"""
+    keys = ', '.join(f"{expression.format(r=alias)} AS {column}" for column, expression, _ in spec['columns'])
+    group = ', '.join(str(i + 1) for i in range(len(spec['columns'])))
+    return f"""SELECT {keys}, sum({weight})::INT AS request_count,
+               COALESCE(sum({weight}) FILTER (WHERE {alias}.resolveddate IS NULL), 0)::INT AS unresolved_count
+        FROM {source} {alias}
+        LEFT JOIN room rm ON rm.roomid = {alias}.roomid
+        WHERE {spec['where'].format(r=alias)}
+        GROUP BY {group}"""
+
+
+def _recompute_sql(spec: Dict[str, Any]) -> str:
+    """Full recomputation from maintenance_request: the initial fill and the consistency reference"""
+    return _aggregate_sql(spec, 'maintenance_request', 'mr')
+
+
+def _delta_sql(name: str, spec: Dict[str, Any], rows: str) -> str:
+    """Add the counts of a statement's transition rows to a rollup"""
+    columns = ', '.join(column for column, _, _ in spec['columns'])
+    return f"""
+        INSERT INTO {name} AS r ({columns}, request_count, unresolved_count)
+        {_aggregate_sql(spec, f'({rows})', 'd', 'd.sign')}
+        ON CONFLICT ON CONSTRAINT {name}_grain DO UPDATE
+        SET request_count = r.request_count + EXCLUDED.request_count,
+            unresolved_count = r.unresolved_count + EXCLUDED.unresolved_count;
+        DELETE FROM {name} WHERE request_count = 0;"""
+
+
+_INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS idx_maintenance_request_requestdate ON maintenance_request (requestdate);
+CREATE INDEX IF NOT EXISTS idx_maintenance_request_room_date ON maintenance_request (roomid, requestdate);
+"""
+VIEWS = ('maintenance_by_room', 'maintenance_by_building', 'maintenance_by_priority', 'maintenance_by_month')
+_VIEWS_DDL = """
+CREATE VIEW maintenance_by_room AS
+SELECT roomid, buildingid, sum(request_count)::INT AS request_count, sum(unresolved_count)::INT AS unresolved_count
+FROM maintenance_rollup_room GROUP BY roomid, buildingid;
+
+CREATE VIEW maintenance_by_building AS
+SELECT buildingid, sum(request_count)::INT AS request_count, sum(unresolved_count)::INT AS unresolved_count
+FROM maintenance_rollup_building WHERE buildingid IS NOT NULL GROUP BY buildingid;
+
+CREATE VIEW maintenance_by_priority AS
+SELECT priority, sum(request_count)::INT AS request_count, sum(unresolved_count)::INT AS unresolved_count
+FROM maintenance_rollup_building GROUP BY priority;
+
+CREATE VIEW maintenance_by_month AS
+SELECT month,
+       CASE WHEN EXTRACT(MONTH FROM month) IN (12, 1, 2) THEN 'Winter'
+            WHEN EXTRACT(MONTH FROM month) IN (3, 4, 5) THEN 'Spring'
+            WHEN EXTRACT(MONTH FROM month) IN (6, 7, 8) THEN 'Summer'
+            ELSE 'Autumn' END AS season,
+       sum(request_count)::INT AS request_count, sum(unresolved_count)::INT AS unresolved_count
+FROM maintenance_rollup_building GROUP BY month;
+"""
+_NEW_ROWS = "SELECT requestdate, roomid, priority, issuedescription, resolveddate, 1 AS sign FROM new_rows"
+_OLD_ROWS = "SELECT requestdate, roomid, priority, issuedescription, resolveddate, -1 AS sign FROM old_rows"
+
+
+def _functions_ddl() -> str:
+    """The trigger function that applies statement deltas to every rollup"""
+    deltas = {rows: ''.join(_delta_sql(name, spec, rows) for name, spec in ROLLUPS.items())
+              for rows in (_NEW_ROWS, _OLD_ROWS, f"{_NEW_ROWS} UNION ALL {_OLD_ROWS}")}
+    # One statement-level trigger per event: the transition tables hold all rows of a bulk statement, so a
+    # 10,000-row insert updates each rollup once instead of 10,000 times
+    return f"""
+CREATE OR REPLACE FUNCTION maintenance_rollup_apply()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN{deltas[_NEW_ROWS]}
+    ELSIF TG_OP = 'DELETE' THEN{deltas[_OLD_ROWS]}
+    ELSE{deltas[f"{_NEW_ROWS} UNION ALL {_OLD_ROWS}"]}
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+_TRIGGERS_DDL = """
+DROP TRIGGER IF EXISTS maintenance_rollup_insert ON maintenance_request;
+DROP TRIGGER IF EXISTS maintenance_rollup_update ON maintenance_request;
+DROP TRIGGER IF EXISTS maintenance_rollup_delete ON maintenance_request;
+CREATE TRIGGER maintenance_rollup_insert AFTER INSERT ON maintenance_request
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION maintenance_rollup_apply();
+CREATE TRIGGER maintenance_rollup_update AFTER UPDATE ON maintenance_request
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION maintenance_rollup_apply();
+CREATE TRIGGER maintenance_rollup_delete AFTER DELETE ON maintenance_request
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION maintenance_rollup_apply();
+"""
+
+
+def install(conn) -> Dict[str, Any]:
+    """Create and fill the rollups from maintenance_request and install their views, functions and triggers"""
+    started = time.perf_counter()
+    rows = {}
+    with conn.cursor() as cursor:
+        # No request may change between the full build and the triggers taking over
+        cursor.execute("LOCK TABLE maintenance_request IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(_INDEX_DDL)
+        for name, spec in ROLLUPS.items():
+            cursor.execute(_table_ddl(name, spec))
+            cursor.execute(f"INSERT INTO {name} {_recompute_sql(spec)}")
+            rows[name] = cursor.rowcount
+            cursor.execute(f"ANALYZE {name}")
+        cursor.execute(_VIEWS_DDL)
+        cursor.execute(_functions_ddl())
+        cursor.execute(_TRIGGERS_DDL)
+    conn.commit()
+    invalidate_shared('schema', 'data')  # New tables and triggers, for app sessions that cached the old state
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Maintenance rollups built in {elapsed_ms:.0f} ms: {rows}")
+    return {'rows': rows, 'elapsed_ms': elapsed_ms}
+
+
+def check(conn, sample: int = 20) -> Dict[str, Any]:
+    """
+    Compare every rollup with a full recomputation from maintenance_request.
+
+    Returns:
+        Dict with elapsed_ms, mismatches (total) and per rollup: stored_rows, expected_rows, mismatches and up
+        to `sample` differing rows (expected vs stored, NULL where a row is missing)
+    """
+    started = time.perf_counter()
+    result = {'mismatches': 0, 'rollups': {}}
+    with conn.cursor() as cursor:
+        for name, spec in ROLLUPS.items():
+            grain = [column for column, _, _ in spec['columns']]
+            # A FULL JOIN needs plain equality, so NULL keys are compared through a sentinel
+            match = ' AND '.join(f"e.{c} = r.{c}" if 'NOT NULL' in t else f"COALESCE(e.{c}, -1) = COALESCE(r.{c}, -1)"
+                                 for c, _, t in spec['columns'])
+            keys = ', '.join(f"COALESCE(e.{c}, r.{c})::TEXT AS {c}" for c in grain)
+            cursor.execute(f"""
+                WITH expected AS ({_recompute_sql(spec)}),
+                diff AS (
+                    SELECT {keys},
+                           e.request_count AS expected_count, r.request_count AS stored_count,
+                           e.unresolved_count AS expected_unresolved, r.unresolved_count AS stored_unresolved
+                    FROM expected e
+                    FULL JOIN {name} r ON {match}
+                    WHERE e.request_count IS DISTINCT FROM r.request_count
+                       OR e.unresolved_count IS DISTINCT FROM r.unresolved_count
+                )
+                SELECT (SELECT count(*) FROM {name}), (SELECT count(*) FROM expected),
+                       (SELECT count(*) FROM diff), (SELECT json_agg(d) FROM (SELECT * FROM diff LIMIT %s) d)
+                """, [sample])
+            stored, expected, mismatches, rows = cursor.fetchone()
+            result['rollups'][name] = {'stored_rows': stored, 'expected_rows': expected,
+                                       'mismatches': mismatches, 'sample': rows or []}
+            result['mismatches'] += mismatches
+            if mismatches:
+                logger.warning(f"{name} differs from maintenance_request in {mismatches} rows")
+    conn.rollback()
+    result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def rebuild(conn) -> Dict[str, int]:
+    """Replace the rollups' rows with a full recomputation (repairs them after a failed check)"""
+    rows = {}
+    with conn.cursor() as cursor:
+        cursor.execute("LOCK TABLE maintenance_request IN SHARE ROW EXCLUSIVE MODE")
+        for name, spec in ROLLUPS.items():
+            cursor.execute(f"DELETE FROM {name}")
+            cursor.execute(f"INSERT INTO {name} {_recompute_sql(spec)}")
+            rows[name] = cursor.rowcount
+    conn.commit()
+    invalidate_shared('data')
+    logger.info(f"Maintenance rollups rebuilt: {rows}")
+    return rows
+
+
+def _timed(cursor, sql_text: str, repeat: int = 3) -> Tuple[float, int]:
+    """Median time of a query in milliseconds, and its row count"""
+    timings, rows = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql_text)
+        rows = len(cursor.fetchall())
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2], rows
+
+
+# The reports as they were before the rollup; their rollup versions are read from Phase2/Queries.sql
+_BENCHMARK_DAY = "DATE '2024-06-15'"  # Stands in for CURRENT_DATE so both versions see the same window
+_BENCHMARK_QUERIES = {
+    'requests by priority': "SELECT priority, count(*) FROM maintenance_request GROUP BY priority",
+    'Query 2': """
+        SELECT r.roomid, b.buildingname, mr.issuedescription, COUNT(mr.requestid) AS issuecount,
+               STRING_AGG('Day ' || EXTRACT(DAY FROM mr.requestdate), ', ') AS requestdays,
+               EXTRACT(MONTH FROM mr.requestdate) AS requestmonth, EXTRACT(YEAR FROM mr.requestdate) AS requestyear
+        FROM room r
+        JOIN apartment a ON r.apartmentid = a.apartmentid AND r.buildingid = a.buildingid
+        JOIN building b ON a.buildingid = b.buildingid
+        JOIN maintenance_request mr ON r.roomid = mr.roomid
+        WHERE mr.requestdate >= CURRENT_DATE - INTERVAL '1 year'
+        GROUP BY r.roomid, b.buildingname, mr.issuedescription, EXTRACT(YEAR FROM mr.requestdate),
+                 EXTRACT(MONTH FROM mr.requestdate)
+        HAVING COUNT(mr.requestid) > 1
+        ORDER BY issuecount DESC""",
+    'Query 8': """
+        SELECT b.buildingid, b.buildingname,
+               SUM(CASE WHEN EXTRACT(MONTH FROM mr.requestdate) IN (12, 1, 2) THEN 1 ELSE 0 END) AS winterissues,
+               SUM(CASE WHEN EXTRACT(MONTH FROM mr.requestdate) IN (6, 7, 8) THEN 1 ELSE 0 END) AS summerissues,
+               EXTRACT(YEAR FROM mr.requestdate) AS requestyear
+        FROM building b
+        JOIN apartment a ON b.buildingid = a.buildingid
+        JOIN room r ON a.apartmentid = r.apartmentid AND a.buildingid = r.buildingid
+        JOIN maintenance_request mr ON r.roomid = mr.roomid
+        WHERE mr.requestdate >= CURRENT_DATE - INTERVAL '2 years'
+        GROUP BY b.buildingid, b.buildingname, EXTRACT(YEAR FROM mr.requestdate)
+        HAVING SUM(CASE WHEN EXTRACT(MONTH FROM mr.requestdate) IN (12, 1, 2) THEN 1 ELSE 0 END) >
+               SUM(CASE WHEN EXTRACT(MONTH FROM mr.requestdate) IN (6, 7, 8) THEN 1 ELSE 0 END)
+        ORDER BY buildingid DESC""",
+}
+
+
+# Phase4 functions the rollup versions call; they read the rollups once these exist
+_SHIPPED_FUNCTIONS = ('maintenance_counts_since', 'maintenance_room_counts_since')
+
+
+def _rollup_queries() -> Dict[str, str]:
+    """The rollup versions of the benchmarked reports, as shipped"""
+    import os
+    from sql_catalog import find_repo_dir
+    from sql_parser import parse_sql_file
+    queries = {'requests by priority': "SELECT priority, request_count FROM maintenance_by_priority"}
+    for statement in parse_sql_file(os.path.join(find_repo_dir('Phase2'), 'Queries.sql')):
+        label = statement['name'].split(':')[0]
+        if label in _BENCHMARK_QUERIES:
+            queries[label] = statement['sql']
+    return queries
+
+
+_ISSUES = ('Leaky faucet in room', 'Broken window in hallway', 'Elevator not working', 'Water leak from ceiling',
+           'Gas leak', 'Heating not working', 'Power outage', 'Clogged drain')
+
+
+def _requests_copy(rng: random.Random, first_id: int, count: int, rooms: int) -> io.StringIO:
+    """Generated maintenance requests in COPY text format"""
+    buffer = io.StringIO()
+    for request in range(first_id, first_id + count):
+        day = date(2019, 1, 1) + timedelta(days=rng.randrange(2000))
+        resolved = '\\N' if rng.random() < 0.2 else day + timedelta(days=rng.randrange(30))
+        room = rng.randrange(1, rooms + 1) if rng.random() < 0.9 else '\\N'
+        buffer.write(f"{request}\t{rng.choice(_ISSUES)}\t{day}\t{resolved}\t{rng.choice(('Low', 'Medium', 'High'))}"
+                     f"\t1\t{room}\n")
+    buffer.seek(0)
+    return buffer
+
+
+def benchmark(dsn: str, requests: int = 1000000, rooms: int = 20000, seed: int = 7) -> Dict[str, Any]:
+    """Time the reports against the requests and against the rollup, and the trigger's cost, in a scratch database"""
+    from backup_manager import with_database  # Same DSN, other database
+    from occupancy import generate_data
+    from sql_catalog import shipped_statement
+    rng = random.Random(seed)
+    scratch = f"rollup_bench_{int(time.time())}"
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE {scratch}")
+    conn = psycopg2.connect(with_database(dsn, scratch))
+    copy_sql = ("COPY maintenance_request (requestid, issuedescription, requestdate, resolveddate, priority, "
+                "managerid, roomid) FROM STDIN")
+    result = {'requests': requests}
+    try:
+        generate_data(conn, rooms, rooms, rng)  # Rooms, apartments and buildings; the rentals are not used
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TYPE priority_type AS ENUM ('Low', 'Medium', 'High');
+                CREATE TABLE maintenance_request (requestid INT PRIMARY KEY, issuedescription TEXT NOT NULL,
+                    requestdate DATE NOT NULL, resolveddate DATE, priority priority_type NOT NULL,
+                    managerid INT NOT NULL, studentid INT, roomid INT, leaseid INT);
+                """)
+            cursor.copy_expert(copy_sql, _requests_copy(rng, 1, requests, rooms))
+        conn.commit()
+        result['install_ms'] = install(conn)['elapsed_ms']
+        with conn.cursor() as cursor:
+            for function in _SHIPPED_FUNCTIONS:
+                cursor.execute(shipped_statement('Phase4', 'functions.sql', f"FUNCTION {function}("))
+        conn.commit()
+        rollup_queries = _rollup_queries()
+        with conn.cursor() as cursor:
+            result['rollup_rows'] = {}
+            for name in ROLLUPS:
+                cursor.execute(f"SELECT count(*) FROM {name}")
+                result['rollup_rows'][name] = cursor.fetchone()[0]
+            result['queries'] = {}
+            for name, base_sql in _BENCHMARK_QUERIES.items():
+                base_ms, base_rows = _timed(cursor, base_sql.replace('CURRENT_DATE', _BENCHMARK_DAY))
+                rollup_ms, rollup_rows = _timed(cursor, rollup_queries[name].replace('CURRENT_DATE', _BENCHMARK_DAY))
+                result['queries'][name] = {'base_ms': base_ms, 'rollup_ms': rollup_ms,
+                                           'same_rows': base_rows == rollup_rows}
+            # Trigger cost: one bulk statement, then single-row statements as the app issues them
+            started = time.perf_counter()
+            cursor.copy_expert(copy_sql, _requests_copy(rng, requests + 1, 10000, rooms))
+            conn.commit()
+            result['bulk_insert_10k_ms'] = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            singles = 1000
+            for request in range(requests + 10001, requests + 10001 + singles):
+                cursor.execute("INSERT INTO maintenance_request (requestid, issuedescription, requestdate, priority, "
+                               "managerid, roomid) VALUES (%s, 'Gas leak', DATE '2024-05-01', 'High', 1, %s)",
+                               [request, rng.randrange(1, rooms + 1)])
+                conn.commit()
+            result['single_insert_ms'] = (time.perf_counter() - started) * 1000 / singles
+            cursor.execute("UPDATE maintenance_request SET resolveddate = requestdate WHERE requestid > %s",
+                           [requests])
+            conn.commit()
+        consistency = check(conn)
+        result['check_ms'] = consistency['elapsed_ms']
+        result['mismatches'] = consistency['mismatches']
+    finally:
+        conn.close()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS {scratch} WITH (FORCE)")
+        admin.close()
+    return result
+
+
+def main():
+    """Install, check or rebuild the maintenance rollups"""
+    parser = argparse.ArgumentParser(description="Incrementally maintained maintenance request rollups")
+    parser.add_argument("--dsn", required=True, help="Connection string of the database")
+    parser.add_argument("--install", action="store_true", help="Create and fill the rollups, their views and triggers")
+    parser.add_argument("--check", action="store_true", help="Compare the rollups with a full recomputation")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups' rows")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Time the reports with and without the rollup on generated requests")
+    parser.add_argument("--requests", type=int, default=1000000, help="Requests generated for --benchmark")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.install or args.check or args.rebuild:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            if args.install:
+                stats = install(conn)
+                print(f"Rollups built in {stats['elapsed_ms']:,.0f} ms")
+                for name, rows in stats['rows'].items():
+                    print(f"  {name}: {rows:,} rows")
+            if args.rebuild:
+                for name, rows in rebuild(conn).items():
+                    print(f"Rebuilt {name}: {rows:,} rows")
+            if args.check:
+                result = check(conn)
+                for name, rollup in result['rollups'].items():
+                    print(f"{name}: {rollup['stored_rows']:,} rows, {rollup['expected_rows']:,} expected, "
+                          f"{rollup['mismatches']:,} mismatches")
+                    for row in rollup['sample']:
+                        print(f"  {row}")
+                print(f"Checked in {result['elapsed_ms']:,.0f} ms")
+                if result['mismatches']:
+                    raise SystemExit("Maintenance rollups are inconsistent; run --rebuild")
+        finally:
+            conn.close()
+    if args.benchmark:
+        result = benchmark(args.dsn, args.requests)
+        print(f"{result['requests']:,} requests → "
+              + ', '.join(f"{name} {rows:,} rows" for name, rows in result['rollup_rows'].items())
+              + f" (built in {result['install_ms']:,.0f} ms)")
+        for name, timing in result['queries'].items():
+            print(f"  {name:<28} {timing['base_ms']:>9,.1f} ms → {timing['rollup_ms']:>7,.1f} ms"
+                  f"{'' if timing['same_rows'] else '  (row counts differ!)'}")
+        print(f"  10,000-row COPY with trigger   {result['bulk_insert_10k_ms']:>9,.1f} ms")
+        print(f"  single-row insert + commit     {result['single_insert_ms']:>9,.3f} ms each")
+        print(f"  consistency check {result['check_ms']:,.0f} ms, {result['mismatches']} mismatches")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,127 @@
-from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, Table
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy import inspect
-from sqlalchemy.ext.declarative import declared_attr
+from typing import Any, Dict, Iterable, List, Optional
+import itertools
+import logging
+import threading
+import weakref
+from sqlalchemy import MetaData, Table, insert, update
+from sqlalchemy.dialects.postgresql import ENUM
+from sqlalchemy.orm import Session, declarative_base
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """One mapped ORM class per table, reflected from the database once"""
+    # Purpose: The whole schema is read with a single MetaData.reflect, so every column keeps its exact
+    # reflected type (ENUM('Male', 'Female', name='gender_type'), BOOLEAN, NUMERIC(10, 2), composite
+    # primary keys, ...). Classes are built once and reused until refresh() is called.
+    def __init__(self, engine, schema: Optional[str] = None):
+        self.engine = engine
+        self.schema = schema  # None = the connection's default schema (public)
+        self.metadata = MetaData(schema=schema)
+        self._models: Dict[str, type] = {}
+        self._lock = threading.Lock()
+        self._reflected = False
+
+    def refresh(self) -> None:
+        """Reflect the schema again on next use (after DDL changes)"""
+        with self._lock:
+            self._reflected = False
+
+    def _ensure_reflected(self) -> None:
+        with self._lock:
+            if not self._reflected:
+                self._reflect()
+
+    def _reflect(self) -> None:
+        """Reflect all tables in one pass and map a class to each table that has a primary key"""
+        metadata = MetaData(schema=self.schema)
+        metadata.reflect(bind=self.engine)
+        base = declarative_base(metadata=metadata)
+        models = {}
+        for table in metadata.sorted_tables:
+            if not table.primary_key.columns:
+                logger.info(f"Table {table.name} has no primary key; available as a Table only")
+                continue
+            class_name = ''.join(part.capitalize() for part in table.name.split('_')) or table.name
+            models[table.name] = type(class_name, (base,), {'__table__': table})
+        self.metadata, self._models, self._reflected = metadata, models, True
+        logger.info(f"Reflected {len(metadata.tables)} tables, mapped {len(models)} models")
+
+    def _key(self, table_name: str) -> str:
+        return f"{self.schema}.{table_name}" if self.schema else table_name
+
+    @property
+    def table_names(self) -> List[str]:
+        self._ensure_reflected()
+        return [table.name for table in self.metadata.sorted_tables]
+
+    def get_table(self, table_name: str) -> Table:
+        """Get the reflected Table of a table (KeyError if it does not exist)"""
+        self._ensure_reflected()
+        return self.metadata.tables[self._key(table_name)]
+
+    def get_model(self, table_name: str) -> type:
+        """Get the mapped class of a table (KeyError if it does not exist or has no primary key)"""
+        self._ensure_reflected()
+        return self._models[table_name]
+
+    def column_types(self, table_name: str) -> Dict[str, Any]:
+        """Reflected SQLAlchemy type of every column"""
+        return {column.name: column.type for column in self.get_table(table_name).columns}
+
+    def enum_values(self, table_name: str) -> Dict[str, List[str]]:
+        """Allowed labels of every enum column (e.g. gender -> ['Male', 'Female'])"""
+        return {column.name: list(column.type.enums) for column in self.get_table(table_name).columns
+                if isinstance(column.type, ENUM)}
+
+    def bulk_insert(self, table_name: str, rows: Iterable[Dict[str, Any]], chunk_size: int = 1000) -> int:
+        """Insert many rows in one transaction; returns the number of rows inserted"""
+        # Purpose: insert() with a list of parameter sets lets SQLAlchemy batch them into multi-row
+        # INSERT ... VALUES statements, instead of one round trip per row
+        table = self.get_table(table_name)
+        rows, inserted = iter(rows), 0
+        with self.engine.begin() as conn:
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                conn.execute(insert(table), chunk)
+                inserted += len(chunk)
+        logger.info(f"Bulk inserted {inserted} rows into {table_name}")
+        return inserted
+
+    def bulk_update(self, table_name: str, rows: Iterable[Dict[str, Any]], chunk_size: int = 1000) -> int:
+        """Update many rows by primary key in one transaction; every row must contain the key columns"""
+        model = self.get_model(table_name)
+        rows, updated = iter(rows), 0
+        with Session(self.engine) as session, session.begin():
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                session.execute(update(model), chunk)  # ORM bulk UPDATE by primary key (executemany)
+                updated += len(chunk)
+        logger.info(f"Bulk updated {updated} rows in {table_name}")
+        return updated
+
+
+# Registries shared by all sessions of the process, one per engine
+_registries: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+
+def get_registry(engine) -> ModelRegistry:
+    """Get the shared model registry of an engine"""
+    with _registries_lock:
+        registry = _registries.get(engine)
+        if registry is None:
+            registry = ModelRegistry(engine)
+            _registries[engine] = registry
+        return registry
 
-Base = declarative_base()
 
 def get_dynamic_model(table_name, engine):
-    class DynamicModel(Base):
-        __tablename__ = table_name
-        __table_args__ = {'extend_existing': True}
-
-        @declared_attr
-        def __table__(cls):
-            inspector = inspect(engine)
-            columns = []
-            for column in inspector.get_columns(table_name):
-                col_name = column['name']
-                col_type = column['type']
-                col_args = {}
-                if column['primary_key']:
-                    col_args['primary_key'] = True
-                if 'INTEGER' in str(col_type):
-                    col = Column(col_name, Integer, **col_args)
-                elif 'NUMERIC' in str(col_type):
-                    col = Column(col_name, Numeric, **col_args)
-                elif 'DATE' in str(col_type):
-                    col = Column(col_name, Date, **col_args)
-                elif 'TIMESTAMP' in str(col_type):
-                    col = Column(col_name, DateTime, **col_args)
-                else:
-                    col = Column(col_name, String, **col_args)
-                columns.append(col)
-            return Table(table_name, Base.metadata, *columns)
-
-    return DynamicModel
\ No newline at end of file
+    """Get the mapped class of a table (kept for existing callers; served from the registry)"""
+    return get_registry(engine).get_model(table_name)
@@ -0,0 +1,214 @@
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import os
+import select
+import threading
+import time
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, POLL_OK, POLL_READ, POLL_WRITE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def format_notice(notice: str) -> str:
+    """Strip the severity prefix psycopg2 keeps in notice strings ("NOTICE:  ...")"""
+    severity, sep, message = notice.partition(':')
+    return message.strip() if sep and severity.isupper() else notice.strip()
+
+
+class NoticeBuffer:
+    """Bounded ring buffer for PostgreSQL NOTICEs that spills older messages to a log file"""
+    # Purpose: Installed as `connection.notices`. psycopg2 calls append() for every notice and only
+    # trims plain lists to the last 50 entries, so nothing is lost here. The newest `capacity` messages
+    # stay in memory; once the buffer overflows, evicted messages are written to `spill_path`, and
+    # close() appends the rest so the file holds the complete output.
+    def __init__(self, capacity: int = 1000, spill_path: Optional[str] = None,
+                 listener: Optional[Callable[[str], None]] = None):
+        self.capacity = max(1, capacity)
+        self.spill_path = spill_path  # Log file, created only if the buffer overflows
+        self.listener = listener  # Called with every formatted message as it arrives
+        self.total = 0  # Notices received
+        self._messages = deque(maxlen=self.capacity)
+        self._spill_file = None
+        self._lock = threading.Lock()
+
+    def append(self, notice: str) -> None:
+        """Receive a raw notice from psycopg2"""
+        message = format_notice(notice)
+        with self._lock:
+            if len(self._messages) == self.capacity:
+                self._spill(self._messages[0])  # About to be evicted by the deque
+            self._messages.append(message)
+            self.total += 1
+        if self.listener is not None:
+            try:
+                self.listener(message)
+            except Exception as e:
+                logger.warning(f"Notice listener failed: {e}")
+
+    def _spill(self, message: str) -> None:
+        """Write an evicted message to the spill file"""
+        if self.spill_path is None:
+            return
+        if self._spill_file is None:
+            os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+            self._spill_file = open(self.spill_path, 'w', encoding='utf-8')
+            logger.info(f"Notice buffer full, spilling to {self.spill_path}")
+        self._spill_file.write(message + '\n')
+
+    @property
+    def dropped(self) -> int:
+        """Number of messages no longer held in memory"""
+        return self.total - len(self._messages)
+
+    @property
+    def spilled(self) -> bool:
+        """True if a spill file was written"""
+        return self._spill_file is not None
+
+    def messages(self) -> List[str]:
+        """Messages currently held in memory (oldest first)"""
+        with self._lock:
+            return list(self._messages)
+
+    def close(self) -> None:
+        """Complete the spill file with the messages still in memory"""
+        with self._lock:
+            if self._spill_file is not None and not self._spill_file.closed:
+                for message in self._messages:
+                    self._spill_file.write(message + '\n')
+                self._spill_file.close()
+
+
+class _WaitingCursor:
+    """Cursor of a StreamingConnection that waits for each statement to finish"""
+    def __init__(self, connection, cursor):
+        self._connection = connection
+        self._cursor = cursor
+
+    def execute(self, query, params=None) -> None:
+        self._connection._begin_if_needed()
+        self._connection._captured(query, params, lambda: (self._cursor.execute(query, params),
+                                                           self._connection.wait()), self._cursor)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+
+class StreamingConnection:
+    """Asynchronous psycopg2 connection that delivers NOTICEs while a statement is still running"""
+    # Purpose: A blocking psycopg2 connection only hands notices over after the statement finished.
+    # An asynchronous connection is polled by wait(), and psycopg2 moves every notice received so far
+    # into `notices` on each poll, so a NoticeBuffer listener sees them live.
+    # Mimics the parts of the pooled connection used by DatabaseManager (cursor, commit, rollback,
+    # set_isolation_level, info, close). Asynchronous connections are always in autocommit mode, so
+    # transactions are opened with an explicit BEGIN. The connection can be reused for several calls,
+    # each with its own notice buffer.
+    def __init__(self, connect_args: List[Any], connect_kwargs: Dict[str, Any], notices: NoticeBuffer,
+                 poll_interval: float = 0.1, capture_log=None):
+        self.poll_interval = poll_interval  # Seconds between polls while the server is busy
+        self.info = {}  # Per-connection state (e.g. prepared statement cache), as on pooled connections
+        self.created_at = time.monotonic()  # For recycling, as the pool does
+        self.capture_log = capture_log  # Workload capture log (workload_capture.CaptureLog) or None
+        self.lane = capture_log.new_lane() if capture_log is not None else 0
+        self._autocommit = False
+        self._in_transaction = False
+        self._conn = psycopg2.connect(*connect_args, async_=1, **connect_kwargs)
+        self._conn.notices = notices
+        self.wait()
+
+    @property
+    def notices(self) -> NoticeBuffer:
+        return self._conn.notices
+
+    @notices.setter
+    def notices(self, notices: NoticeBuffer) -> None:
+        self._conn.notices = notices
+
+    @property
+    def closed(self) -> bool:
+        """True once the connection was closed or broken"""
+        return bool(self._conn.closed)
+
+    def wait(self) -> None:
+        """Poll until the current operation completes, cancelling it on interruption"""
+        try:
+            while True:
+                state = self._conn.poll()  # Also collects notices received so far
+                if state == POLL_OK:
+                    return
+                if state == POLL_READ:
+                    select.select([self._conn.fileno()], [], [], self.poll_interval)
+                elif state == POLL_WRITE:
+                    select.select([], [self._conn.fileno()], [], self.poll_interval)
+                else:
+                    raise psycopg2.OperationalError(f"Unexpected poll state: {state}")
+        except KeyboardInterrupt:
+            self._conn.cancel()
+            raise
+
+    def ping(self) -> bool:
+        """Check that the server still answers, as the pool's pre-ping does (not recorded by capture)"""
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                self.wait()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _captured(self, query, params, call: Callable[[], Any], cursor) -> None:
+        """Run a statement, recording it when capturing (always autocommit; transactions are explicit BEGINs)"""
+        if self.capture_log is None:
+            call()
+            return
+        started, clock, error = time.time(), time.perf_counter(), None
+        try:
+            call()
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e).strip()}"
+            raise
+        finally:
+            self.capture_log.record(self.lane, 'execute', str(query), params, started,
+                                    (time.perf_counter() - clock) * 1000, cursor.rowcount, error, autocommit=True)
+
+    def _run(self, sql_text: str) -> None:
+        """Execute a transaction control statement"""
+        cursor = self._conn.cursor()
+        try:
+            self._captured(sql_text, None, lambda: (cursor.execute(sql_text), self.wait()), cursor)
+        finally:
+            cursor.close()
+
+    def _begin_if_needed(self) -> None:
+        if not self._autocommit and not self._in_transaction:
+            self._run("BEGIN")
+            self._in_transaction = True
+
+    def set_isolation_level(self, level) -> None:
+        """Choose between autocommit and transaction mode (isolation level itself is the server default)"""
+        self._autocommit = level == ISOLATION_LEVEL_AUTOCOMMIT
+
+    def cursor(self, **kwargs) -> _WaitingCursor:
+        return _WaitingCursor(self, self._conn.cursor(**kwargs))
+
+    def commit(self) -> None:
+        if self._in_transaction:
+            self._in_transaction = False
+            self._run("COMMIT")
+
+    def rollback(self) -> None:
+        if self._in_transaction:
+            self._in_transaction = False
+            self._run("ROLLBACK")
+
+    def close(self) -> None:
+        self._conn.close()
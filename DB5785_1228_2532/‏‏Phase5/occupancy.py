@@ -0,0 +1,411 @@
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import argparse
+import io
+import logging
+import random
+import time
+from datetime import date, timedelta
+import psycopg2
+from result_cache import invalidate_shared
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# One row per rental: the bed it occupies and its stay as a daterange (inclusive, as BETWEEN is elsewhere).
+# The exclusion constraint makes double-booking a bed impossible, so a room never holds more than
+# MaxPeople students on any day. Singleton int4ranges stand in for "=" on the ids, which keeps the
+# constraint on the built-in range GiST operators (btree_gist is not needed).
+# room_load is the per-day capacity index: each room's occupancy as spans of days with a constant number of
+# students, so the busiest day of any period is one index lookup.
+_TABLE_DDL = """
+DROP TABLE IF EXISTS room_occupancy;
+CREATE TABLE room_occupancy (
+    studentid INT NOT NULL,
+    roomid    INT NOT NULL,
+    leaseid   INT NOT NULL,
+    bed_no    INT NOT NULL CHECK (bed_no > 0),
+    stay      DATERANGE NOT NULL,
+    PRIMARY KEY (studentid, roomid, leaseid)
+);
+DROP TABLE IF EXISTS room_load;
+CREATE TABLE room_load (
+    roomid INT NOT NULL,
+    span   DATERANGE NOT NULL,
+    used   INT NOT NULL
+);
+"""
+# Spans between consecutive check-in / check-out days with the number of stays covering them
+_LOAD_SQL = """
+SELECT s.roomid, daterange(s.day, s.next_day), s.used
+FROM (SELECT d.roomid, d.day, lead(d.day) OVER (PARTITION BY d.roomid ORDER BY d.day) AS next_day,
+             sum(d.delta) OVER (PARTITION BY d.roomid ORDER BY d.day ROWS UNBOUNDED PRECEDING)::INT AS used
+      FROM (SELECT e.roomid, e.day, sum(e.delta) AS delta
+            FROM (SELECT o.roomid, lower(o.stay) AS day, 1 AS delta FROM room_occupancy o {where}
+                  UNION ALL
+                  SELECT o.roomid, upper(o.stay), -1 FROM room_occupancy o {where}) e
+            GROUP BY e.roomid, e.day) d) s
+WHERE s.used > 0
+"""
+_INDEX_DDL = """
+ALTER TABLE room_occupancy ADD CONSTRAINT room_occupancy_no_double_booking EXCLUDE USING gist (
+    int4range(roomid, roomid, '[]') WITH &&,
+    int4range(bed_no, bed_no, '[]') WITH &&,
+    stay WITH &&
+);
+-- Cover the availability queries, which then read the index only
+CREATE INDEX idx_room_occupancy_stay ON room_occupancy USING gist (stay) INCLUDE (roomid, bed_no, studentid);
+CREATE INDEX idx_room_occupancy_roomid ON room_occupancy (roomid);
+CREATE INDEX idx_room_load_span ON room_load USING gist (span) INCLUDE (roomid, used);
+CREATE INDEX idx_room_load_roomid ON room_load (roomid);
+ANALYZE room_occupancy;
+ANALYZE room_load;
+"""
+_FUNCTIONS_DDL = """
+-- Rebuilds one room's spans in room_load from its stays
+CREATE OR REPLACE FUNCTION occupancy_load_refresh(p_room_id INT)
+RETURNS VOID LANGUAGE sql AS $$
+    DELETE FROM room_load WHERE roomid = p_room_id;
+    INSERT INTO room_load (roomid, span, used)
+""" + _LOAD_SQL.format(where="WHERE o.roomid = p_room_id") + """;
+$$;
+
+-- Keeps room_occupancy and room_load in step with rental and gives every new stay the lowest free bed of its room
+CREATE OR REPLACE FUNCTION occupancy_sync()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_stay DATERANGE;
+    v_max INT;
+    v_used INT[];
+    v_bed INT;
+    v_peak INT;
+    v_ends DATE[];
+    v_students INT[] := '{}';
+    v_leases INT[] := '{}';
+    v_beds INT[] := '{}';
+    v_stays DATERANGE[] := '{}';
+    v_row RECORD;
+BEGIN
+    -- Locking the room makes concurrent changes to the same room pick beds and rebuild its spans one at a time
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM 1 FROM room WHERE roomid = OLD.roomid FOR UPDATE;
+        DELETE FROM room_occupancy
+        WHERE studentid = OLD.studentid AND roomid = OLD.roomid AND leaseid = OLD.leaseid;
+        PERFORM occupancy_load_refresh(OLD.roomid);
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+
+    v_stay := daterange(NEW.checkindate, NEW.checkoutdate, '[]');
+    SELECT maxpeople INTO v_max FROM room WHERE roomid = NEW.roomid FOR UPDATE;
+    SELECT array_agg(bed_no) INTO v_used
+    FROM room_occupancy
+    WHERE roomid = NEW.roomid AND stay && v_stay;
+    SELECT b INTO v_bed
+    FROM generate_series(1, v_max) b
+    WHERE b <> ALL (COALESCE(v_used, '{}'))
+    ORDER BY b
+    LIMIT 1;
+
+    IF v_bed IS NOT NULL THEN
+        INSERT INTO room_occupancy (studentid, roomid, leaseid, bed_no, stay)
+        VALUES (NEW.studentid, NEW.roomid, NEW.leaseid, v_bed, v_stay);
+        PERFORM occupancy_load_refresh(NEW.roomid);
+        RETURN NEW;
+    END IF;
+
+    -- Stays keep their bed, so after deletes and updates the room can have a place on every day of the
+    -- stay without one bed being free for all of it: only the busiest day decides
+    SELECT max(l.used) INTO v_peak FROM room_load l WHERE l.roomid = NEW.roomid AND l.span && v_stay;
+    IF COALESCE(v_peak, 0) >= v_max THEN
+        RAISE EXCEPTION 'Cannot add more students to Room %: MaxPeople (%) exceeded between % and %',
+            NEW.roomid, v_max, NEW.checkindate, NEW.checkoutdate;
+    END IF;
+
+    -- Re-pack the room's beds as assign_beds does: by check-in date, each stay in the lowest bed free again
+    v_ends := array_fill(NULL::DATE, ARRAY[v_max]);
+    FOR v_row IN SELECT * FROM (SELECT o.studentid, o.leaseid, o.stay FROM room_occupancy o WHERE o.roomid = NEW.roomid
+                                UNION ALL SELECT NEW.studentid, NEW.leaseid, v_stay) s
+                 ORDER BY lower(s.stay), upper(s.stay) LOOP
+        v_bed := NULL;
+        FOR b IN 1..v_max LOOP
+            IF v_ends[b] IS NULL OR v_ends[b] <= lower(v_row.stay) THEN
+                v_bed := b;
+                EXIT;
+            END IF;
+        END LOOP;
+        IF v_bed IS NULL THEN  -- Other stays of the room exceed a lowered MaxPeople
+            RAISE EXCEPTION 'Cannot add more students to Room %: MaxPeople (%) exceeded between % and %',
+                NEW.roomid, v_max, NEW.checkindate, NEW.checkoutdate;
+        END IF;
+        v_ends[v_bed] := upper(v_row.stay);
+        v_students := v_students || v_row.studentid;
+        v_leases := v_leases || v_row.leaseid;
+        v_beds := v_beds || v_bed;
+        v_stays := v_stays || v_row.stay;
+    END LOOP;
+    DELETE FROM room_occupancy WHERE roomid = NEW.roomid;
+    INSERT INTO room_occupancy (studentid, roomid, leaseid, bed_no, stay)
+    SELECT u.studentid, NEW.roomid, u.leaseid, u.bed_no, u.stay
+    FROM unnest(v_students, v_leases, v_beds, v_stays) AS u (studentid, leaseid, bed_no, stay);
+    PERFORM occupancy_load_refresh(NEW.roomid);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rooms with a place on every day of the period; free_beds counts the places left on the busiest day
+CREATE OR REPLACE FUNCTION free_rooms(p_from DATE, p_to DATE)
+RETURNS TABLE (roomid INT, buildingid INT, buildingname VARCHAR, apartmentid INT, floornumber INT,
+               hasbalcony BOOLEAN, maxpeople INT, free_beds INT)
+LANGUAGE sql STABLE AS $$
+    SELECT r.roomid, r.buildingid, b.buildingname, r.apartmentid, a.floornumber, r.hasbalcony, r.maxpeople,
+           r.maxpeople - COALESCE(u.used, 0)
+    FROM room r
+    JOIN apartment a ON a.apartmentid = r.apartmentid AND a.buildingid = r.buildingid
+    JOIN building b ON b.buildingid = r.buildingid
+    LEFT JOIN (SELECT l.roomid, max(l.used) AS used
+               FROM room_load l
+               WHERE l.span && daterange(p_from, p_to, '[]')
+               GROUP BY l.roomid) u ON u.roomid = r.roomid
+    WHERE COALESCE(u.used, 0) < r.maxpeople
+    ORDER BY b.buildingname, r.roomid
+$$;
+
+-- Free rooms ranked for a student: never with roommates of another gender, then most roommates of the
+-- same major, then the fullest room (keeps empty rooms for groups), then rooms with a balcony
+CREATE OR REPLACE FUNCTION best_room_for_student(p_student_id INT, p_from DATE, p_to DATE)
+RETURNS TABLE (roomid INT, buildingname VARCHAR, floornumber INT, hasbalcony BOOLEAN, free_beds INT,
+               roommates INT, same_major INT)
+-- The planner expects a few free rooms where there are thousands; probing each room's stays in a nested loop
+-- is then several times slower than hashing the overlapping stays once
+LANGUAGE sql STABLE SET enable_nestloop = off AS $$
+    WITH me AS (
+        SELECT s.gender, s.major FROM student s WHERE s.studentid = p_student_id
+    ), f AS (
+        SELECT * FROM free_rooms(p_from, p_to)
+    ), mates AS (
+        -- Only the free rooms' stays are looked at, so few students are joined
+        SELECT o.roomid,
+               count(*)::INT AS roommates,
+               (count(*) FILTER (WHERE s.major = me.major))::INT AS same_major,
+               bool_and(s.gender = me.gender) AS same_gender
+        FROM (SELECT DISTINCT o.roomid, o.studentid
+              FROM room_occupancy o
+              JOIN f ON f.roomid = o.roomid
+              WHERE o.stay && daterange(p_from, p_to, '[]') AND o.studentid <> p_student_id) o
+        JOIN student s ON s.studentid = o.studentid
+        CROSS JOIN me
+        GROUP BY o.roomid
+    )
+    SELECT f.roomid, f.buildingname, f.floornumber, f.hasbalcony, f.free_beds,
+           COALESCE(m.roommates, 0), COALESCE(m.same_major, 0)
+    FROM f
+    LEFT JOIN mates m ON m.roomid = f.roomid
+    WHERE EXISTS (SELECT 1 FROM me) AND COALESCE(m.same_gender, TRUE)
+    ORDER BY COALESCE(m.same_major, 0) DESC, f.free_beds, f.hasbalcony DESC, f.roomid
+$$;
+"""
+# Replaces enforce_max_people, which only counted stays covering CURRENT_DATE
+_TRIGGERS_DDL = """
+DROP TRIGGER IF EXISTS enforce_max_people ON rental;
+DROP TRIGGER IF EXISTS occupancy_sync_trigger ON rental;
+CREATE TRIGGER occupancy_sync_trigger
+AFTER INSERT OR UPDATE OR DELETE ON rental
+FOR EACH ROW
+EXECUTE FUNCTION occupancy_sync();
+"""
+
+
+def assign_beds(rentals: Iterable[Tuple]) -> Iterator[Tuple]:
+    """
+    Give each stay the lowest bed that is free for all of it.
+
+    Args:
+        rentals: (studentid, roomid, leaseid, checkindate, checkoutdate, maxpeople) sorted by room, then check-in
+
+    Yields:
+        (studentid, roomid, leaseid, bed_no, checkindate, checkoutdate); bed_no is None when the room is full
+    """
+    # Greedy by check-in date uses the fewest beds for intervals, so a stay only fails when the room really
+    # holds MaxPeople other students on one of its days
+    room, bed_ends = None, []
+    for studentid, roomid, leaseid, check_in, check_out, max_people in rentals:
+        if roomid != room:
+            room, bed_ends = roomid, [None] * max_people
+        bed = next((b for b, end in enumerate(bed_ends) if end is None or end < check_in), None)
+        if bed is not None:
+            bed_ends[bed] = check_out
+        yield studentid, roomid, leaseid, None if bed is None else bed + 1, check_in, check_out
+
+
+def install(conn) -> Dict[str, Any]:
+    """
+    Build room_occupancy and room_load from the existing rentals and install their functions and trigger.
+
+    Runs in one transaction with rental locked against writes. Stays that do not fit their room
+    (existing overbookings) are left out and reported.
+    """
+    started = time.perf_counter()
+    buffer, placed, conflicts = io.StringIO(), 0, []
+    with conn.cursor() as cursor:
+        cursor.execute("LOCK TABLE rental IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(_TABLE_DDL)
+        cursor.execute("""
+                       SELECT rt.studentid, rt.roomid, rt.leaseid, rt.checkindate, rt.checkoutdate, r.maxpeople
+                       FROM rental rt
+                       JOIN room r ON r.roomid = rt.roomid
+                       ORDER BY rt.roomid, rt.checkindate, rt.checkoutdate
+                       """)
+        for studentid, roomid, leaseid, bed, check_in, check_out in assign_beds(cursor):
+            if bed is None:
+                conflicts.append({'studentid': studentid, 'roomid': roomid, 'leaseid': leaseid,
+                                  'checkindate': check_in, 'checkoutdate': check_out})
+                continue
+            buffer.write(f"{studentid}\t{roomid}\t{leaseid}\t{bed}\t[{check_in},{check_out}]\n")
+            placed += 1
+        buffer.seek(0)
+        cursor.copy_expert("COPY room_occupancy (studentid, roomid, leaseid, bed_no, stay) FROM STDIN", buffer)
+        cursor.execute("INSERT INTO room_load (roomid, span, used)" + _LOAD_SQL.format(where=""))
+        cursor.execute(_INDEX_DDL)  # Built once over the loaded rows, faster than maintaining it per row
+        cursor.execute(_FUNCTIONS_DDL)
+        cursor.execute(_TRIGGERS_DDL)
+    conn.commit()
+    invalidate_shared('schema', 'data')  # New tables and triggers, for app sessions that cached the old state
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for conflict in conflicts:
+        logger.warning(f"Rental does not fit its room and was not indexed: {conflict}")
+    logger.info(f"Occupancy index built: {placed} stays in {elapsed_ms:.0f} ms, {len(conflicts)} conflicts")
+    return {'stays': placed, 'conflicts': conflicts, 'elapsed_ms': elapsed_ms}
+
+
+def generate_data(conn, rooms: int, rentals: int, rng: random.Random) -> None:
+    """Create minimal dorm tables in an empty database and fill them with busy but never overbooked rooms"""
+    with conn.cursor() as cursor:
+        per_apartment, apartments = 4, rooms // 4
+        cursor.execute("""
+            CREATE TYPE gender_type AS ENUM ('Male', 'Female');
+            CREATE TYPE major_type AS ENUM ('Computer Science', 'Mathematics', 'Physics', 'Biology', 'Chemistry');
+            CREATE TABLE student (studentid INT PRIMARY KEY, gender gender_type NOT NULL, major major_type NOT NULL);
+            CREATE TABLE building (buildingid INT PRIMARY KEY, buildingname VARCHAR(100) NOT NULL);
+            CREATE TABLE apartment (apartmentid INT, buildingid INT, floornumber INT NOT NULL,
+                                    PRIMARY KEY (apartmentid, buildingid));
+            CREATE TABLE room (roomid INT PRIMARY KEY, maxpeople INT NOT NULL, hasbalcony BOOLEAN NOT NULL,
+                               apartmentid INT NOT NULL, buildingid INT NOT NULL);
+            CREATE TABLE rental (studentid INT, roomid INT, leaseid INT, checkindate DATE NOT NULL,
+                                 checkoutdate DATE NOT NULL, PRIMARY KEY (studentid, roomid, leaseid));
+            CREATE INDEX idx_rental_roomid ON rental (roomid);
+            """)
+        cursor.execute("""
+            INSERT INTO building SELECT g, 'Building ' || g FROM generate_series(1, %(b)s) g;
+            INSERT INTO apartment SELECT g, 1 + g %% %(b)s, 1 + g %% 8 FROM generate_series(1, %(a)s) g;
+            INSERT INTO room SELECT g, 1 + g %% 3, g %% 5 = 0, 1 + (g - 1) / %(p)s, 1 + (1 + (g - 1) / %(p)s) %% %(b)s
+            FROM generate_series(1, %(r)s) g;
+            INSERT INTO student SELECT g, (ARRAY['Male', 'Female'])[1 + g %% 2]::gender_type,
+                (enum_range(NULL::major_type))[1 + g %% 5] FROM generate_series(1, %(s)s) g;
+            """, {'b': max(1, apartments // 25), 'a': apartments, 'p': per_apartment, 'r': rooms,
+                  's': rentals // 4})
+        # Consecutive stays per bed with gaps between them, so rooms are busy but never overbooked
+        buffer, lease = io.StringIO(), 0
+        stays_per_bed = max(1, rentals // (rooms * 2))
+        for roomid in range(1, rooms + 1):
+            for bed in range(1 + roomid % 3):
+                day = date(2015, 1, 1) + timedelta(days=rng.randrange(120))
+                for _ in range(stays_per_bed):
+                    if lease >= rentals:
+                        break
+                    lease += 1
+                    length = rng.randrange(60, 400)
+                    buffer.write(f"{rng.randrange(1, rentals // 4)}\t{roomid}\t{lease}\t{day}\t"
+                                 f"{day + timedelta(days=length)}\n")
+                    day += timedelta(days=length + rng.randrange(1, 160))
+        buffer.seek(0)
+        cursor.copy_expert("COPY rental FROM STDIN", buffer)
+        cursor.execute("ANALYZE")
+    conn.commit()
+
+
+def _timed(cursor, sql_text: str, params: List[Any], repeat: int) -> Tuple[float, int]:
+    """Median time of a query in milliseconds, and its row count"""
+    timings, rows = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql_text, params)
+        rows = len(cursor.fetchall())
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2], rows
+
+
+def benchmark(dsn: str, rooms: int = 20000, rentals: int = 1000000, repeat: int = 5, seed: int = 7) -> Dict[str, Any]:
+    """
+    Time free_rooms and best_room_for_student on generated data in a scratch database.
+
+    The former scan (rental stays checked against MaxPeople on every call) is timed on the same data.
+    """
+    rng = random.Random(seed)
+    scratch = f"occupancy_bench_{int(time.time())}"
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE {scratch}")
+    from backup_manager import with_database  # Same DSN, other database
+    conn = psycopg2.connect(with_database(dsn, scratch))
+    try:
+        generate_data(conn, rooms, rentals, rng)
+        stats = install(conn)
+        start, end = date(2020, 9, 1), date(2021, 6, 30)
+        with conn.cursor() as cursor:
+            former_ms, former_rows = _timed(cursor, """
+                SELECT r.roomid FROM room r
+                WHERE (SELECT count(*) FROM rental rt WHERE rt.roomid = r.roomid
+                       AND rt.checkindate <= %s AND rt.checkoutdate >= %s) < r.maxpeople
+                """, [end, start], repeat)
+            free_ms, free_rows = _timed(cursor, "SELECT * FROM free_rooms(%s, %s)", [start, end], repeat)
+            best_ms, _ = _timed(cursor, "SELECT * FROM best_room_for_student(%s, %s, %s) LIMIT 5",
+                                [1, start, end], repeat)
+            cursor.execute("SELECT count(*) FROM rental")
+            total = cursor.fetchone()[0]
+        conn.rollback()
+    finally:
+        conn.close()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS {scratch} WITH (FORCE)")
+        admin.close()
+    return {'rentals': total, 'rooms': rooms, 'install_ms': round(stats['elapsed_ms'], 1),
+            'former_scan_ms': round(former_ms, 2), 'former_rows': former_rows,
+            'free_rooms_ms': round(free_ms, 2), 'free_rooms_rows': free_rows,
+            'best_room_ms': round(best_ms, 2)}
+
+
+def main():
+    """Build the occupancy index or benchmark it"""
+    parser = argparse.ArgumentParser(description="Per-bed occupancy index for room availability")
+    parser.add_argument("--dsn", required=True, help="Connection string of the database")
+    parser.add_argument("--install", action="store_true",
+                        help="Build room_occupancy and room_load from rental and install free_rooms, "
+                             "best_room_for_student and the rental trigger")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Time the queries on generated data in a scratch database")
+    parser.add_argument("--rooms", type=int, default=20000, help="Rooms generated for --benchmark")
+    parser.add_argument("--rentals", type=int, default=1000000, help="Rentals generated for --benchmark")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.install:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            stats = install(conn)
+        finally:
+            conn.close()
+        print(f"{stats['stays']:,} stays indexed in {stats['elapsed_ms']:,.0f} ms; "
+              f"{len(stats['conflicts'])} rentals exceed their room's MaxPeople")
+    if args.benchmark:
+        result = benchmark(args.dsn, args.rooms, args.rentals)
+        print(f"{result['rentals']:,} rentals in {result['rooms']:,} rooms (index built in "
+              f"{result['install_ms']:,.0f} ms)")
+        print(f"  former scan:            {result['former_scan_ms']:>9,.2f} ms ({result['former_rows']:,} rooms)")
+        print(f"  free_rooms:             {result['free_rooms_ms']:>9,.2f} ms ({result['free_rooms_rows']:,} rooms)")
+        print(f"  best_room_for_student:  {result['best_room_ms']:>9,.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
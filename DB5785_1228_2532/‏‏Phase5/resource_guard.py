@@ -0,0 +1,178 @@
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import re
+import time
+import pandas as pd
+import psycopg2
+from psycopg2 import errors
+from sql_parser import split_sql, statement_code
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Statements that can be read through a server-side cursor (DECLARE ... CURSOR FOR)
+STREAMABLE_COMMANDS = ('SELECT', 'WITH', 'VALUES', 'TABLE')
+# Statements that only read; EXPLAIN ANALYZE of a write counts as a write
+READ_COMMANDS = STREAMABLE_COMMANDS + ('EXPLAIN', 'SHOW')
+# Statements whose output is small whatever the data (a plan, a setting, a procedure's OUT parameters)
+_BOUNDED_COMMANDS = ('EXPLAIN', 'SHOW', 'CALL')
+_DATA_MODIFYING = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b', re.IGNORECASE)
+_ROW_LOCK = re.compile(r'\bFOR\s+(?:NO\s+KEY\s+)?UPDATE\b', re.IGNORECASE)  # SELECT ... FOR UPDATE only reads
+_MAIN_COMMANDS = ('SELECT', 'VALUES', 'TABLE', 'INSERT', 'UPDATE', 'DELETE', 'MERGE')
+_TOKEN = re.compile(r"[A-Za-z_][A-Za-z0-9_$]*|[();]")
+_LEADING_WORD = re.compile(r"[\s(]*([A-Za-z]+)")
+
+
+class QueryPolicy:
+    """Resource limits for user-run queries (0 or None means unlimited)"""
+    FIELDS = ('statement_timeout_ms', 'lock_timeout_ms', 'work_mem', 'max_rows', 'max_result_bytes')
+
+    def __init__(self, statement_timeout_ms: int = 30000, lock_timeout_ms: int = 5000, work_mem: str = '64MB',
+                 max_rows: int = 100000, max_result_bytes: int = 100 * 1024 * 1024):
+        self.statement_timeout_ms = statement_timeout_ms  # Server-side statement_timeout and total fetch time
+        self.lock_timeout_ms = lock_timeout_ms  # Server-side lock_timeout
+        self.work_mem = work_mem  # Server-side work_mem for sorts and hashes
+        self.max_rows = max_rows  # Rows fetched before the result is cut off
+        self.max_result_bytes = max_result_bytes  # In-memory DataFrame size before the result is cut off
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def merged(self, **overrides) -> 'QueryPolicy':
+        """Return a copy with per-query overrides applied (None keeps the session value)"""
+        values = self.as_dict()
+        values.update({k: v for k, v in overrides.items() if v is not None})
+        return QueryPolicy(**values)
+
+    def server_settings(self) -> List[Tuple[str, str]]:
+        """GUC settings applied with SET LOCAL semantics for the query's transaction"""
+        settings = [('statement_timeout', f"{int(self.statement_timeout_ms or 0)}ms"),
+                    ('lock_timeout', f"{int(self.lock_timeout_ms or 0)}ms")]
+        if self.work_mem:
+            settings.append(('work_mem', str(self.work_mem)))
+        return settings
+
+
+def apply_server_settings(cursor, policy: QueryPolicy) -> None:
+    """Apply a policy's settings to the current transaction in one round trip"""
+    settings = policy.server_settings()
+    calls = ', '.join(['set_config(%s, %s, true)'] * len(settings))
+    cursor.execute(f"SELECT {calls}", [value for setting in settings for value in setting])
+
+
+def classify_statement(sql_text: str) -> Dict[str, Any]:
+    """
+    Shape of a statement, read by the SQL lexer: comments, literals and quoted identifiers are skipped.
+
+    Returns:
+        Dict with command (first keyword, past comments and opening parentheses), single (one statement),
+        writes (data-modifying anywhere), main and main_at (the statement after a WITH list, and its offset),
+        end (offset of the first statement's end), and returns_rows and bounded (of the last statement: it
+        returns rows, and their number does not depend on the data, as for EXPLAIN, SHOW and CALL)
+    """
+    code = statement_code(sql_text)
+    leading = _LEADING_WORD.match(code)
+    shape = {'command': leading.group(1).upper() if leading else '', 'single': True, 'main': None, 'main_at': None,
+             'end': len(code.rstrip())}
+    shape['writes'] = bool(_DATA_MODIFYING.search(_ROW_LOCK.sub(' ', code)))
+    depth, returning = 0, False
+    for token in _TOKEN.finditer(code):
+        word = token.group().upper()
+        if word == '(':
+            depth += 1
+        elif word == ')':
+            depth = max(depth - 1, 0)
+        elif word == ';':
+            if depth == 0:
+                shape['end'] = token.start()
+                shape['single'] = not code[token.end():].strip(' \t\r\n;')
+                break
+        elif depth == 0 and shape['main'] is None and word in _MAIN_COMMANDS:
+            shape['main'], shape['main_at'] = word, token.start()
+        elif depth == 0 and word == 'RETURNING':
+            returning = True
+    if not shape['single']:
+        last = classify_statement(split_sql(sql_text)[-1]['sql'])
+        shape['returns_rows'], shape['bounded'] = last['returns_rows'], last['bounded']
+    else:
+        rows = ('SELECT', 'VALUES', 'TABLE')
+        shape['returns_rows'] = shape['main'] in rows or shape['command'] in rows + _BOUNDED_COMMANDS or returning
+        shape['bounded'] = shape['command'] in _BOUNDED_COMMANDS
+    return shape
+
+
+def is_streamable(sql_text: str) -> bool:
+    """Check if a statement can be read through a server-side cursor"""
+    shape = classify_statement(sql_text)
+    # DECLARE CURSOR takes one statement and rejects data-modifying statements in WITH
+    return shape['single'] and shape['command'] in STREAMABLE_COMMANDS and not shape['writes']
+
+
+def is_read_statement(sql_text: str) -> bool:
+    """Check if a statement only reads (may go to a replica)"""
+    shape = classify_statement(sql_text)
+    return shape['single'] and shape['command'] in READ_COMMANDS and not shape['writes']
+
+
+def row_limited_sql(sql_text: str, max_rows: Optional[int]) -> Optional[str]:
+    """
+    A write that returns rows (INSERT/UPDATE/DELETE ... RETURNING, data-modifying WITH), rewritten so the
+    server sends at most max_rows + 1 of them; None when the statement needs no rewrite or cannot take one.
+
+    The write itself still applies to every row: only the returned rows are cut, so psycopg2 (which loads
+    a client-side result at once) never holds more than the row limit.
+    """
+    shape = classify_statement(sql_text)
+    if not max_rows or not shape['single'] or not shape['writes'] or not shape['returns_rows']:
+        return None
+    limit = f"\n) SELECT * FROM guarded_rows LIMIT {int(max_rows) + 1}"
+    if shape['command'] in ('INSERT', 'UPDATE', 'DELETE') and shape['main_at'] is not None:
+        return f"WITH guarded_rows AS (\n{sql_text[shape['main_at']:shape['end']]}{limit}"
+    if shape['command'] == 'WITH' and shape['main'] in ('SELECT', 'VALUES', 'TABLE', 'INSERT', 'UPDATE', 'DELETE'):
+        # The main statement joins the WITH list, after the CTEs it reads from
+        ctes = sql_text[:shape['main_at']].rstrip()
+        return f"{ctes},\nguarded_rows AS (\n{sql_text[shape['main_at']:shape['end']]}{limit}"
+    return None
+
+
+def fetch_limited(cursor, policy: QueryPolicy, started: float,
+                  batch_size: int = 2000) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Fetch a result in batches, stopping at the policy's row, byte and time limits"""
+    # Purpose: With a server-side cursor every FETCH is a separate statement, so the total fetch time is
+    # also checked on the client; stopping early means the server never produces the remaining rows
+    frames, rows, size, reason = [], 0, 0, None
+    max_rows = policy.max_rows or None
+    while True:
+        wanted = batch_size if max_rows is None else min(batch_size, max_rows - rows)
+        if wanted <= 0:
+            if cursor.fetchone() is not None:
+                reason = f"row limit of {max_rows:,} reached"
+            break
+        batch = cursor.fetchmany(wanted)  # A server-side cursor only has a description after the first FETCH
+        if not batch:
+            break
+        frame = pd.DataFrame.from_records(batch, columns=[col[0] for col in cursor.description])
+        frames.append(frame)
+        rows += len(frame)
+        size += int(frame.memory_usage(deep=True).sum())
+        if policy.max_result_bytes and size > policy.max_result_bytes:
+            reason = f"result size limit of {policy.max_result_bytes / 1024 / 1024:.0f} MB reached"
+            break
+        if policy.statement_timeout_ms and (time.perf_counter() - started) * 1000 > policy.statement_timeout_ms:
+            reason = f"fetch time limit of {policy.statement_timeout_ms / 1000:.0f} s reached"
+            break
+        if len(batch) < wanted:
+            break
+    if frames:
+        return pd.concat(frames, ignore_index=True), reason
+    columns = [col[0] for col in cursor.description] if cursor.description else []
+    return pd.DataFrame(columns=columns), reason
+
+
+def classify_error(error: psycopg2.Error) -> str:
+    """Map a database error to a guard status"""
+    if isinstance(error, errors.QueryCanceled):
+        return 'timeout' if 'statement timeout' in str(error) else 'cancelled'
+    if isinstance(error, errors.LockNotAvailable):
+        return 'lock_timeout'
+    return 'error'
@@ -0,0 +1,206 @@
+from typing import Any, Callable, Dict, Iterable, Optional
+import getpass
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Environment variable with the cache directory shared by all app processes
+CACHE_DIR_ENV = "DB_RESULT_CACHE_DIR"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key          TEXT PRIMARY KEY,
+    tags         TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    size         INTEGER NOT NULL,
+    created      REAL NOT NULL,
+    expires      REAL,
+    last_access  REAL NOT NULL,
+    value        BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+"""
+
+
+def make_key(*parts: Any) -> str:
+    """Build a cache key by hashing the parts that identify a result (database, SQL text, parameters)"""
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def default_cache_dir() -> str:
+    """Cache directory from DB_RESULT_CACHE_DIR, or a per-user folder in the system temp directory"""
+    user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(tempfile.gettempdir(), f'db_result_cache_{user}')
+
+
+def _private_directory(directory: str) -> None:
+    """Create the cache directory for the current user only, and refuse one that others can reach"""
+    # Purpose: The temp folder is shared; a directory created there first by another user, or opened
+    # to other users, would let them read the cached metadata or plant entries for every app process
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        return  # Windows: the temp folder is already per user
+    info = os.stat(directory)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"Cache directory {directory} is owned by another user")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"Cache directory {directory} is accessible to other users "
+                              f"(mode {oct(info.st_mode & 0o777)}); run chmod 700 on it")
+
+
+class SharedResultCache:
+    """Result and metadata cache in a SQLite file shared by all sessions and processes"""
+    # Purpose: Values (lists, dicts, strings, numbers) are stored as JSON in one SQLite database in WAL
+    # mode, so every Streamlit session and worker process reads the same entries and they survive restarts.
+    # JSON rather than pickle: reading an entry can never run code, whoever wrote the file.
+    # - Entries are tagged (e.g. table names, 'schema'); invalidate() drops all entries with a tag,
+    #   for every process at once
+    # - The stored content hash is checked on read, so a damaged entry is discarded, not returned
+    # - Total size is capped; the least recently read entries are evicted first
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 256 * 1024 * 1024,
+                 default_ttl_s: Optional[float] = 300):
+        self.directory = directory or default_cache_dir()
+        self.path = os.path.join(self.directory, 'results.sqlite')
+        self.max_bytes = max_bytes  # Size cap over all entries
+        self.default_ttl_s = default_ttl_s  # Lifetime of entries without an explicit ttl (None = no expiry)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        _private_directory(self.directory)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # Readers in other processes do not block writers
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a cached value, or None if missing, expired or damaged"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, content_hash, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[2] is not None and row[2] < now):
+                self.misses += 1
+                return None
+            if hashlib.sha256(row[0]).hexdigest() != row[1]:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                logger.warning(f"Discarded damaged cache entry {key}")
+                return None
+            try:
+                value = json.loads(row[0])
+            except ValueError:  # Not written by this version of the cache
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, tags: Iterable[str] = (), ttl_s: Optional[float] = None) -> None:
+        """Store a value under a key with invalidation tags"""
+        try:
+            blob = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        except (TypeError, ValueError) as e:
+            logger.info(f"Value is not JSON-serializable, not caching it: {e}")
+            return
+        if len(blob) > self.max_bytes // 4:
+            logger.info(f"Result of {len(blob):,} bytes is too large to cache")
+            return
+        ttl_s = self.default_ttl_s if ttl_s is None else ttl_s
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, tags, content_hash, size, created, expires, last_access, value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, self._encode_tags(tags), hashlib.sha256(blob).hexdigest(), len(blob), now,
+                 now + ttl_s if ttl_s else None, now, blob))
+            self._evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], tags: Iterable[str] = (),
+                       ttl_s: Optional[float] = None) -> Any:
+        """Return the cached value, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, tags, ttl_s)
+        return value
+
+    def invalidate(self, *tags: str) -> int:
+        """Drop all entries carrying any of the tags; returns the number of entries removed"""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                cursor = self._conn.execute("DELETE FROM entries WHERE instr(tags, ?) > 0", (f",{tag.lower()},",))
+                removed += cursor.rowcount
+        if removed:
+            logger.info(f"Invalidated {removed} cache entries for {', '.join(tags)}")
+        return removed
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, stored bytes and this process's hit rate"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0, 'path': self.path}
+
+    def _evict(self) -> None:
+        """Remove expired entries, then least recently read entries until under the size cap"""
+        self._conn.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims, freed = [], 0
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        logger.info(f"Evicted {len(victims)} cache entries ({freed:,} bytes)")
+
+    @staticmethod
+    def _encode_tags(tags: Iterable[str]) -> str:
+        """Store tags as ',a,b,' so a tag can be matched as the substring ',tag,'"""
+        return ',' + ','.join(tag.lower() for tag in tags) + ','
+
+
+# Caches shared by all sessions of the process, keyed by directory
+_caches: Dict[str, SharedResultCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_shared_cache(directory: Optional[str] = None) -> SharedResultCache:
+    """Get the process-wide cache for a directory (defaults to default_cache_dir())"""
+    directory = directory or default_cache_dir()
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = SharedResultCache(directory)
+            _caches[directory] = cache
+        return cache
+
+
+def invalidate_shared(*tags: str) -> None:
+    """Drop shared cache entries from a process that writes the database outside the app (CLI jobs)"""
+    # Purpose: The app only invalidates what it wrote itself; without this its sessions would serve row
+    # counts and results from before the job until the entries expire
+    try:
+        get_shared_cache().invalidate(*tags)
+    except Exception as e:  # No cache directory for this user, or it is not private; nothing to invalidate
+        logger.warning(f"Could not invalidate shared cache entries {tags}: {str(e)}")
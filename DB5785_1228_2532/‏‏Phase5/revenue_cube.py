@@ -0,0 +1,463 @@
+from typing import Any, Dict, Tuple
+import argparse
+import logging
+import time
+import psycopg2
+from result_cache import invalidate_shared
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Revenue and discounts of every stay (Rental row), summed per academic year (September to August), the month
+# the stay enters that year, the lease's manager and the room's building. As in
+# calculate_annual_revenue_and_discounts, a stay counts once at the full annual rate in each year it overlaps.
+_ANNUAL_RATE = "1000.0 * 12"
+_ACADEMIC_YEAR = "EXTRACT(YEAR FROM {date} + INTERVAL '4 months')::INT"  # 2024-09-01 .. 2025-08-31 -> 2025
+CUBES = {
+    'revenue_cube': {
+        'grain': ['academic_year', 'month', 'managerid', 'buildingid'],
+        'measures': ['stays', 'discounted_stays', 'revenue', 'discount_cost'],
+        'empty': 'stays'},
+    # Query 7 ranks managers by their discounted leases, whatever their stays
+    'lease_discount_rollup': {
+        'grain': ['month', 'managerid'],
+        'measures': ['leases', 'discounted_leases', 'discount_percent_sum'],
+        'empty': 'leases'},
+}
+REPORT_VIEWS = {None: 'revenue_by_year', 'manager': 'revenue_by_manager_year', 'building': 'revenue_by_building_year'}
+
+_TABLES_DDL = """
+DROP TABLE IF EXISTS revenue_cube CASCADE;
+CREATE TABLE revenue_cube (
+    academic_year INT NOT NULL,
+    month DATE NOT NULL,
+    managerid INT NOT NULL,
+    buildingid INT NOT NULL,
+    stays INT NOT NULL,
+    discounted_stays INT NOT NULL,
+    revenue NUMERIC NOT NULL,
+    discount_cost NUMERIC NOT NULL,
+    PRIMARY KEY (academic_year, month, managerid, buildingid)
+);
+CREATE INDEX idx_revenue_cube_empty ON revenue_cube (academic_year) WHERE stays = 0;
+
+DROP TABLE IF EXISTS lease_discount_rollup CASCADE;
+CREATE TABLE lease_discount_rollup (
+    month DATE NOT NULL,
+    managerid INT NOT NULL,
+    leases INT NOT NULL,
+    discounted_leases INT NOT NULL,
+    discount_percent_sum NUMERIC NOT NULL,
+    PRIMARY KEY (month, managerid)
+);
+CREATE INDEX idx_lease_discount_rollup_empty ON lease_discount_rollup (month) WHERE leases = 0;
+"""
+# Lease and room changes are applied through the stays of the changed rows
+_INDEX_DDL = "CREATE INDEX IF NOT EXISTS idx_rental_leaseid ON rental (leaseid);"
+
+
+def _stays_sql(rental: str, lease: str, room: str, weight: str = '1') -> str:
+    """revenue_cube rows of a set of stays; weight is +1 / -1 per changed row for trigger deltas"""
+    return f"""SELECT y.academic_year,
+               date_trunc('month', GREATEST(r.checkindate, make_date(y.academic_year - 1, 9, 1)))::DATE AS month,
+               l.managerid, rm.buildingid,
+               sum({weight})::INT AS stays,
+               COALESCE(sum({weight}) FILTER (WHERE l.discountpercent > 0), 0)::INT AS discounted_stays,
+               sum({weight} * {_ANNUAL_RATE} * (1 - l.discountpercent / 100)) AS revenue,
+               sum({weight} * {_ANNUAL_RATE} * (l.discountpercent / 100)) AS discount_cost
+        FROM {rental} r
+        JOIN {lease} l ON l.leaseid = r.leaseid
+        JOIN {room} rm ON rm.roomid = r.roomid
+        CROSS JOIN LATERAL generate_series({_ACADEMIC_YEAR.format(date='r.checkindate')},
+                                           {_ACADEMIC_YEAR.format(date='r.checkoutdate')}) AS y(academic_year)
+        GROUP BY 1, 2, 3, 4"""
+
+
+def _leases_sql(lease: str, weight: str = '1') -> str:
+    """lease_discount_rollup rows of a set of leases"""
+    return f"""SELECT date_trunc('month', l.contractdate)::DATE AS month, l.managerid,
+               sum({weight})::INT AS leases,
+               COALESCE(sum({weight}) FILTER (WHERE l.discountpercent > 0), 0)::INT AS discounted_leases,
+               COALESCE(sum({weight} * l.discountpercent) FILTER (WHERE l.discountpercent > 0), 0)
+                   AS discount_percent_sum
+        FROM {lease} l
+        GROUP BY 1, 2"""
+
+
+_RECOMPUTE_SQL = {'revenue_cube': _stays_sql('rental', 'lease', 'room'),
+                  'lease_discount_rollup': _leases_sql('lease')}
+
+
+def _delta_sql(name: str, rows_sql: str) -> str:
+    """Add the rows of a statement's delta to a cube and drop the groups left empty"""
+    spec = CUBES[name]
+    columns = ', '.join(spec['grain'] + spec['measures'])
+    updates = ', '.join(f"{measure} = c.{measure} + EXCLUDED.{measure}" for measure in spec['measures'])
+    return f"""
+        INSERT INTO {name} AS c ({columns})
+        {rows_sql}
+        ON CONFLICT ({', '.join(spec['grain'])}) DO UPDATE SET {updates};
+        DELETE FROM {name} WHERE {spec['empty']} = 0;"""
+
+
+def _signed(changed: str = "TRUE") -> Dict[str, str]:
+    """Transition rows with their weight: inserted, deleted, and both sides of the updated rows that changed"""
+    new_rows, old_rows = "SELECT *, 1 AS sign FROM new_rows", "SELECT *, -1 AS sign FROM old_rows"
+    return {'INSERT': f"({new_rows})", 'DELETE': f"({old_rows})",
+            'UPDATE': f"({new_rows} n WHERE {changed.format(this='n', other='old_rows')} UNION ALL "
+                      f"{old_rows} o WHERE {changed.format(this='o', other='new_rows')})"}
+
+
+# Updated rows only count when a column the cube reads changed (the keys cannot change under Rental's foreign keys)
+_LEASE_CHANGED = ("NOT EXISTS (SELECT 1 FROM {other} x WHERE x.leaseid = {this}.leaseid "
+                  "AND x.managerid = {this}.managerid AND x.discountpercent = {this}.discountpercent)")
+_ROOM_CHANGED = "NOT EXISTS (SELECT 1 FROM {other} x WHERE x.roomid = {this}.roomid AND x.buildingid = {this}.buildingid)"
+
+
+def _trigger_function(name: str, deltas: Dict[str, str]) -> str:
+    """A statement-level trigger function applying one delta per event"""
+    branches = ''.join(f"\n    {'IF' if i == 0 else 'ELSIF'} TG_OP = '{event}' THEN{sql}"
+                       for i, (event, sql) in enumerate(deltas.items()))
+    return f"""
+CREATE OR REPLACE FUNCTION {name}()
+RETURNS TRIGGER AS $$
+BEGIN{branches}
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _functions_ddl() -> str:
+    """The trigger functions of rental, lease and room"""
+    rentals, leases, rooms = _signed(), _signed(_LEASE_CHANGED), _signed(_ROOM_CHANGED)
+    leases_all = _signed()
+    return ''.join([
+        _trigger_function('revenue_cube_rental_apply', {
+            event: _delta_sql('revenue_cube', _stays_sql(rows, 'lease', 'room', 'r.sign'))
+            for event, rows in rentals.items()}),
+        _trigger_function('revenue_cube_lease_apply', {
+            'INSERT': _delta_sql('lease_discount_rollup', _leases_sql(leases_all['INSERT'], 'l.sign')),
+            'DELETE': _delta_sql('lease_discount_rollup', _leases_sql(leases_all['DELETE'], 'l.sign')),
+            'UPDATE': _delta_sql('lease_discount_rollup', _leases_sql(leases_all['UPDATE'], 'l.sign'))
+                      + _delta_sql('revenue_cube', _stays_sql('rental', leases['UPDATE'], 'room', 'l.sign'))}),
+        _trigger_function('revenue_cube_room_apply', {
+            'UPDATE': _delta_sql('revenue_cube', _stays_sql('rental', 'lease', rooms['UPDATE'], 'rm.sign'))}),
+    ])
+
+
+# Inserted and deleted leases have no stays yet / any more (Rental references them), rooms only move buildings
+_TRIGGERS = [('rental', 'INSERT'), ('rental', 'UPDATE'), ('rental', 'DELETE'),
+             ('lease', 'INSERT'), ('lease', 'UPDATE'), ('lease', 'DELETE'), ('room', 'UPDATE')]
+
+
+def _triggers_ddl() -> str:
+    """Statement-level triggers with transition tables, so a bulk statement updates each cube once"""
+    ddl = []
+    for table, event in _TRIGGERS:
+        trigger = f"revenue_cube_{table}_{event.lower()}"
+        tables = {'INSERT': "NEW TABLE AS new_rows", 'DELETE': "OLD TABLE AS old_rows",
+                  'UPDATE': "OLD TABLE AS old_rows NEW TABLE AS new_rows"}[event]
+        ddl.append(f"DROP TRIGGER IF EXISTS {trigger} ON {table};\n"
+                   f"CREATE TRIGGER {trigger} AFTER {event} ON {table} REFERENCING {tables} "
+                   f"FOR EACH STATEMENT EXECUTE FUNCTION revenue_cube_{table}_apply();\n")
+    return ''.join(ddl)
+
+
+_VIEWS_DDL = """
+CREATE VIEW revenue_by_year AS
+SELECT academic_year, sum(stays)::INT AS stays, sum(discounted_stays)::INT AS discounted_stays,
+       ROUND(sum(revenue), 2) AS total_revenue, ROUND(sum(discount_cost), 2) AS total_discount_cost
+FROM revenue_cube GROUP BY academic_year;
+
+CREATE VIEW revenue_by_manager_year AS
+SELECT academic_year, managerid, sum(stays)::INT AS stays, sum(discounted_stays)::INT AS discounted_stays,
+       ROUND(sum(revenue), 2) AS total_revenue, ROUND(sum(discount_cost), 2) AS total_discount_cost
+FROM revenue_cube GROUP BY academic_year, managerid;
+
+CREATE VIEW revenue_by_building_year AS
+SELECT academic_year, buildingid, sum(stays)::INT AS stays, sum(discounted_stays)::INT AS discounted_stays,
+       ROUND(sum(revenue), 2) AS total_revenue, ROUND(sum(discount_cost), 2) AS total_discount_cost
+FROM revenue_cube GROUP BY academic_year, buildingid;
+
+CREATE VIEW manager_discounts AS
+SELECT managerid, sum(leases)::INT AS leases, sum(discounted_leases)::INT AS discounted_leases,
+       sum(discount_percent_sum) / NULLIF(sum(discounted_leases), 0) AS average_discount
+FROM lease_discount_rollup GROUP BY managerid;
+"""
+
+
+def install(conn) -> Dict[str, Any]:
+    """Create and fill the cubes from the leases and stays and install their views and triggers"""
+    started = time.perf_counter()
+    rows = {}
+    with conn.cursor() as cursor:
+        # No lease, stay or room may change between the full build and the triggers taking over
+        cursor.execute("LOCK TABLE lease, rental, room IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(_INDEX_DDL)
+        cursor.execute(_TABLES_DDL)
+        for name, spec in CUBES.items():
+            cursor.execute(f"INSERT INTO {name} ({', '.join(spec['grain'] + spec['measures'])}) "
+                           f"{_RECOMPUTE_SQL[name]}")
+            rows[name] = cursor.rowcount
+            cursor.execute(f"ANALYZE {name}")
+        cursor.execute(_VIEWS_DDL)
+        cursor.execute(_functions_ddl())
+        cursor.execute(_triggers_ddl())
+    conn.commit()
+    invalidate_shared('schema', 'data')  # New tables and triggers, for app sessions that cached the old state
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Revenue cubes built in {elapsed_ms:.0f} ms: {rows}")
+    return {'rows': rows, 'elapsed_ms': elapsed_ms}
+
+
+def check(conn, sample: int = 20) -> Dict[str, Any]:
+    """
+    Compare every cube with a full recomputation from the leases and stays.
+
+    Returns:
+        Dict with elapsed_ms, mismatches (total) and per cube: stored_rows, expected_rows, mismatches and up
+        to `sample` differing rows (expected vs stored, NULL where a row is missing)
+    """
+    started = time.perf_counter()
+    result = {'mismatches': 0, 'cubes': {}}
+    with conn.cursor() as cursor:
+        for name, spec in CUBES.items():
+            match = ' AND '.join(f"e.{column} = c.{column}" for column in spec['grain'])
+            keys = ', '.join(f"COALESCE(e.{column}, c.{column})::TEXT AS {column}" for column in spec['grain'])
+            measures = ', '.join(f"e.{m} AS expected_{m}, c.{m} AS stored_{m}" for m in spec['measures'])
+            differs = ' OR '.join(f"e.{m} IS DISTINCT FROM c.{m}" for m in spec['measures'])
+            cursor.execute(f"""
+                WITH expected AS ({_RECOMPUTE_SQL[name]}),
+                diff AS (
+                    SELECT {keys}, {measures}
+                    FROM expected e
+                    FULL JOIN {name} c ON {match}
+                    WHERE {differs}
+                )
+                SELECT (SELECT count(*) FROM {name}), (SELECT count(*) FROM expected),
+                       (SELECT count(*) FROM diff), (SELECT json_agg(d) FROM (SELECT * FROM diff LIMIT %s) d)
+                """, [sample])
+            stored, expected, mismatches, rows = cursor.fetchone()
+            result['cubes'][name] = {'stored_rows': stored, 'expected_rows': expected,
+                                     'mismatches': mismatches, 'sample': rows or []}
+            result['mismatches'] += mismatches
+            if mismatches:
+                logger.warning(f"{name} differs from the leases and stays in {mismatches} rows")
+    conn.rollback()
+    result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def rebuild(conn) -> Dict[str, int]:
+    """Replace the cubes' rows with a full recomputation (repairs them after a failed check)"""
+    rows = {}
+    with conn.cursor() as cursor:
+        cursor.execute("LOCK TABLE lease, rental, room IN SHARE ROW EXCLUSIVE MODE")
+        for name, spec in CUBES.items():
+            cursor.execute(f"DELETE FROM {name}")
+            cursor.execute(f"INSERT INTO {name} ({', '.join(spec['grain'] + spec['measures'])}) "
+                           f"{_RECOMPUTE_SQL[name]}")
+            rows[name] = cursor.rowcount
+    conn.commit()
+    invalidate_shared('data')
+    logger.info(f"Revenue cubes rebuilt: {rows}")
+    return rows
+
+
+def _timed(cursor, sql_text: str, params=None) -> Tuple[float, list]:
+    """Time of one query in milliseconds, and its rows"""
+    started = time.perf_counter()
+    cursor.execute(sql_text, params)
+    rows = cursor.fetchall()
+    return (time.perf_counter() - started) * 1000, rows
+
+
+# calculate_annual_revenue_and_discounts and Query 7 as they were before the cube
+_LOOP_FUNCTION = """
+CREATE FUNCTION calculate_annual_revenue_and_discounts_loop(p_year INTEGER)
+RETURNS TABLE (total_revenue NUMERIC, total_discount_cost NUMERIC) AS $$
+DECLARE
+    lease_rec RECORD;
+    start_date DATE := MAKE_DATE(p_year - 1, 9, 1);
+    end_date DATE := MAKE_DATE(p_year, 8, 31);
+    base_rental_cost NUMERIC := 1000.0 * 12;
+    revenue NUMERIC := 0;
+    discount_cost NUMERIC := 0;
+BEGIN
+    FOR lease_rec IN
+        SELECT l.leaseid, l.discountpercent, r.checkindate, r.checkoutdate
+        FROM lease l
+        JOIN rental r ON l.leaseid = r.leaseid
+        WHERE r.checkindate <= end_date AND (r.checkoutdate >= start_date OR r.checkoutdate IS NULL)
+    LOOP
+        IF lease_rec.discountpercent < 0 OR lease_rec.discountpercent > 100 THEN
+            RAISE EXCEPTION 'Invalid discount percent % for lease %', lease_rec.discountpercent, lease_rec.leaseid;
+        END IF;
+        revenue := revenue + base_rental_cost * (1 - lease_rec.discountpercent / 100);
+        discount_cost := discount_cost + base_rental_cost * (lease_rec.discountpercent / 100);
+    END LOOP;
+    RETURN QUERY SELECT ROUND(revenue, 2), ROUND(discount_cost, 2);
+END;
+$$ LANGUAGE plpgsql;
+"""
+_QUERY_7 = """
+SELECT dm.managerid, dm.fullname, COUNT(l.leaseid) AS totaldiscounts, AVG(l.discountpercent) AS averagediscount
+FROM dorm_management dm
+JOIN lease l ON dm.managerid = l.managerid
+WHERE l.discountpercent > 0
+GROUP BY dm.managerid, dm.fullname
+ORDER BY totaldiscounts DESC, averagediscount DESC
+LIMIT (SELECT (COUNT(DISTINCT managerid) * 0.2) FROM dorm_management)"""
+
+_BENCHMARK_DDL = """
+CREATE TABLE dorm_management (managerid INT PRIMARY KEY, fullname VARCHAR(100) NOT NULL);
+CREATE TABLE room (roomid INT PRIMARY KEY, buildingid INT NOT NULL);
+CREATE TABLE lease (leaseid INT PRIMARY KEY, contractdate DATE NOT NULL,
+                    discountpercent NUMERIC(5,2) NOT NULL CHECK (discountpercent BETWEEN 0 AND 100),
+                    managerid INT NOT NULL);
+CREATE TABLE rental (studentid INT, roomid INT, leaseid INT, checkindate DATE NOT NULL, checkoutdate DATE NOT NULL,
+                     PRIMARY KEY (studentid, roomid, leaseid));
+CREATE INDEX idx_rental_roomid ON rental (roomid);
+INSERT INTO dorm_management SELECT m, 'Manager ' || m FROM generate_series(1, %(managers)s) m;
+INSERT INTO room SELECT r, 1 + r %% %(buildings)s FROM generate_series(1, %(rooms)s) r;
+"""
+# Ten years of leases, a third of them discounted; each lease is one stay of 10 to 22 months
+_LEASES_SQL = """
+INSERT INTO lease
+SELECT g, DATE '2015-01-01' + (random() * 3650)::INT,
+       CASE WHEN random() < 0.3 THEN round((random() * 30)::NUMERIC, 2) ELSE 0 END, 1 + g %% %(managers)s
+FROM generate_series(%(first)s, %(last)s) g;
+INSERT INTO rental
+SELECT l.leaseid, 1 + l.leaseid %% %(rooms)s, l.leaseid, l.contractdate + 14,
+       l.contractdate + 14 + 300 + (random() * 360)::INT
+FROM lease l WHERE l.leaseid BETWEEN %(first)s AND %(last)s;
+"""
+
+
+def benchmark(dsn: str, leases: int = 10000000, managers: int = 200, buildings: int = 100,
+              rooms: int = 50000) -> Dict[str, Any]:
+    """Time the annual function, Query 7 and a ten-year dashboard against the cube, in a scratch database"""
+    from backup_manager import with_database  # Same DSN, other database
+    from sql_catalog import shipped_statement
+    scratch = f"revenue_bench_{int(time.time())}"
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE {scratch}")
+    conn = psycopg2.connect(with_database(dsn, scratch))
+    sizes = {'managers': managers, 'buildings': buildings, 'rooms': rooms}
+    result = {'leases': leases, 'years': list(range(2016, 2026))}
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_BENCHMARK_DDL, sizes)
+            started = time.perf_counter()
+            cursor.execute(_LEASES_SQL, dict(sizes, first=1, last=leases))
+            cursor.execute("ANALYZE")
+            conn.commit()
+            result['load_ms'] = (time.perf_counter() - started) * 1000
+        result['install_ms'] = install(conn)['elapsed_ms']
+        with conn.cursor() as cursor:
+            cursor.execute(_LOOP_FUNCTION)
+            cursor.execute(shipped_statement('Phase4', 'functions.sql', 'calculate_annual_revenue_and_discounts'))
+            cursor.execute(shipped_statement('Phase4', 'functions.sql', 'FUNCTION manager_discount_totals'))
+            result['cube_rows'] = {}
+            for name in CUBES:
+                cursor.execute(f"SELECT count(*) FROM {name}")
+                result['cube_rows'][name] = cursor.fetchone()[0]
+            # The ten-year dashboard: one call per year, as main_program_1.sql does for one year, vs one query
+            loop_ms, loop_rows = 0.0, []
+            for year in result['years']:
+                elapsed, rows = _timed(cursor, "SELECT * FROM calculate_annual_revenue_and_discounts_loop(%s)", [year])
+                loop_ms, loop_rows = loop_ms + elapsed, loop_rows + rows
+            function_ms, function_rows = 0.0, []
+            for year in result['years']:
+                elapsed, rows = _timed(cursor, "SELECT * FROM calculate_annual_revenue_and_discounts(%s)", [year])
+                function_ms, function_rows = function_ms + elapsed, function_rows + rows
+            cube_ms, cube_rows = _timed(cursor, "SELECT total_revenue, total_discount_cost FROM revenue_by_year "
+                                                "WHERE academic_year BETWEEN %s AND %s ORDER BY academic_year",
+                                        [result['years'][0], result['years'][-1]])
+            result['dashboard'] = {'loop_ms': loop_ms, 'function_ms': function_ms, 'cube_ms': cube_ms,
+                                   'same_totals': loop_rows == function_rows == cube_rows}
+            base_ms, base_rows = _timed(cursor, _QUERY_7)
+            query_7 = shipped_statement('Phase2', 'Queries.sql', 'manager_discount_totals()')
+            query_ms, query_rows = _timed(cursor, query_7)
+            result['query_7'] = {'base_ms': base_ms, 'cube_ms': query_ms, 'same_rows': base_rows == query_rows}
+            # Trigger cost: a bulk intake, then single statements as the app issues them
+            started = time.perf_counter()
+            cursor.execute(_LEASES_SQL, dict(sizes, first=leases + 1, last=leases + 10000))
+            conn.commit()
+            result['bulk_insert_10k_ms'] = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            singles = 200
+            for lease in range(leases + 1, leases + 1 + singles):
+                cursor.execute("UPDATE lease SET discountpercent = 12.5 WHERE leaseid = %s", [lease])
+                conn.commit()
+            result['single_update_ms'] = (time.perf_counter() - started) * 1000 / singles
+        consistency = check(conn)
+        result['check_ms'] = consistency['elapsed_ms']
+        result['mismatches'] = consistency['mismatches']
+    finally:
+        conn.close()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS {scratch} WITH (FORCE)")
+        admin.close()
+    return result
+
+
+def main():
+    """Install, check or rebuild the revenue cube"""
+    parser = argparse.ArgumentParser(description="Incrementally maintained revenue and discount cube")
+    parser.add_argument("--dsn", required=True, help="Connection string of the database")
+    parser.add_argument("--install", action="store_true", help="Create and fill the cubes, their views and triggers")
+    parser.add_argument("--check", action="store_true", help="Compare the cubes with a full recomputation")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the cubes' rows")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Time the revenue reports with and without the cube on generated leases")
+    parser.add_argument("--leases", type=int, default=10000000, help="Leases generated for --benchmark")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.install or args.check or args.rebuild:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            if args.install:
+                stats = install(conn)
+                print(f"Cubes built in {stats['elapsed_ms']:,.0f} ms")
+                for name, rows in stats['rows'].items():
+                    print(f"  {name}: {rows:,} rows")
+            if args.rebuild:
+                for name, rows in rebuild(conn).items():
+                    print(f"Rebuilt {name}: {rows:,} rows")
+            if args.check:
+                result = check(conn)
+                for name, cube in result['cubes'].items():
+                    print(f"{name}: {cube['stored_rows']:,} rows, {cube['expected_rows']:,} expected, "
+                          f"{cube['mismatches']:,} mismatches")
+                    for row in cube['sample']:
+                        print(f"  {row}")
+                print(f"Checked in {result['elapsed_ms']:,.0f} ms")
+                if result['mismatches']:
+                    raise SystemExit("Revenue cubes are inconsistent; run --rebuild")
+        finally:
+            conn.close()
+    if args.benchmark:
+        result = benchmark(args.dsn, args.leases)
+        print(f"{result['leases']:,} leases loaded in {result['load_ms']:,.0f} ms → "
+              + ', '.join(f"{name} {rows:,} rows" for name, rows in result['cube_rows'].items())
+              + f" (built in {result['install_ms']:,.0f} ms)")
+        dashboard = result['dashboard']
+        print(f"  {len(result['years'])}-year dashboard: row-by-row function {dashboard['loop_ms']:>10,.1f} ms, "
+              f"function on the cube {dashboard['function_ms']:>8,.1f} ms, one cube query {dashboard['cube_ms']:>7,.1f} ms"
+              f"{'' if dashboard['same_totals'] else '  (totals differ!)'}")
+        query_7 = result['query_7']
+        print(f"  Query 7 (top 20% discounting managers) {query_7['base_ms']:>9,.1f} ms → {query_7['cube_ms']:>7,.1f} ms"
+              f"{'' if query_7['same_rows'] else '  (rows differ!)'}")
+        print(f"  10,000 leases and stays with triggers   {result['bulk_insert_10k_ms']:>9,.1f} ms")
+        print(f"  single lease discount change + commit   {result['single_update_ms']:>9,.3f} ms each")
+        print(f"  consistency check {result['check_ms']:,.0f} ms, {result['mismatches']} mismatches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import fnmatch
+import hashlib
+import logging
+import os
+import threading
+from sql_parser import split_sql
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+try:
+    from watchdog.observers import Observer  # inotify on Linux, FSEvents/ReadDirectoryChangesW elsewhere
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # Optional: without watchdog the catalog falls back to mtime checks on access
+    Observer = None
+    FileSystemEventHandler = object
+
+# Environment variable with SQL directories separated by os.pathsep
+SQL_DIRS_ENV = "SQL_CATALOG_DIRS"
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def find_repo_dir(name: str) -> Optional[str]:
+    """Find a phase folder in the repository root (folder names may carry direction marks)"""
+    for entry in os.listdir(_REPO_ROOT):
+        if entry.strip('\u200f\u200e ') == name and os.path.isdir(os.path.join(_REPO_ROOT, entry)):
+            return os.path.join(_REPO_ROOT, entry)
+    return None
+
+
+def shipped_statement(phase: str, file_name: str, marker: str) -> str:
+    """The statement of a Phase2 / Phase4 script that contains marker"""
+    from sql_parser import parse_sql_file
+    for statement in parse_sql_file(os.path.join(find_repo_dir(phase), file_name)):
+        if marker in statement['sql']:
+            return statement['sql']
+    raise ValueError(f"No statement with {marker} in {phase}/{file_name}")
+
+
+def default_sql_dirs() -> List[str]:
+    """SQL directories from SQL_CATALOG_DIRS, or the repository's Phase2 and Phase4 folders"""
+    configured = os.environ.get(SQL_DIRS_ENV, "")
+    if configured.strip():
+        return [d for d in configured.split(os.pathsep) if d.strip()]
+    return [d for d in (find_repo_dir('Phase2'), find_repo_dir('Phase4')) if d]
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """Marks changed .sql files as stale"""
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def on_any_event(self, event):
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if path and str(path).lower().endswith('.sql'):
+                self.catalog.mark_stale(os.path.abspath(path))
+
+
+class SqlCatalog:
+    """In-memory catalog of SQL files with change-driven reload"""
+    # Purpose: Keeps file text and parsed statements in memory; a file is only re-read after the
+    # watcher reported a change for it (or, without watchdog, after its mtime changed)
+    def __init__(self, directories: List[str], watch: bool = True):
+        self.directories = [os.path.abspath(os.path.expanduser(d)) for d in directories]
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}  # path -> {'mtime', 'sha256', 'text', 'statements'}
+        self._stale = set()  # Paths reported as changed by the watcher
+        self._observer = None
+        self._watched = set()  # Directories the watcher covers; files elsewhere fall back to mtime checks
+        if watch and Observer is not None:
+            self._start_watcher()
+
+    def _start_watcher(self) -> None:
+        """Watch all existing catalog directories"""
+        try:
+            observer = Observer()
+            handler = _ChangeHandler(self)
+            watched = set()
+            for directory in self.directories:
+                if os.path.isdir(directory):
+                    observer.schedule(handler, directory, recursive=False)
+                    watched.add(directory)
+            observer.daemon = True
+            observer.start()
+            self._observer, self._watched = observer, watched
+            logger.info(f"Watching SQL directories: {', '.join(sorted(watched))}")
+        except Exception as e:
+            logger.warning(f"Could not watch SQL directories, falling back to mtime checks: {e}")
+            self._observer, self._watched = None, set()
+
+    @property
+    def watching(self) -> bool:
+        """True if file changes are reported by the directory watcher"""
+        return self._observer is not None
+
+    def stop(self) -> None:
+        """Stop the directory watcher"""
+        observer, self._observer, self._watched = self._observer, None, set()
+        if observer is not None:
+            observer.stop()
+            observer.join(timeout=5)
+
+    def mark_stale(self, path: str) -> None:
+        """Mark a file for reload on next access"""
+        with self._lock:
+            self._stale.add(path)
+
+    def find(self, file_name: str) -> Optional[str]:
+        """Return the path of a file in the first directory that contains it"""
+        for directory in self.directories:
+            path = os.path.join(directory, file_name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def list_files(self, pattern: str = "*.sql") -> List[str]:
+        """List file names matching a pattern across all directories (first directory wins)"""
+        names = []
+        for directory in self.directories:
+            if os.path.isdir(directory):
+                for name in sorted(os.listdir(directory)):
+                    if fnmatch.fnmatch(name, pattern) and name not in names:
+                        names.append(name)
+        return names
+
+    def _load(self, file_name: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry of a file, reloading it only if it changed"""
+        path = self.find(file_name)
+        if path is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+            stale = path in self._stale
+            self._stale.discard(path)
+        if entry is not None and not stale:
+            if os.path.dirname(path) in self._watched:
+                return entry  # Watcher reports changes, no need to touch the file system
+            if os.stat(path).st_mtime_ns == entry['mtime']:
+                return entry
+
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is not None and entry['sha256'] == digest:
+            entry = dict(entry, mtime=mtime)  # Touched but unchanged: keep the parsed statements
+        else:
+            text = content.decode('utf-8')
+            entry = {'path': path, 'mtime': mtime, 'sha256': digest, 'text': text, 'statements': split_sql(text)}
+            logger.info(f"Loaded SQL file {path} ({len(entry['statements'])} statements)")
+        with self._lock:
+            self._entries[path] = entry
+        return entry
+
+    def get_text(self, file_name: str) -> Optional[str]:
+        """Get the full text of a SQL file"""
+        entry = self._load(file_name)
+        return entry['text'] if entry else None
+
+    def get_statements(self, file_name: str) -> List[Dict[str, Any]]:
+        """Get the parsed statements of a SQL file"""
+        entry = self._load(file_name)
+        return entry['statements'] if entry else []
+
+
+# Catalogs shared by all sessions of the process, keyed by directory list, least recently used first
+MAX_CATALOGS = 8
+_catalogs: "OrderedDict[Tuple[str, ...], SqlCatalog]" = OrderedDict()
+_catalog_lock = threading.Lock()
+
+
+def get_catalog(directories: Optional[List[str]] = None) -> SqlCatalog:
+    """Get the shared catalog for a directory list (defaults to default_sql_dirs())"""
+    # Purpose: Sessions with different SQL Directories settings each keep their own watched catalog;
+    # only a catalog evicted past MAX_CATALOGS has its watcher stopped (a holder falls back to mtime checks)
+    key = tuple(directories or default_sql_dirs())
+    with _catalog_lock:
+        catalog = _catalogs.get(key)
+        if catalog is not None:
+            _catalogs.move_to_end(key)  # Mark as most recently used
+            return catalog
+        catalog = SqlCatalog(list(key))
+        _catalogs[key] = catalog
+        while len(_catalogs) > MAX_CATALOGS:
+            _, evicted = _catalogs.popitem(last=False)  # Least recently used directory list
+            evicted.stop()
+        return catalog
@@ -0,0 +1,365 @@
+from typing import List, Dict, Any, Iterator, Optional
+import hashlib
+import logging
+import os
+import re
+import threading
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Lexer states
+NORMAL, SINGLE_QUOTE, ESCAPE_STRING, DOUBLE_QUOTE, DOLLAR_QUOTE, LINE_COMMENT, BLOCK_COMMENT, COPY_DATA = range(8)
+
+_NORMAL_SPECIAL = re.compile(r"['\";$\-/\n\\]")  # Characters that may change the lexer state
+_DOLLAR_TAG = re.compile(r"\$(?:[A-Za-z_\u0080-\uffff][A-Za-z0-9_\u0080-\uffff]*)?\$")
+_DOLLAR_PARTIAL = re.compile(r"\$(?:[A-Za-z_\u0080-\uffff][A-Za-z0-9_\u0080-\uffff]*)?\Z")
+_BLOCK_TOKEN = re.compile(r"/\*|\*/")
+_LABEL = re.compile(r"--\s*(?:Query|Statement)\s+\d+\s*:\s*(.*)", re.IGNORECASE)
+_COPY_FROM_STDIN = re.compile(r"^COPY\b.*\bFROM\s+stdin\b", re.IGNORECASE | re.DOTALL)
+_IDENT_CHAR = re.compile(r"[A-Za-z0-9_\u0080-\uffff]")
+
+
+class SqlScriptParser:
+    """Incremental SQL script splitter (PostgreSQL lexical rules)"""
+    # Purpose: Splits a script into statements on top-level semicolons only. Understands
+    # - 'string' literals with doubled quotes and E'...' strings with backslash escapes
+    # - "quoted identifiers"
+    # - $$ / $tag$ dollar-quoted bodies (PL/pgSQL functions, DO blocks)
+    # - -- line comments and nested /* block /* comments */ */
+    # - "-- Query N: description" labels (continued on the following comment lines)
+    # - COPY ... FROM stdin data sections and psql meta-commands in plain dumps
+    # Text can be fed in arbitrary chunks, so large files never need to be loaded at once.
+    def __init__(self):
+        self._buffer = ""  # Unconsumed input (only a few characters between feeds)
+        self._state = NORMAL
+        self._dollar_tag = ""  # Closing delimiter of the current dollar quote
+        self._comment_depth = 0  # Nesting depth of block comments
+        self._comment_parts = []  # Text of the comment being read
+        self._parts = []  # Text of the current statement
+        self._has_code = False  # True once the current statement has non-comment content
+        self._tail = ""  # Last two characters of statement text (for E'' and $ detection)
+        self._line = 1  # Current line number in the input
+        self._start_line = 1  # Line where the current statement starts
+        self._label = None  # Pending "-- Query N:" description for the next statement
+        self._label_open = False  # Following comment lines continue the label
+        self._query_id = 0
+        self._copy_statement = None  # COPY statement waiting for its data section
+        self._copy_started = False  # True after the rest of the COPY command line was skipped
+        self._copy_lines = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add script text and return the statements completed by it"""
+        self._buffer += text
+        return self._parse(final=False)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Flush the input and return the remaining statements (including one without a trailing ;)"""
+        statements = self._parse(final=True)
+        if self._state == COPY_DATA and self._copy_statement is not None:
+            statements.append(self._finish_copy())
+        self._end_statement(statements)
+        return statements
+
+    def _append(self, text: str) -> None:
+        """Append text to the current statement"""
+        if not text:
+            return
+        if not self._has_code:
+            stripped = text.lstrip()
+            if not stripped:
+                self._line += text.count('\n')  # Whitespace before a statement is not kept
+                return
+            self._has_code = True
+            self._label_open = False
+            self._line += text[:len(text) - len(stripped)].count('\n')
+            self._start_line = self._line
+            text = stripped
+        self._parts.append(text)
+        self._line += text.count('\n')
+        self._tail = (self._tail + text)[-2:]
+
+    def _on_comment(self, comment: str) -> None:
+        """Handle a complete comment found in NORMAL state"""
+        if self._has_code:
+            self._append(comment)  # Comments inside a statement are part of its text
+            return
+        self._line += comment.count('\n')
+        if not comment.startswith('--'):
+            return
+        match = _LABEL.match(comment)
+        if match:
+            self._label = match.group(1).strip()
+            self._label_open = True
+        elif self._label_open:
+            continuation = comment[2:].strip()
+            if continuation:
+                self._label = f"{self._label} {continuation}".strip()
+
+    def _end_statement(self, statements: List[Dict[str, Any]]) -> None:
+        """Close the current statement at a top-level semicolon"""
+        sql = ''.join(self._parts).strip()
+        if self._has_code and sql:
+            self._query_id += 1
+            statement = {
+                'name': f"Query {self._query_id}: {self._label or 'Unnamed'}",
+                'sql': sql,
+                'id': self._query_id,
+                'line': self._start_line
+            }
+            if _COPY_FROM_STDIN.match(sql):
+                self._copy_statement = statement  # Data rows follow until a line with \.
+                self._copy_lines = []
+                self._state = COPY_DATA
+            else:
+                statements.append(statement)
+        self._parts = []
+        self._has_code = False
+        self._tail = ""
+        self._label = None
+        self._label_open = False
+
+    def _finish_copy(self) -> Dict[str, Any]:
+        """Attach collected COPY data to its statement"""
+        statement = self._copy_statement
+        statement['copy_data'] = ''.join(self._copy_lines)
+        self._copy_statement = None
+        self._copy_started = False
+        self._copy_lines = []
+        return statement
+
+    def _parse(self, final: bool) -> List[Dict[str, Any]]:
+        """Consume as much of the buffer as can be decided without more input"""
+        buf = self._buffer
+        n = len(buf)
+        i = 0
+        statements = []
+        while i < n:
+            state = self._state
+            if state == NORMAL:
+                match = _NORMAL_SPECIAL.search(buf, i)
+                if not match:
+                    self._append(buf[i:])
+                    i = n
+                    break
+                j = match.start()
+                ch = buf[j]
+                self._append(buf[i:j])
+                i = j
+                if ch == "'":
+                    escape = len(self._tail) >= 1 and self._tail[-1] in 'eE' and not (
+                        len(self._tail) == 2 and _IDENT_CHAR.match(self._tail[0]))
+                    self._append(ch)
+                    self._state = ESCAPE_STRING if escape else SINGLE_QUOTE
+                    i += 1
+                elif ch == '"':
+                    self._append(ch)
+                    self._state = DOUBLE_QUOTE
+                    i += 1
+                elif ch == ';':
+                    self._end_statement(statements)
+                    i += 1
+                elif ch == '\n':
+                    self._append(ch)
+                    i += 1
+                elif ch in '-/':
+                    if j + 1 >= n and not final:
+                        break  # Need the next character to decide
+                    if buf[j:j + 2] in ('--', '/*'):
+                        self._state = LINE_COMMENT if ch == '-' else BLOCK_COMMENT
+                        self._comment_depth = 1
+                        self._comment_parts = [buf[j:j + 2]]
+                        i += 2
+                    else:
+                        self._append(ch)
+                        i += 1
+                elif ch == '$':
+                    if self._tail and _IDENT_CHAR.match(self._tail[-1]):
+                        self._append(ch)  # Part of an identifier such as a$b
+                        i += 1
+                        continue
+                    tag = _DOLLAR_TAG.match(buf, j)
+                    if tag:
+                        self._dollar_tag = tag.group()
+                        self._append(tag.group())
+                        self._state = DOLLAR_QUOTE
+                        i = tag.end()
+                    elif not final and _DOLLAR_PARTIAL.match(buf, j):
+                        break  # Tag may continue in the next chunk
+                    else:
+                        self._append(ch)  # Positional parameter ($1) or a lone $
+                        i += 1
+                else:  # Backslash
+                    if not self._has_code:
+                        end = buf.find('\n', j)
+                        if end < 0 and not final:
+                            break
+                        end = n if end < 0 else end
+                        logger.debug(f"Skipping psql meta-command: {buf[j:end]}")
+                        i = end  # psql meta-command (e.g. \connect) is not SQL
+                    else:
+                        self._append(ch)
+                        i += 1
+            elif state in (SINGLE_QUOTE, ESCAPE_STRING, DOUBLE_QUOTE):
+                quote = '"' if state == DOUBLE_QUOTE else "'"
+                pattern = "'\\" if state == ESCAPE_STRING else quote
+                j = min((p for p in (buf.find(c, i) for c in pattern) if p >= 0), default=-1)
+                if j < 0:
+                    self._append(buf[i:])
+                    i = n
+                    break
+                if j + 1 >= n and not final:
+                    self._append(buf[i:j])
+                    i = j
+                    break  # Need the next character ('' or \x)
+                if buf[j] == '\\':
+                    self._append(buf[i:j + 2])
+                    i = j + 2
+                elif buf[j + 1:j + 2] == quote:
+                    self._append(buf[i:j + 2])  # Doubled quote inside the literal
+                    i = j + 2
+                else:
+                    self._append(buf[i:j + 1])
+                    self._state = NORMAL
+                    i = j + 1
+            elif state == DOLLAR_QUOTE:
+                j = buf.find(self._dollar_tag, i)
+                if j < 0:
+                    keep = 0 if final else len(self._dollar_tag) - 1  # Delimiter may be split across chunks
+                    cut = max(i, n - keep)
+                    self._append(buf[i:cut])
+                    i = cut
+                    break
+                end = j + len(self._dollar_tag)
+                self._append(buf[i:end])
+                self._state = NORMAL
+                i = end
+            elif state == LINE_COMMENT:
+                j = buf.find('\n', i)
+                if j < 0:
+                    self._comment_parts.append(buf[i:])
+                    i = n
+                    if final:
+                        self._state = NORMAL
+                        self._on_comment(''.join(self._comment_parts))
+                    break
+                self._comment_parts.append(buf[i:j])
+                self._state = NORMAL
+                self._on_comment(''.join(self._comment_parts))
+                i = j  # The newline itself is handled in NORMAL state
+            elif state == BLOCK_COMMENT:
+                match = _BLOCK_TOKEN.search(buf, i)
+                if not match:
+                    keep = 0 if final or not buf.endswith(('/', '*')) else 1
+                    cut = max(i, n - keep)
+                    self._comment_parts.append(buf[i:cut])
+                    i = cut
+                    break
+                self._comment_parts.append(buf[i:match.end()])
+                self._comment_depth += 1 if match.group() == '/*' else -1
+                i = match.end()
+                if self._comment_depth == 0:
+                    self._state = NORMAL
+                    self._on_comment(''.join(self._comment_parts))
+            else:  # COPY_DATA: one line per row until "\."
+                j = buf.find('\n', i)
+                if j < 0 and not final:
+                    break
+                j = n if j < 0 else j
+                line = buf[i:j]
+                i = min(j + 1, n)
+                self._line += 1
+                if not self._copy_started:
+                    self._copy_started = True  # Rest of the COPY command line
+                elif line.rstrip('\r') == '\\.':
+                    statements.append(self._finish_copy())
+                    self._state = NORMAL
+                else:
+                    self._copy_lines.append(line + '\n')
+        self._buffer = buf[i:]
+        return statements
+
+
+class _CodeMasker(SqlScriptParser):
+    """Lexer pass that keeps code at its offsets and blanks comments and the contents of quoted text"""
+    def __init__(self):
+        super().__init__()
+        self._has_code = True  # A statement has no psql meta-commands; a leading backslash stays code
+        self.chunks = []
+
+    def _append(self, text: str) -> None:
+        # The opening quote or $tag$ is appended in NORMAL state and kept; everything up to and including
+        # the closing one is appended in the quoted state and blanked
+        self.chunks.append(text if self._state == NORMAL else ' ' * len(text))
+        self._tail = (self._tail + text)[-2:]
+
+    def _on_comment(self, comment: str) -> None:
+        self.chunks.append(' ' * len(comment))
+
+    def _end_statement(self, statements: List[Dict[str, Any]]) -> None:
+        self.chunks.append(';')
+
+
+def statement_code(text: str) -> str:
+    """SQL text with comments and quoted contents blanked, at the same offsets (for keyword and paren scans)"""
+    masker = _CodeMasker()
+    masker._buffer = text
+    masker._parse(final=True)
+    code = ''.join(masker.chunks)
+    return code + ' ' * (len(text) - len(code))  # An unterminated comment or literal is left out
+
+
+def split_sql(text: str) -> List[Dict[str, Any]]:
+    """Split a SQL script into statements"""
+    parser = SqlScriptParser()
+    return parser.feed(text) + parser.close()
+
+
+def iter_sql_file(file_path: str, chunk_size: int = 1 << 20, encoding: str = 'utf-8') -> Iterator[Dict[str, Any]]:
+    """Stream statements from a SQL file without loading it into memory"""
+    # Purpose: For multi-megabyte dump/migration files; memory is bounded by the largest statement
+    parser = SqlScriptParser()
+    with open(file_path, 'r', encoding=encoding) as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+# Parsed files shared by all sessions of the process: path -> (mtime_ns, size, sha256, statements)
+_parse_cache: Dict[str, tuple] = {}
+_parse_cache_lock = threading.Lock()
+
+
+def parse_sql_file(file_path: str, encoding: str = 'utf-8') -> List[Dict[str, Any]]:
+    """Parse a SQL file into statements, cached by file mtime and content hash"""
+    # Purpose: Reruns reuse the parsed statements while the file is unchanged; a changed mtime
+    # triggers a re-read, but the file is only re-parsed if its content hash changed too
+    stat = os.stat(file_path)
+    with _parse_cache_lock:
+        cached = _parse_cache.get(file_path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[3]
+
+    with open(file_path, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if cached and cached[2] == digest:
+        statements = cached[3]  # Touched but unchanged
+    else:
+        statements = split_sql(content.decode(encoding))
+        logger.info(f"Parsed {len(statements)} statements from {file_path}")
+    with _parse_cache_lock:
+        _parse_cache[file_path] = (stat.st_mtime_ns, stat.st_size, digest, statements)
+    return statements
+
+
+def clear_parse_cache(file_path: Optional[str] = None) -> None:
+    """Drop cached parse results for one file or for all files"""
+    with _parse_cache_lock:
+        if file_path is None:
+            _parse_cache.clear()
+        else:
+            _parse_cache.pop(file_path, None)
@@ -0,0 +1,86 @@
+from typing import Dict, List, Tuple
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Modules that must not be imported before the login page renders
+HEAVY_MODULES = ('pandas', 'numpy', 'sqlalchemy', 'psycopg2', 'altair')
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_imports(statement: str = "import streamlit; import login") -> Tuple[Dict[str, int], List[str]]:
+    """
+    Run a statement in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        Tuple[Dict[str, int], List[str]]: (cumulative microseconds of each top-level import, all imported modules)
+    """
+    # Interpreter startup (site, encodings) is reported too; it is the same for every layout and not counted
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=APP_DIR, capture_output=True, text=True, check=True)
+    top_level, modules, started = {}, [], False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        name = name.rstrip()
+        modules.append(name.strip())
+        if name == " site":
+            started, top_level = True, {}
+        elif started and not name.startswith("  "):  # Nested imports are indented under their importer
+            top_level[name.strip()] = top_level.get(name.strip(), 0) + int(cumulative)
+    return top_level, modules
+
+
+def measure_render() -> float:
+    """Time the first run of app.py (the login page) with Streamlit's headless AppTest, in milliseconds"""
+    from streamlit.testing.v1 import AppTest  # Loaded before timing, as the server has it loaded too
+
+    started = time.perf_counter()
+    at = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=60).run()
+    elapsed = (time.perf_counter() - started) * 1000
+    if at.exception:
+        raise SystemExit(f"app.py failed to render: {at.exception[0].message}")
+    return elapsed
+
+
+def main():
+    """Check that the login page stays within its startup budget"""
+    parser = argparse.ArgumentParser(description="Measure login page import and render time against a budget")
+    parser.add_argument("--budget-ms", type=float, default=100.0,
+                        help="Maximum import time of the login page, excluding streamlit itself")
+    parser.add_argument("--render", action="store_true", help="Also time the first render of app.py")
+    parser.add_argument("--render-budget-ms", type=float, default=1500.0,
+                        help="Maximum time to first render of the login page (with --render)")
+    args = parser.parse_args()
+
+    top_level, modules = measure_imports()
+    streamlit_ms = top_level.pop("streamlit", 0) / 1000
+    app_ms = sum(top_level.values()) / 1000
+    heavy = sorted({name.split('.')[0] for name in modules} & set(HEAVY_MODULES))
+    failures = []
+
+    print(f"streamlit import:         {streamlit_ms:8.1f} ms (not counted)")
+    print(f"login page imports:       {app_ms:8.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:5]:
+        print(f"  {name:<24}{us / 1000:8.1f} ms")
+    if app_ms > args.budget_ms:
+        failures.append(f"login page imports took {app_ms:.1f} ms")
+    if heavy:
+        failures.append(f"heavy modules imported before login: {', '.join(heavy)}")
+
+    if args.render:
+        render_ms = measure_render()
+        print(f"time to first render:     {render_ms:8.1f} ms (budget {args.render_budget_ms:.0f} ms)")
+        if render_ms > args.render_budget_ms:
+            failures.append(f"first render took {render_ms:.1f} ms")
+
+    if failures:
+        raise SystemExit("Startup budget exceeded: " + "; ".join(failures))
+    print("Startup budget met")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+import itertools
+import logging
+import re
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Statement kinds that PostgreSQL accepts in PREPARE (CALL and DO are not preparable)
+PREPARABLE_COMMANDS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'VALUES', 'WITH', 'MERGE')
+
+# Global counter so statement names are unique across all caches of the process
+_statement_counter = itertools.count(1)
+
+
+def quote_ident(name: str) -> str:
+    """Quote a PostgreSQL identifier"""
+    # Purpose: Safely embeds table/column/routine names into generated statement text
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def placeholders(count: int, start: int = 1) -> str:
+    """Build a PREPARE-style placeholder list ($1, $2, ...)"""
+    return ', '.join(f"${i}" for i in range(start, start + count))
+
+
+def is_preparable(sql_text: str) -> bool:
+    """Check if a statement can be sent to PREPARE"""
+    # Purpose: CALL/DO and utility commands cannot be prepared and must be executed directly
+    words = sql_text.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in PREPARABLE_COMMANDS
+
+
+class StatementCacheStats:
+    """Hit/miss counters shared by all per-connection caches of one DatabaseManager"""
+    def __init__(self):
+        self._lock = threading.Lock()  # Caches of pooled connections may be used from several threads
+        self.hits = 0  # Executions served by an existing prepared statement
+        self.misses = 0  # Executions that had to PREPARE first
+        self.evictions = 0  # Prepared statements dropped by LRU eviction
+        self.bypassed = 0  # Executions that cannot be prepared (e.g. CALL)
+        self.prepare_time = 0.0  # Total seconds spent in PREPARE (parse + analyze)
+
+    def record(self, field: str, amount: float = 1) -> None:
+        """Increase a counter in a thread-safe way"""
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def reset(self) -> None:
+        """Reset all counters"""
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.bypassed = 0
+            self.prepare_time = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return counters together with hit rate and estimated planning time saved"""
+        # Purpose: Every hit skips one parse/analyze round on the server, so the saved time is
+        # estimated as hits multiplied by the average cost of a PREPARE measured on misses
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_prepare = self.prepare_time / self.misses if self.misses else 0.0
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bypassed': self.bypassed,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'avg_prepare_ms': avg_prepare * 1000,
+                'planning_time_saved_ms': self.hits * avg_prepare * 1000
+            }
+
+
+class PreparedStatementCache:
+    """LRU cache of server-side prepared statements bound to one DBAPI connection"""
+    def __init__(self, capacity: int = 64, stats: Optional[StatementCacheStats] = None):
+        self.capacity = max(1, capacity)  # Maximum number of statements kept prepared on the server
+        self.stats = stats or StatementCacheStats()  # Counters (shared between connections of one manager)
+        self._statements = OrderedDict()  # Statement shape key -> server-side statement name
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def execute(self, cursor, key: Hashable, sql_text: str, params: Optional[List[Any]] = None) -> None:
+        """Execute a statement through the cache"""
+        # Purpose: Runs `sql_text` (written with $1..$n placeholders) as EXECUTE of a prepared statement
+        # keyed by its shape. The statement is prepared on first use and evicted in LRU order.
+        params = list(params or [])
+        if not is_preparable(sql_text):
+            self.stats.record('bypassed')
+            if params:
+                cursor.execute(self._to_pyformat(sql_text), params)  # Run directly, e.g. CALL
+            else:
+                cursor.execute(sql_text)
+            return
+
+        name = self._statements.get(key)
+        if name is not None:
+            self._statements.move_to_end(key)  # Mark as most recently used
+            self.stats.record('hits')
+        else:
+            name = self._prepare(cursor, key, sql_text)
+
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def clear(self, cursor=None) -> None:
+        """Forget all statements, deallocating them on the server if a cursor is given"""
+        if cursor is not None:
+            try:
+                cursor.execute("DEALLOCATE ALL")
+            except Exception as e:
+                logger.warning(f"Could not deallocate prepared statements: {e}")
+        self._statements.clear()
+
+    def _prepare(self, cursor, key: Hashable, sql_text: str) -> str:
+        """PREPARE a new statement, evicting the least recently used one if needed"""
+        while len(self._statements) >= self.capacity:
+            _, old_name = self._statements.popitem(last=False)  # Least recently used entry
+            cursor.execute(f"DEALLOCATE {old_name}")
+            self.stats.record('evictions')
+
+        name = f"dm_stmt_{next(_statement_counter)}"
+        started = time.perf_counter()
+        cursor.execute(f"PREPARE {name} AS {sql_text}")  # No parameters, so psycopg2 sends the text as is
+        self.stats.record('prepare_time', time.perf_counter() - started)
+        self.stats.record('misses')
+
+        self._statements[key] = name
+        logger.debug(f"Prepared statement {name} for {key}")
+        return name
+
+    @staticmethod
+    def _to_pyformat(sql_text: str) -> str:
+        """Convert $n placeholders to psycopg2 %s placeholders for direct execution"""
+        # Purpose: Statements that cannot be prepared are sent with regular client-side binding
+        return re.sub(r'\$\d+', '%s', sql_text.replace('%', '%%'))
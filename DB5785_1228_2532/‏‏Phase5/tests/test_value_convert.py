@@ -0,0 +1,96 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from value_convert import (INT64_MAX, INT64_MIN, _sample_frame, _sample_types, column_kind, convert_frame,
+                           convert_records, convert_series, convert_value)
+
+SEEDS = range(5)
+
+
+def _same(actual, expected):
+    """Equal and of the same Python type (True must not pass for 1, nor 1.0 for 1)"""
+    return type(actual) is type(expected) and actual == expected
+
+
+def _random_column(rng: random.Random, kind: str, rows: int = 300):
+    """Strings (and sometimes blanks) a form or CSV could send for a column of the given kind"""
+    make = {
+        'int': lambda: str(rng.randint(-10 ** 6, 10 ** 6)),
+        'float': lambda: f"{rng.uniform(-1000, 1000):.3f}",
+        'bool': lambda: rng.choice(['true', 'FALSE', 'yes', 'n', '1', '0', 'On']),
+        'date': lambda: f"20{rng.randint(10, 29)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'text': lambda: rng.choice([' Dana ', 'Noa', 'Yossi  ']),
+    }[kind]
+    return [rng.choice(['', '  ']) if rng.random() < 0.1 else make() for _ in range(rows)]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('mixed', [True, False])
+def test_column_wise_matches_per_value(seed, mixed):
+    df = _sample_frame(500, seed, mixed)
+    types = _sample_types()
+    frame = convert_frame(df, types)
+    records = convert_records(df.to_dict('records'), types)
+    for column in df.columns:
+        kind, enums = column_kind(types[column]), getattr(types[column], 'enums', None)
+        for index, value in df[column].items():
+            expected = convert_value(value, kind, enums)
+            assert _same(frame.at[index, column], expected), (column, value)
+            assert _same(records[index][column], expected), (column, value)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('kind', ['int', 'float', 'bool', 'date', 'text'])
+def test_random_string_columns(seed, kind):
+    values = _random_column(random.Random(seed), kind)
+    converted = convert_series(pd.Series(values, dtype=object), kind).tolist()
+    assert all(_same(a, convert_value(v, kind)) for a, v in zip(converted, values))
+
+
+def test_false_zero_and_blanks():
+    assert convert_value(False, 'bool') is False
+    assert convert_value(0, 'int') == 0 and convert_value(np.int64(0), 'int') == 0
+    assert convert_value('  ', 'text') is None
+    assert convert_series(pd.Series([False, 0.0, '']), 'float').tolist() == [0.0, 0.0, None]
+
+
+@pytest.mark.parametrize('kind, value', [('enum', 'Other'), ('int', '1.5'), ('date', 'not a date'),
+                                         ('bool', 'maybe'), ('float', 'abc')])
+def test_invalid_values_rejected(kind, value):
+    with pytest.raises(ValueError):
+        convert_value(value, kind, ['Male', 'Female'])
+    with pytest.raises(ValueError):
+        convert_series(pd.Series([value]), kind, ['Male', 'Female'])
+
+
+@pytest.mark.parametrize('value', ['1e20', str(2 ** 63), str(INT64_MIN - 1), 2 ** 63, INT64_MIN - 1, 1e20,
+                                   np.uint64(2 ** 63)])
+def test_int64_overflow_rejected(value):
+    with pytest.raises(ValueError):
+        convert_value(value, 'int')
+    with pytest.raises(ValueError, match='64-bit integer'):
+        convert_series(pd.Series([1, value], dtype=object), 'int')
+    with pytest.raises(ValueError, match='64-bit integer'):
+        convert_series(pd.Series([value]), 'int')
+    with pytest.raises(ValueError, match='Column id'):
+        convert_records([{'id': '1'}, {'id': value}], {'id': _sample_types()['studentid']})
+
+
+def test_int64_bounds_kept():
+    values = [str(INT64_MIN), str(INT64_MAX), INT64_MAX]
+    assert convert_series(pd.Series(values, dtype=object), 'int').tolist() == [INT64_MIN, INT64_MAX, INT64_MAX]
+    assert convert_series(pd.Series([INT64_MAX], dtype='int64'), 'int').tolist() == [INT64_MAX]
+
+
+def test_error_names_offending_rows():
+    with pytest.raises(ValueError, match=r"row 2: 'x'"):
+        convert_series(pd.Series(['1', '2', 'x']), 'int')
+
+
+def test_records_with_different_keys():
+    records = [{'id': '1', 'name': ' a '}, {'id': '2'}]
+    converted = convert_records(records, {'id': _sample_types()['studentid']})
+    assert converted == [{'id': 1, 'name': 'a'}, {'id': 2}]
@@ -3,13 +3,13 @@ import pandas as pd
 from datetime import datetime, date
 from typing import List, Dict, Any
 import uuid
-from database_manager import DatabaseManager
-from utils import authenticate_user, logout
+from utils import logout
 import re
 from sqlalchemy import text
 import os
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from psycopg2.extras import RealDictCursor
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 def is_date_field(col_name: str) -> bool:
     return 'date' in col_name.lower()
@@ -62,7 +62,7 @@ def get_field_type(table_name, field_name):
 def render_navigation_buttons():
     """Render navigation buttons at the top of the page"""
     st.markdown('<div class="nav-buttons">', unsafe_allow_html=True)
-    cols = st.columns(7)
+    cols = st.columns(8)
     with cols[0]:
         if st.button("🏠 Home", key="nav_home", use_container_width=True):
             st.session_state.current_page = "home"
@@ -94,6 +94,11 @@ def render_navigation_buttons():
             st.session_state.table_operation = None
             st.rerun()
     with cols[6]:
+        if st.button("🛏️ Rooms", key="nav_rooms", use_container_width=True):
+            st.session_state.current_page = "rooms"
+            st.session_state.table_operation = None
+            st.rerun()
+    with cols[7]:
         if st.button("🚪 Logout", key="logout_button", use_container_width=True):
             logout()
     st.markdown('</div>', unsafe_allow_html=True)
@@ -141,35 +146,6 @@ def render_back_to_home_button():
             del st.session_state.selected_records
         st.rerun()
 
-def login_page():
-    """Login page"""
-    st.markdown('<div class="ltr">', unsafe_allow_html=True)
-    st.markdown('<h1 class="main-header">🗄️ Database Management System</h1>', unsafe_allow_html=True)
-    with st.container():
-        st.markdown("### 🔐 System Login")
-        col1, col2 = st.columns(2)
-        with col1:
-            host = st.text_input("🖥️ Server Address", value="localhost", key="host")
-            database = st.text_input("🗄️ Database Name", value="mydatabase", key="database")
-        with col2:
-            port = st.text_input("🔌 Port", value="5432", key="port")
-            username = st.text_input("👤 Username", key="username")
-        password = st.text_input("🔑 Password", type="password", key="password")
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.button("🚪 Login", use_container_width=True):
-                if username and password:
-                    with st.spinner("Connecting..."):
-                        if authenticate_user(username, password, host, port, database):
-                            st.success("✅ Login successful")
-                            st.session_state.current_page = "home"
-                            st.rerun()
-                        else:
-                            st.error("❌ Login failed. Please check your credentials.")
-                else:
-                    st.warning("⚠️ Please enter username and password.")
-    st.markdown('</div>', unsafe_allow_html=True)
-
 def home_page():
     """Home page with table selection and action buttons"""
     st.markdown('<div class="ltr">', unsafe_allow_html=True)
@@ -264,19 +240,8 @@ def add_record(table_name: str):
             nullable = col.get('nullable', True)
             is_auto_increment = col.get('autoincrement', False)
             if is_auto_increment:
-                try:
-                    from sqlalchemy import text
-                    max_id_query = text(f"SELECT MAX({col_name}) FROM {table_name}")
-                    with st.session_state.db_manager.engine.connect() as conn:
-                        result = conn.execute(max_id_query).fetchone()
-                        max_id = result[0] if result[0] is not None else 0
-                        next_id = max_id + 1
-                        form_data[col_name] = next_id
-                        st.info(f"🔢 {col_name} (Auto-generated) - Next ID: {next_id}")
-                except Exception as e:
-                    st.error(f"❌ Failed to generate ID for {col_name}: {str(e)}")
-                    form_data[col_name] = 1
-                    st.warning(f"⚠️ Using default ID: 1 for {col_name}")
+                # Left out of the INSERT so the column's sequence assigns it; MAX()+1 races with other sessions
+                st.info(f"🔢 {col_name} (Auto-generated) - Assigned by the database on insert")
                 continue
             if 'int' in col_type:
                 value = st.number_input(
@@ -390,8 +355,43 @@ def add_record(table_name: str):
                     else:
                         st.error("❌ Error adding record!")
                         st.error("⚠️ Hint: Check forgotten primary key or unique constraints.")
+    render_bulk_insert(table_name, [col['name'] for col in table_info['columns']])
     render_back_to_home_button()
 
+def render_bulk_insert(table_name: str, columns: List[str]):
+    """Insert all rows of an uploaded CSV in one transaction"""
+    with st.expander("📥 Bulk Insert from CSV"):
+        st.caption(f"Header row with column names: {', '.join(columns)}. All rows are inserted or none. "
+                   f"Blank auto-generated keys are assigned from the table's sequence.")
+        uploaded = st.file_uploader("📄 Records CSV", type=["csv"], key=f"bulk_file_{table_name}")
+        if uploaded is None:
+            return
+        records_df = pd.read_csv(uploaded, dtype=str, keep_default_na=False)  # Empty cells become NULL on insert
+        report, summary = st.session_state.db_manager.validate_records(table_name, records_df)
+        st.markdown(f"**{len(records_df):,} records loaded**, checked against the table's constraints "
+                    f"in {summary['elapsed_ms']:.0f} ms")
+        for error in summary['file_errors']:
+            st.error(f"❌ {error}")
+        if summary['server_only_checks']:
+            st.caption(f"Checked by the server only: {', '.join(summary['server_only_checks'])}")
+        if not report.empty:
+            st.error(f"❌ {summary['invalid_rows']:,} of {summary['rows']:,} rows are invalid "
+                     f"({summary['errors']:,} errors). Fix the file and upload it again.")
+            st.dataframe(report.head(1000), use_container_width=True, hide_index=True)
+            st.download_button("📥 Download Error Report", report.to_csv(index=False),
+                               file_name=f"{table_name}_validation_errors.csv", mime="text/csv",
+                               key=f"bulk_report_{table_name}")
+        if not summary['valid']:
+            return
+        st.success("✅ All rows are valid")
+        if st.button(f"📥 Insert {len(records_df):,} records", key=f"bulk_insert_{table_name}"):
+            with st.spinner("Inserting records..."):
+                inserted = st.session_state.db_manager.insert_records(table_name, records_df.to_dict('records'))
+            if inserted:
+                st.success(f"✅ {inserted:,} records inserted")
+            else:
+                st.error("❌ No records inserted. Check the values against the table's constraints.")
+
 def edit_record(table_name: str):
     """Edit an existing record with integrated selection"""
     st.markdown(f"### ✏️ Edit Record in Table: {table_name}")
@@ -595,7 +595,7 @@ def edit_record(table_name: str):
                             if st.session_state.db_manager.update_record(table_name, record_id, form_data, primary_keys[0]):
                                 st.success("✅ Record updated successfully!")
                                 st.balloons()
-                                st.sleep(1)
+                                time.sleep(1)  # Let the success message and balloons show before the rerun
                                 st.rerun()
                             else:
                                 st.error("❌ Error updating record")
@@ -683,16 +683,65 @@ def delete_record(table_name: str):
         st.info("ℹ️ Please select records to delete.")
     render_back_to_home_button()
 
+def render_batch_mode(routine_name: str, routine_type: str, specific_name: str, parameters: List[Dict[str, Any]]):
+    """Batch mode: run a routine once per row of an uploaded CSV"""
+    if not st.checkbox("📦 Batch mode (CSV of parameter sets)", key=f"batch_toggle_{specific_name}"):
+        return
+    input_names = [p['parameter_name'] for p in parameters if p['parameter_mode'].upper() in ['IN', 'INOUT']]
+    st.caption(f"One row per call. Columns: {', '.join(input_names)} (matched by header name, otherwise by position)")
+    uploaded = st.file_uploader("📄 Parameter CSV", type=["csv"], key=f"batch_file_{specific_name}")
+    col1, col2 = st.columns(2)
+    with col1:
+        chunk_size = st.number_input("Rows per transaction", min_value=1, max_value=100000, value=500,
+                                     step=100, key=f"batch_chunk_{specific_name}")
+    with col2:
+        workers = st.number_input("Parallel connections", min_value=1, max_value=16, value=1,
+                                  step=1, key=f"batch_workers_{specific_name}")
+    if uploaded is None:
+        return
+    param_df = pd.read_csv(uploaded)
+    if set(input_names).issubset(param_df.columns):
+        param_df = param_df[input_names]  # Reorder by parameter name
+    if len(param_df.columns) != len(input_names):
+        st.error(f"❌ Expected {len(input_names)} columns, found {len(param_df.columns)}.")
+        return
+    param_df = param_df.astype(object).where(param_df.notna(), None)  # Empty cells become NULL
+    st.markdown(f"**{len(param_df):,} parameter sets loaded**")
+    if st.button(f"📦 Run batch of {routine_name}", key=f"batch_run_{specific_name}"):
+        with st.spinner(f"Running {len(param_df):,} calls of {routine_name}..."):
+            try:
+                report, summary = st.session_state.db_manager.execute_routine_batch(
+                    routine_name, routine_type, specific_name, param_df, chunk_size, workers
+                )
+            except Exception as e:
+                st.error(f"❌ Batch failed: {str(e)}")
+                return
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("✅ Succeeded", f"{summary['succeeded']:,}")
+        with col2:
+            st.metric("❌ Failed", f"{summary['failed']:,}")
+        with col3:
+            st.metric("⏱️ Time", f"{summary['elapsed_s']:.2f} s")
+        with col4:
+            st.metric("🚀 Throughput", f"{summary['rows_per_s']:,.0f} rows/s")
+        problems = report[(report['status'] != 'ok') | (report['notices'] != '')]
+        if not problems.empty:
+            st.markdown("**📢 Rows with errors or notices:**")
+            st.dataframe(problems, use_container_width=True, hide_index=True)
+        st.download_button(
+            label="📥 Download batch report",
+            data=report.to_csv(index=False),
+            file_name=f"{routine_name}_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            key=f"batch_download_{specific_name}"
+        )
+
 def run_routines():
     """Screen to run procedures and functions with enhanced support for REF CURSOR and NOTICE"""
     st.markdown('<div class="ltr">', unsafe_allow_html=True)
     st.markdown("### ⚙️ Run Procedures and Functions")
     render_navigation_buttons()
-    refcursor_FLAG = False
-    def set_refcursor_FLAG(value):
-        """Set the REF CURSOR flag in session state"""
-        nonlocal refcursor_FLAG
-        refcursor_FLAG = value
     routines = st.session_state.db_manager.get_routines()
     if not routines:
         st.error("❌ No procedures or functions found.")
@@ -704,14 +753,9 @@ def run_routines():
         routine_type = routine['routine_type']
         specific_name = routine['specific_name']
         icon = "📋" if routine_type == 'PROCEDURE' else "🔧"
-        if routine_type == 'FUNCTION':
-            try:
-                return_type = st.session_state.db_manager._get_function_return_type(specific_name)
-                is_refcursor = st.session_state.db_manager._detect_refcursor_return(specific_name)
-                if is_refcursor or return_type == 'refcursor':
-                    icon = "🔄"
-            except:
-                pass
+        is_refcursor = st.session_state.db_manager._detect_refcursor_return(specific_name)  # Cached pg_proc metadata
+        if routine_type == 'FUNCTION' and is_refcursor:
+            icon = "🔄"
         with st.expander(f"{icon} {routine_name} ({routine_type})"):
             parameters = st.session_state.db_manager.get_function_parameters(specific_name)
             input_params = []
@@ -766,29 +810,44 @@ def run_routines():
                     for out in output_params:
                         st.markdown(f"- {out}")
             button_label = f"🚀 Run {routine_name}"
-            if routine_type == 'FUNCTION':
-                try:
-                    return_type = st.session_state.db_manager._get_function_return_type(specific_name)
-                    is_refcursor = st.session_state.db_manager._detect_refcursor_return(specific_name)
-                    if is_refcursor or return_type == 'refcursor':
-                        button_label = f"🔄 Execute {routine_name} (REF CURSOR)"
-                        set_refcursor_FLAG(True)
-                except:
-                    pass
+            if routine_type == 'FUNCTION' and is_refcursor:
+                button_label = f"🔄 Execute {routine_name} (REF CURSOR)"
             if st.button(button_label, key=f"run_{specific_name}"):
                 with st.spinner(f"Running {routine_type.lower()} {routine_name}..."):
                     required_inputs = [p for p in parameters if p["parameter_mode"].upper() in ["IN", "INOUT"]]
                     if parameters and len(input_params) != len(required_inputs):
                         st.error(f"❌ Please provide all input parameters for {routine_name}.")
                     else:
+                        live_box = st.empty()
+                        live_notices = deque(maxlen=20)  # Tail shown while the routine runs
+                        last_refresh = [0.0]
+
+                        def show_notice(message: str):
+                            live_notices.append(message)
+                            if time.perf_counter() - last_refresh[0] >= 0.2:  # Throttle UI updates
+                                live_box.code("\n".join(live_notices), language=None)
+                                last_refresh[0] = time.perf_counter()
+
                         result, notices = st.session_state.db_manager.execute_routine(
-                            routine_name, routine_type, specific_name, input_params, refcursor_FLAG
+                            routine_name, routine_type, specific_name, input_params, is_refcursor,
+                            notice_listener=show_notice
                         )
+                        live_box.empty()
                         if notices:
                             st.info("📢 **Database Notices:**")
                             for notice in notices:
                                 if notice and notice.strip():
                                     st.markdown(f"- {notice}")
+                            notice_log = st.session_state.db_manager.last_notice_log
+                            if notice_log and os.path.exists(notice_log):
+                                with open(notice_log, 'r', encoding='utf-8') as log_file:
+                                    st.download_button(
+                                        label="📥 Download All Notices",
+                                        data=log_file.read(),
+                                        file_name=os.path.basename(notice_log),
+                                        mime="text/plain",
+                                        key=f"notices_{specific_name}"
+                                    )
                             st.markdown("---")
                         if routine_type == 'PROCEDURE':
                             if result.empty:
@@ -826,6 +885,8 @@ def run_routines():
                                 st.success(f"✅ Function {routine_name} executed successfully (no data returned)")
                         else:
                             st.error(f"❌ Error executing {routine_type.lower()} {routine_name}")
+            if not is_refcursor and any(p['parameter_mode'].upper() in ['IN', 'INOUT'] for p in parameters):
+                render_batch_mode(routine_name, routine_type, specific_name, parameters)
     render_back_to_home_button()
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -852,11 +913,7 @@ def show_database_statistics():
         try:
             status_text.text(f"Processing table: {table}")
             progress_bar.progress((i + 1) / len(tables))
-            from sqlalchemy import text
-            count_query = text(f"SELECT COUNT(*) as count FROM {table}")
-            with st.session_state.db_manager.engine.connect() as conn:
-                count_result = pd.read_sql(count_query, st.session_state.db_manager.engine)
-            record_count = count_result.iloc[0]['count'] if not count_result.empty else 0
+            record_count = st.session_state.db_manager.get_table_row_count(table)
             table_info = st.session_state.db_manager.get_table_info(table)
             column_count = len(table_info.get('columns', []))
             table_stats.append({
@@ -892,6 +949,119 @@ def show_database_statistics():
                 "Columns": st.column_config.NumberColumn("🔢 Columns", format="%d")
             }
         )
+    cache_stats = st.session_state.db_manager.get_statement_cache_stats()
+    st.markdown("### ⚡ Prepared Statement Cache")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🎯 Hit Rate", f"{cache_stats['hit_rate']:.1%}")
+    with col2:
+        st.metric("✅ Hits / ❌ Misses", f"{cache_stats['hits']:,} / {cache_stats['misses']:,}")
+    with col3:
+        st.metric("♻️ Evictions", f"{cache_stats['evictions']:,}")
+    with col4:
+        st.metric("⏱️ Planning Saved", f"{cache_stats['planning_time_saved_ms']:.1f} ms")
+    st.caption(f"Average PREPARE cost: {cache_stats['avg_prepare_ms']:.2f} ms · "
+               f"{cache_stats['bypassed']:,} CALL statements executed without preparing · "
+               f"capacity {cache_stats['capacity_per_connection']} statements per connection")
+    if st.session_state.db_manager.result_cache is not None:
+        result_cache_stats = st.session_state.db_manager.result_cache.stats()
+        st.markdown("### 🗃️ Shared Result Cache")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("🎯 Hit Rate (this process)", f"{result_cache_stats['hit_rate']:.1%}")
+        with col2:
+            st.metric("📦 Entries", f"{result_cache_stats['entries']:,}")
+        with col3:
+            st.metric("💾 Size", f"{result_cache_stats['bytes'] / 1024 / 1024:.1f} / "
+                                f"{result_cache_stats['max_bytes'] / 1024 / 1024:.0f} MB")
+        st.caption(f"Stored in {result_cache_stats['path']} · shared by all sessions and app processes")
+    st.markdown("### 🛠️ Maintenance Requests")
+    if not st.session_state.db_manager.has_maintenance_rollups():
+        st.info("ℹ️ Maintenance rollups are not installed (run maintenance_rollups.py --install).")
+    else:
+        try:
+            by_priority, _ = st.session_state.db_manager.get_maintenance_summary('maintenance_by_priority')
+            by_month, _ = st.session_state.db_manager.get_maintenance_summary('maintenance_by_month')
+            by_building, _ = st.session_state.db_manager.get_maintenance_summary('maintenance_by_building')
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("🧾 Requests", f"{int(by_priority['request_count'].sum()):,}")
+            with col2:
+                st.metric("⏳ Unresolved", f"{int(by_priority['unresolved_count'].sum()):,}")
+            if len(by_month) > 0:
+                st.bar_chart(by_month.sort_values('month').set_index('month')['request_count'])
+            col1, col2 = st.columns(2)
+            with col1:
+                st.dataframe(by_priority, use_container_width=True, hide_index=True)
+            with col2:
+                st.dataframe(by_building.sort_values('request_count', ascending=False),
+                             use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.error(f"❌ Error reading the maintenance rollups: {str(e)}")
+        if st.button("🔍 Check Rollups Against Requests", key="check_maintenance_rollups"):
+            result = st.session_state.db_manager.check_maintenance_rollups()
+            if result['mismatches']:
+                st.error(f"❌ {result['mismatches']:,} rollup rows differ from the requests "
+                         f"(run maintenance_rollups.py --rebuild)")
+                for name, rollup in result['rollups'].items():
+                    if rollup['sample']:
+                        st.dataframe(pd.DataFrame(rollup['sample']), use_container_width=True, hide_index=True)
+            else:
+                st.success(f"✅ Rollups match the requests ({result['elapsed_ms']:.0f} ms)")
+    st.markdown("### 💰 Revenue and Discounts")
+    if not st.session_state.db_manager.has_revenue_cube():
+        st.info("ℹ️ The revenue cube is not installed (run revenue_cube.py --install).")
+    else:
+        try:
+            by_year, _ = st.session_state.db_manager.get_revenue_report(1, 9999)
+            years = sorted(int(year) for year in by_year['academic_year'])
+            if not years:
+                st.info("ℹ️ No leases yet.")
+            else:
+                first_year, last_year = (st.select_slider("Academic years", options=years,
+                                                          value=(years[0], years[-1]), key="revenue_years")
+                                         if len(years) > 1 else (years[0], years[0]))
+                breakdown = st.radio("Breakdown", ["Total", "Manager", "Building"], horizontal=True,
+                                     key="revenue_breakdown")
+                report, _ = st.session_state.db_manager.get_revenue_report(
+                    first_year, last_year, None if breakdown == "Total" else breakdown.lower())
+                totals = by_year[by_year['academic_year'].between(first_year, last_year)]
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("💵 Revenue", f"{float(totals['total_revenue'].sum()):,.2f}")
+                with col2:
+                    st.metric("🏷️ Discount Cost", f"{float(totals['total_discount_cost'].sum()):,.2f}")
+                if breakdown == "Total":
+                    st.bar_chart(report.set_index('academic_year')[['total_revenue', 'total_discount_cost']]
+                                 .astype(float))
+                st.dataframe(report, use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.error(f"❌ Error reading the revenue cube: {str(e)}")
+        if st.button("🔍 Check Cube Against Leases", key="check_revenue_cube"):
+            result = st.session_state.db_manager.check_revenue_cube()
+            if result['mismatches']:
+                st.error(f"❌ {result['mismatches']:,} cube rows differ from the leases and stays "
+                         f"(run revenue_cube.py --rebuild)")
+                for name, cube in result['cubes'].items():
+                    if cube['sample']:
+                        st.dataframe(pd.DataFrame(cube['sample']), use_container_width=True, hide_index=True)
+            else:
+                st.success(f"✅ Cube matches the leases and stays ({result['elapsed_ms']:.0f} ms)")
+    if st.session_state.db_manager.replica_engines:
+        st.markdown("### 🪞 Read Replicas")
+        routing = st.session_state.db_manager.routing_stats
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("📖 Reads on Replicas", f"{routing['replica']:,}")
+        with col2:
+            st.metric("↩️ Fallbacks to Primary", f"{routing['fallback']:,}")
+        st.dataframe(pd.DataFrame(st.session_state.db_manager.get_replica_status()),
+                     use_container_width=True, hide_index=True)
+    guard_events = list(st.session_state.db_manager.guard_events)
+    if guard_events:
+        st.markdown("### ✂️ Cut-off Queries")
+        events_df = pd.DataFrame(guard_events)[['time', 'status', 'reason', 'rows', 'elapsed_ms', 'sql']]
+        st.dataframe(events_df.iloc[::-1], use_container_width=True, hide_index=True)
     render_back_to_home_button()
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -908,6 +1078,7 @@ def show_settings():
             'session_timeout': 60,
             'confirm_delete': True
         }
+    st.session_state.settings.setdefault('sql_dirs', default_sql_dirs())
     st.markdown("#### 🔗 Connection Information")
     if st.session_state.connection_string:
         safe_connection = st.session_state.connection_string
@@ -962,6 +1133,46 @@ def show_settings():
         key="timeout_setting"
     )
     st.session_state.settings['session_timeout'] = new_timeout
+    if st.session_state.db_manager:
+        st.markdown("#### 🛡️ Query Limits")
+        policy = st.session_state.db_manager.query_policy
+        col1, col2 = st.columns(2)
+        with col1:
+            policy.statement_timeout_ms = int(st.number_input(
+                "⏱️ Statement Timeout (seconds, 0 = none)", min_value=0, max_value=3600,
+                value=int(policy.statement_timeout_ms // 1000), key="statement_timeout_setting") * 1000)
+            policy.lock_timeout_ms = int(st.number_input(
+                "🔒 Lock Timeout (seconds, 0 = none)", min_value=0, max_value=600,
+                value=int(policy.lock_timeout_ms // 1000), key="lock_timeout_setting") * 1000)
+            policy.work_mem = st.text_input("🧮 work_mem", value=policy.work_mem, key="work_mem_setting")
+        with col2:
+            policy.max_rows = int(st.number_input(
+                "📏 Max Rows per Result (0 = none)", min_value=0, max_value=10000000,
+                value=int(policy.max_rows), step=1000, key="max_rows_setting"))
+            policy.max_result_bytes = int(st.number_input(
+                "💾 Max Result Size (MB, 0 = none)", min_value=0, max_value=4096,
+                value=int(policy.max_result_bytes // (1024 * 1024)), key="max_result_setting") * 1024 * 1024)
+        if st.session_state.db_manager.replica_engines:
+            st.session_state.db_manager.max_replica_lag_s = float(st.number_input(
+                "🪞 Max Replica Lag (seconds)", min_value=0.0, max_value=3600.0,
+                value=float(st.session_state.db_manager.max_replica_lag_s), step=1.0, key="replica_lag_setting"))
+        render_capture_settings()
+    st.markdown("#### 📁 SQL Files")
+    new_sql_dirs = st.text_area(
+        "📂 SQL Directories (one per line, searched in order)",
+        value="\n".join(st.session_state.settings['sql_dirs']),
+        key="sql_dirs_setting"
+    )
+    st.session_state.settings['sql_dirs'] = [d.strip() for d in new_sql_dirs.splitlines() if d.strip()]
+    catalog = get_sql_catalog()
+    for directory in catalog.directories:
+        if os.path.isdir(directory):
+            sql_count = len([f for f in os.listdir(directory) if f.lower().endswith('.sql')])
+            st.caption(f"✅ {directory}: {sql_count} SQL files available")
+        else:
+            st.caption(f"⚠️ {directory}: directory not found")
+    st.caption("🔄 Changes are picked up automatically " +
+               ("(watching for file changes)" if catalog.watching else "(checked by modification time)"))
     if st.session_state.settings['theme'] == 'Dark':
         st.markdown("""
         <style>
@@ -974,6 +1185,8 @@ def show_settings():
         }
         </style>
         """, unsafe_allow_html=True)
+    if st.session_state.db_manager:
+        render_backup_settings()
     st.markdown("#### 🗄️ Database Operations")
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -991,6 +1204,8 @@ def show_settings():
             if st.session_state.db_manager:
                 with st.spinner("Refreshing schema..."):
                     try:
+                        st.session_state.db_manager.clear_routine_cache()
+                        st.session_state.db_manager.invalidate_cache('data')  # Also drop cached row counts
                         tables = st.session_state.db_manager.get_table_names()
                         st.success(f"✅ Schema refreshed! Found {len(tables)} tables.")
                         st.rerun()
@@ -1011,78 +1226,121 @@ import os
 import re
 from sqlalchemy import text
 import logging
+from sql_catalog import get_catalog, default_sql_dirs
+import psycopg2
+from backup_manager import (BackupError, COMPRESSION_METHODS, benchmark_parallelism, compression_spec,
+                            default_target, dump_database, libpq_dsn, list_archives, verify_backup)
 
 logger = logging.getLogger(__name__)
 
-def read_sql_file(file_path: str) -> List[Dict[str, str]]:
-    """Read SQL file and split into individual queries with full comment name extraction"""
-    if not os.path.exists(file_path):
-        logger.error(f"File not found: {file_path}")
-        st.error(f"❌ File not found: {file_path}")
+def render_backup_settings():
+    """Parallel backups of the connected database and verification of existing archives"""
+    st.markdown("#### 💾 Backups")
+    dsn = libpq_dsn(st.session_state.db_manager.engine.url)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        jobs = int(st.number_input("⚙️ Parallel Jobs", min_value=1, max_value=32, value=4, key="backup_jobs"))
+    with col2:
+        method = st.selectbox("🗜️ Compression", options=list(COMPRESSION_METHODS), key="backup_compression")
+    with col3:
+        level = st.slider("📉 Compression Level", min_value=0, max_value=9, value=6, key="backup_level",
+                          disabled=method in ('lz4', 'none'))
+    compress = compression_spec(method, None if method in ('lz4', 'none') else level)
+    target = st.text_input("📂 Backup Directory", value=default_target(), key="backup_target")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("💾 Create Backup", use_container_width=True):
+            with st.spinner(f"Dumping with {jobs} jobs..."):
+                try:
+                    dump = dump_database(dsn, target, jobs, compress)
+                    st.success(f"✅ Backup written to {dump['path']} ({dump['size_mb']} MB) "
+                               f"in {dump['elapsed_ms'] / 1000:.2f} s")
+                    st.dataframe(pd.DataFrame(dump['tables']), use_container_width=True, hide_index=True)
+                except (BackupError, ValueError) as e:
+                    st.error(f"❌ Backup failed: {str(e)}")
+    with col2:
+        levels = st.text_input("📈 Parallelism Levels", value="1,2,4,8", key="backup_levels")
+        if st.button("⏱️ Compare Parallelism", use_container_width=True):
+            with st.spinner("Timing dump and restore at each level..."):
+                try:
+                    rows = benchmark_parallelism(dsn, [int(n) for n in levels.split(',') if n.strip()], compress)
+                    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+                except (BackupError, ValueError) as e:
+                    st.error(f"❌ Benchmark failed: {str(e)}")
+    archives = list_archives([os.path.dirname(target)] if os.path.isdir(os.path.dirname(target)) else None)
+    archives += [a for a in list_archives() if a['path'] not in {b['path'] for b in archives}]
+    if archives:
+        labels = {f"{a['folder']} / {a['name']} ({a['format']}, {a['size_mb']} MB)": a['path'] for a in archives}
+        selected = st.selectbox("🗂️ Archive to Verify", options=list(labels), key="backup_verify_archive")
+        against_database = st.checkbox("🔄 Compare With Current Database", value=False, key="backup_verify_live",
+                                       help="Needed for archives without a checksum manifest (tar, custom); "
+                                            "reports every change made since the backup")
+        if st.button("🔍 Verify Backup", use_container_width=True):
+            with st.spinner("Restoring into a scratch database..."):
+                try:
+                    result = verify_backup(labels[selected], dsn, jobs, against_database=against_database)
+                    if result['ok']:
+                        st.success(f"✅ All tables match the {result['source']} "
+                                   f"(restored in {result['restore_ms'] / 1000:.2f} s)")
+                    else:
+                        st.warning(f"⚠️ The backup differs from the {result['source']}")
+                    st.dataframe(pd.DataFrame(result['tables']), use_container_width=True, hide_index=True)
+                except (BackupError, psycopg2.Error) as e:
+                    st.error(f"❌ Verification failed: {str(e)}")
+    else:
+        st.caption("No backup archives found")
+
+def render_capture_settings():
+    """Record this session's statements for replay with workload_capture.py"""
+    from workload_capture import default_capture_path, default_redact_params
+    st.markdown("#### 🎥 Workload Capture")
+    db_manager = st.session_state.db_manager
+    capture_log = db_manager.capture_log
+    if capture_log is None:
+        path = st.text_input("📄 Capture Log", value=default_capture_path(), key="capture_path_setting")
+        redact = st.checkbox("🙈 Redact Parameters", value=default_redact_params(), key="capture_redact_setting",
+                             help="Leave parameter values (names, phones, emails) out of the log; "
+                                  "replay skips statements with parameters")
+        if st.button("⏺️ Start Capture", key="start_capture"):
+            try:
+                session_id = db_manager.start_capture(path, redact_params=redact)
+                st.success(f"✅ Recording session {session_id} to {path}")
+                st.rerun()
+            except OSError as e:
+                st.error(f"❌ Could not open the capture log: {str(e)}")
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("📝 Statements Recorded", f"{capture_log.events:,}")
+        with col2:
+            st.metric("💾 Log Size", f"{capture_log.size() / 1024 / 1024:.1f} MB")
+        st.caption(f"Session {capture_log.session_id} → {capture_log.path}"
+                   f"{' (parameters redacted)' if capture_log.redact_params else ''} · replay with "
+                   f"`python workload_capture.py {capture_log.path} --dsn <target> --speed 1`")
+        if st.button("⏹️ Stop Capture", key="stop_capture"):
+            db_manager.stop_capture()
+            st.rerun()
+
+def get_sql_catalog():
+    """Get the shared SQL file catalog for the directories configured in Settings"""
+    directories = None
+    if 'settings' in st.session_state and st.session_state.settings.get('sql_dirs'):
+        directories = st.session_state.settings['sql_dirs']
+    return get_catalog(directories)
+
+def read_sql_file(file_name: str) -> List[Dict[str, str]]:
+    """Read SQL file from the catalog and split into individual queries with full comment name extraction"""
+    catalog = get_sql_catalog()
+    if catalog.find(file_name) is None:
+        logger.error(f"File not found: {file_name} in {catalog.directories}")
+        st.error(f"❌ File not found: {file_name} (searched: {', '.join(catalog.directories)})")
         return []
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-        queries = []
-        current_query = []
-        current_name = None
-        in_comment = False
-        query_id = 0
-        for line in content.split('\n'):
-            line = line.strip()
-            if line.startswith('/*'):
-                in_comment = True
-                continue
-            if line.endswith('*/'):
-                in_comment = False
-                continue
-            if in_comment:
-                continue
-            if line.startswith('-- Query') or line.startswith('-- Statement'):
-                match = re.match(r'-- (?:Query|Statement) \d+:\s*(.*)', line)
-                if match:
-                    if current_query and current_name:
-                        queries.append({
-                            'name': current_name,
-                            'sql': '\n'.join(current_query).strip().rstrip(';').strip(),
-                            'id': query_id
-                        })
-                        current_query = []
-                    query_id += 1
-                    current_name = f"Query {query_id}: {match.group(1).strip()}"
-                continue
-            if line.startswith('--'):
-                continue
-            if line:
-                current_query.append(line)
-            if line.endswith(';') and current_query:
-                query_text = '\n'.join(current_query).strip().rstrip(';').strip()
-                if query_text:
-                    if not current_name:
-                        query_id += 1
-                        current_name = f"Query {query_id}: Unnamed"
-                    queries.append({
-                        'name': current_name,
-                        'sql': query_text,
-                        'id': query_id
-                    })
-                current_query = []
-                current_name = None
-        if current_query and current_name:
-            query_text = '\n'.join(current_query).strip().rstrip(';').strip()
-            if query_text:
-                if not current_name:
-                    query_id += 1
-                    current_name = f"Query {query_id}: Unnamed"
-                queries.append({
-                    'name': current_name,
-                    'sql': query_text,
-                    'id': query_id
-                })
-        return queries
+        # Tokenizer-based split (dollar quotes, literals, nested comments), re-parsed only when the file changes
+        return catalog.get_statements(file_name)
     except Exception as e:
-        logger.error(f"Error reading SQL file {file_path}: {str(e)}")
-        st.error(f"❌ Error reading {file_path}: {str(e)}")
+        logger.error(f"Error reading SQL file {file_name}: {str(e)}")
+        st.error(f"❌ Error reading {file_name}: {str(e)}")
         return []
 
 def show_queries():
@@ -1090,8 +1348,7 @@ def show_queries():
     st.markdown('<div class="ltr">', unsafe_allow_html=True)
     st.markdown("### 📋 Queries")
     render_navigation_buttons()
-    queries_path = r"\\wsl.localhost\docker-desktop\mnt\docker-desktop-disk\data\docker\volumes\pgadmin_data\_data\storage\e.solomon.co.il_gmail.com\Queries.sql"
-    queries = read_sql_file(queries_path)
+    queries = read_sql_file('Queries.sql')
     if not queries:
         st.error("❌ No queries found or error reading Queries.sql")
         render_back_to_home_button()
@@ -1099,46 +1356,121 @@ def show_queries():
     for query in queries:
         with st.expander(f"🔍 {query['name']}"):
             st.code(query['sql'], language='sql')
+            with st.popover("⚙️ Limits"):
+                session_policy = st.session_state.db_manager.query_policy
+                timeout_s = st.number_input("⏱️ Timeout (seconds)", min_value=0, max_value=3600,
+                                            value=int(session_policy.statement_timeout_ms // 1000),
+                                            key=f"timeout_query_{query['id']}")
+                max_rows = st.number_input("📏 Max rows", min_value=0, max_value=10000000,
+                                           value=int(session_policy.max_rows), step=1000,
+                                           key=f"max_rows_query_{query['id']}")
             if st.button(f"🚀 Run Query {query['id']}", key=f"run_query_{query['id']}"):
-                with st.spinner(f"Running query: {query['name']}..."):
-                    try:
-                        with st.session_state.db_manager.engine.connect() as conn:
-                            result = conn.execute(text(query['sql']))
-                            conn.commit()
-                            rows = result.fetchall()
-                            if rows:
-                                df = pd.DataFrame(rows, columns=result.keys())
-                                st.dataframe(df, use_container_width=True, height=min(len(df) * 35, 400))
-                                st.markdown(f"**Found {len(df)} records**")
-                                csv = df.to_csv(index=False)
-                                st.download_button(
-                                    label="📥 Download as CSV",
-                                    data=csv,
-                                    file_name=f"query_{query['id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                    mime="text/csv",
-                                    use_container_width=True
-                                )
-                            else:
-                                st.success(f"✅ Query {query['id']} executed successfully (no data returned)")
-                    except Exception as e:
-                        st.error(f"❌ Error executing Query {query['id']}: {str(e)}")
+                policy = session_policy.merged(statement_timeout_ms=int(timeout_s) * 1000, max_rows=int(max_rows))
+                try:
+                    df, info = run_query_with_cancel(query['sql'], f"query_{query['id']}", policy)
+                except Exception as e:
+                    st.error(f"❌ Error executing Query {query['id']}: {str(e)}")
+                    continue
+                if info['status'] in ('timeout', 'lock_timeout', 'cancelled', 'error'):
+                    st.error(f"❌ Query {query['id']} {info['status'].replace('_', ' ')}: {info['reason']}")
+                elif not df.empty:
+                    if info['status'] == 'truncated':
+                        st.warning(f"✂️ Result cut off: {info['reason']}")
+                    st.dataframe(df, use_container_width=True, height=min(len(df) * 35, 400))
+                    st.markdown(f"**Found {len(df)} records** in {info['elapsed_ms']:.0f} ms")
+                    csv = df.to_csv(index=False)
+                    st.download_button(
+                        label="📥 Download as CSV",
+                        data=csv,
+                        file_name=f"query_{query['id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
+                else:
+                    affected = f" ({info['rowcount']} rows affected)" if info['rowcount'] is not None else ""
+                    st.success(f"✅ Query {query['id']} executed successfully (no data returned){affected}")
+    render_workload_runner(queries)
     render_back_to_home_button()
     st.markdown('</div>', unsafe_allow_html=True)
 
+def run_query_with_cancel(sql_text: str, key: str, policy=None):
+    """Run a guarded query in a worker thread while offering a Cancel button"""
+    # Clicking Cancel (or leaving the page) stops this script run at the next UI update,
+    # and the finally block then cancels the backend with pg_cancel_backend
+    db_manager = st.session_state.db_manager
+    query_id = uuid.uuid4().hex
+    status_box = st.empty()
+    cancel_box = st.empty()
+    cancel_box.button("⏹️ Cancel", key=f"cancel_{key}")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(db_manager.run_guarded_query, sql_text, None, policy, query_id)
+        started = time.perf_counter()
+        try:
+            while not future.done():
+                status_box.caption(f"⏳ Running for {time.perf_counter() - started:.1f} s...")
+                time.sleep(0.2)
+        finally:
+            if not future.done():
+                db_manager.cancel_query(query_id)
+    status_box.empty()
+    cancel_box.empty()
+    return future.result()
+
+def render_workload_runner(queries: List[Dict[str, str]]):
+    """Run selected queries concurrently and report latency distributions"""
+    from workload import query_item, run_workload
+    st.markdown("### 🏋️ Workload Runner")
+    with st.form("workload_form"):
+        selected = st.multiselect(
+            "Queries to run",
+            options=[q['id'] for q in queries],
+            default=[q['id'] for q in queries],
+            format_func=lambda qid: next(q['name'] for q in queries if q['id'] == qid)
+        )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            parallelism = st.number_input("Parallelism", min_value=1, max_value=15, value=4, step=1)
+        with col2:
+            repeat = st.number_input("Repeats per query", min_value=1, max_value=1000, value=10, step=1)
+        with col3:
+            warmup = st.number_input("Warm-up runs", min_value=0, max_value=100, value=1, step=1)
+        submitted = st.form_submit_button("🏋️ Run Workload", use_container_width=True)
+    if submitted and selected:
+        items = [query_item(q['name'], q['sql']) for q in queries if q['id'] in selected]
+        with st.spinner(f"Running {len(items) * repeat} executions at parallelism {parallelism}..."):
+            stats, samples, summary = run_workload(st.session_state.db_manager, items, parallelism, repeat, warmup)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("🚀 Throughput", f"{summary['throughput_per_s']:.1f} /s")
+        with col2:
+            st.metric("⏱️ Wall Time", f"{summary['wall_time_s']:.2f} s")
+        with col3:
+            st.metric("❌ Errors", f"{summary['errors']:,}")
+        st.dataframe(stats.round(2), use_container_width=True, hide_index=True)
+        if 'p95_ms' in stats.columns:
+            st.bar_chart(stats.set_index('name')[['p50_ms', 'p95_ms']])
+        st.download_button(
+            label="📥 Download raw samples",
+            data=samples.to_csv(index=False),
+            file_name=f"workload_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+
 def show_main_programs():
     """Display and execute main SQL programs with enhanced UI and results display"""
     st.markdown('<div class="ltr">', unsafe_allow_html=True)
     st.markdown("### 📚 Main Programs")
     render_navigation_buttons()
 
-    base_path = r"\\wsl.localhost\docker-desktop\mnt\docker-desktop-disk\data\docker\volumes\pgadmin_data\_data\storage\e.solomon.co.il_gmail.com"
-    program_files = ['main_program_1.sql', 'main_program_2.sql']
+    catalog = get_sql_catalog()
+    program_files = catalog.list_files('main_program_*.sql')
+    if not program_files:
+        st.error(f"❌ No main_program_*.sql files found in: {', '.join(catalog.directories)}")
 
     for program_file in program_files:
-        program_path = os.path.join(base_path, program_file)
         try:
-            with open(program_path, 'r', encoding='utf-8') as file:
-                sql_content = file.read()
+            sql_content = catalog.get_text(program_file) or ""
         except Exception as e:
             st.error(f"❌ Error reading {program_file}: {str(e)}")
             continue
@@ -1151,100 +1483,158 @@ def show_main_programs():
         with st.expander(f"📖 {program_name}", expanded=False):
             st.markdown(f"**Program: {program_name}**")
             st.code(sql_content, language='sql')
+            col1, col2 = st.columns(2)
+            with col1:
+                on_error = st.radio("On error", ["Stop and roll back", "Continue"], horizontal=True,
+                                    key=f"on_error_{program_file}")
+            with col2:
+                explain = st.checkbox("📐 Capture plans (EXPLAIN)", value=True, key=f"explain_{program_file}")
             if st.button(f"🚀 Run", key=f"run_program_{program_file}"):
-                execute_sql_program(program_name, sql_content)
+                execute_sql_program(program_name, sql_content, on_error == "Stop and roll back", explain)
 
 
     render_back_to_home_button()
     st.markdown('</div>', unsafe_allow_html=True)
 
 
-def execute_sql_program(program_name: str, sql_content: str):
-    """Execute SQL program and display results with notices"""
+def execute_sql_program(program_name: str, sql_content: str, stop_on_error: bool = True, explain: bool = True):
+    """Execute SQL program statement by statement and display the per-statement report"""
     with st.spinner(f"Running {program_name}..."):
         try:
-            # Create raw psycopg2 connection for NOTICE support
-            raw_conn = st.session_state.db_manager.engine.raw_connection()
-            raw_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-
-            try:
-                with raw_conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                    # Execute the SQL content
-                    cursor.execute(sql_content)
-
-                    # Capture notices
-                    notices = []
-                    if hasattr(raw_conn, 'notices') and raw_conn.notices:
-                        notices = [notice.message.strip() if hasattr(notice, 'message') else str(notice).strip()
-                                   for notice in raw_conn.notices]
-
-                    # Try to fetch results if available
-                    results_data = []
-                    try:
-                        # Check if there are results to fetch
-                        if cursor.description:
-                            results = cursor.fetchall()
-                            if results:
-                                # Convert to list of dictionaries for DataFrame
-                                results_data = [dict(row) for row in results]
-                    except Exception as fetch_error:
-                        # Some queries don't return results (like procedures)
-                        st.info(f"ℹ️ No results to fetch: {str(fetch_error)}")
-
-                    # Display results
-                    display_execution_results(program_name, results_data, notices)
-
-            finally:
-                raw_conn.close()
-
+            steps, results, summary = st.session_state.db_manager.run_sql_program(
+                sql_content, stop_on_error=stop_on_error, explain=explain)
         except Exception as e:
             st.error(f"❌ Error executing {program_name}: {str(e)}")
             st.exception(e)  # Show full traceback for debugging
+            return
+    display_execution_results(program_name, steps, results, summary)
 
 
-def display_execution_results(program_name: str, results_data: list, notices: list):
-    """Display execution results including data and notices"""
-
-    # Show success message
-    st.success(f"✅ {program_name} executed successfully!")
-
-    # Display notices if any
-    if notices:
-        st.markdown("### 📢 Notices:")
-        for i, notice in enumerate(notices, 1):
-            if notice.strip():  # Only show non-empty notices
-                st.info(f"**Notice {i}: ** {notice}")
+def display_execution_results(program_name: str, steps: pd.DataFrame, results: Dict[int, pd.DataFrame],
+                              summary: Dict[str, Any]):
+    """Display the program summary, a statement timeline and each statement's notices, plan and results"""
+    if summary['failed'] == 0:
+        st.success(f"✅ {program_name} executed successfully!")
+    elif summary['committed']:
+        st.warning(f"⚠️ {program_name} finished with {summary['failed']} failed statement(s); the rest was committed")
+    else:
+        st.error(f"❌ {program_name} stopped at a failing statement; the transaction was rolled back")
 
-    # Display data results if any
-    if results_data:
-        st.markdown("### 📊 Results:")
-        try:
-            df = pd.DataFrame(results_data)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("📜 Statements", summary['statements'])
+    col2.metric("✅ Succeeded", summary['succeeded'])
+    col3.metric("❌ Failed", summary['failed'])
+    col4.metric("⏱️ Total Time", f"{summary['elapsed_ms']:.1f} ms")
 
-            # Display basic info about the results
-            st.markdown(f"**Rows returned:** {len(df)}")
-            if not df.empty:
-                st.markdown(f"**Columns:** {', '.join(df.columns.tolist())}")
+    timed = steps.dropna(subset=['start_ms']).copy()
+    if not timed.empty:
+        # Timeline: one bar per statement from its start to its end, so the slow statements stand out
+        st.markdown("### 🕒 Timeline:")
+        timed['end_ms'] = timed['start_ms'] + timed['duration_ms']
+        timed['label'] = timed.apply(lambda r: f"#{r['step']} (line {r['line']})", axis=1)
+        timed['preview'] = timed['statement'].str.slice(0, 80)
+        import altair as alt  # Only needed for this chart
+        chart = alt.Chart(timed).mark_bar().encode(
+            x=alt.X('start_ms:Q', title='ms since start'),
+            x2='end_ms:Q',
+            y=alt.Y('label:N', sort=None, title=None),
+            color=alt.Color('status:N', scale=alt.Scale(domain=['ok', 'rolled back', 'error'],
+                                                        range=['#2e7d32', '#f9a825', '#c62828'])),
+            tooltip=['step', 'line', 'status', alt.Tooltip('duration_ms:Q', format='.2f'), 'rowcount', 'preview']
+        )
+        st.altair_chart(chart, use_container_width=True)
 
-            # Display the data
-            if len(df) > 0:
-                # Show first few rows in a nice format
+    st.markdown("### 📋 Statements:")
+    for step in steps.itertuples(index=False):
+        icon = {'ok': '✅', 'error': '❌', 'rolled back': '↩️', 'skipped': '⏭️'}.get(step.status, '⏸️')
+        duration = f" · {step.duration_ms:.2f} ms" if pd.notna(step.duration_ms) else ""
+        with st.expander(f"{icon} #{step.step} (line {step.line}) · {step.status}{duration}"):
+            st.code(step.statement, language='sql')
+            if pd.notna(step.rowcount):
+                st.markdown(f"**Rows affected/returned:** {int(step.rowcount)}")
+            if step.error:
+                st.error(step.error)
+            if step.notices:
+                st.markdown("**📢 Notices:**")
+                for i, notice in enumerate(step.notices.splitlines(), 1):
+                    st.info(f"**Notice {i}: ** {notice}")
+            if step.plan:
+                st.markdown("**📐 Plan:**")
+                st.code(step.plan)
+            df = results.get(step.step)
+            if df is not None and not df.empty:
                 st.dataframe(df, use_container_width=True)
-
-                # Option to download results as CSV
-                csv = df.to_csv(index=False)
                 st.download_button(
                     label="📥 Download Results as CSV",
-                    data=csv,
-                    file_name=f"{program_name}_results.csv",
-                    mime="text/csv"
+                    data=df.to_csv(index=False),
+                    file_name=f"{program_name}_step{step.step}_results.csv",
+                    mime="text/csv",
+                    key=f"download_{program_name}_{step.step}"
                 )
-            else:
-                st.info("No data rows returned")
 
-        except Exception as df_error:
-            st.warning(f"Could not format results as DataFrame: {str(df_error)}")
-            # Show raw results
-            st.json(results_data)
-    else:
-        st.info("ℹ️ No data results returned (this is normal for procedures that only perform operations)")
\ No newline at end of file
+    st.download_button(
+        label="📥 Download Statement Report as CSV",
+        data=steps.to_csv(index=False),
+        file_name=f"{program_name}_report.csv",
+        mime="text/csv",
+        key=f"download_{program_name}_report"
+    )
+
+def show_room_availability():
+    """Free rooms for a stay and the best room for a student, answered from the room_occupancy index"""
+    st.markdown('<div class="ltr">', unsafe_allow_html=True)
+    st.markdown("### 🛏️ Room Availability")
+    render_navigation_buttons()
+    if not st.session_state.db_manager:
+        st.error("❌ No database connection.")
+        render_back_to_home_button()
+        return
+    db_manager = st.session_state.db_manager
+
+    col1, col2 = st.columns(2)
+    with col1:
+        check_in = st.date_input("📅 Check-in", value=date.today(), key="rooms_check_in")
+    with col2:
+        check_out = st.date_input("📅 Check-out", value=date(date.today().year + 1, date.today().month, 1),
+                                  key="rooms_check_out")
+    if check_out < check_in:
+        st.error("❌ Check-out must not be before check-in.")
+        render_back_to_home_button()
+        return
+
+    free_df, info = db_manager.get_free_rooms(check_in, check_out)
+    if info['status'] == 'error':
+        st.error(f"❌ {info['reason']}")
+        st.info("ℹ️ Build the occupancy index first: python occupancy.py --dsn <connection string> --install")
+        render_back_to_home_button()
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🚪 Free Rooms", f"{len(free_df):,}")
+    col2.metric("🛏️ Free Beds", f"{int(free_df['free_beds'].sum()) if not free_df.empty else 0:,}")
+    col3.metric("⏱️ Query Time", f"{info['elapsed_ms']:.1f} ms")
+    if info['status'] == 'truncated':
+        st.warning(f"⚠️ Showing the first {info['rows']:,} rooms: {info['reason']}")
+    st.dataframe(free_df, use_container_width=True, hide_index=True)
+
+    st.markdown("### 🎓 Best Room for a Student")
+    student_id = st.number_input("Student ID", min_value=1, step=1, value=None, key="rooms_student_id")
+    if student_id is not None:
+        best_df, info = db_manager.get_best_rooms(int(student_id), check_in, check_out)
+        if info['status'] not in ('ok', 'truncated'):
+            st.error(f"❌ {info['reason']}")
+        elif best_df.empty:
+            st.info("ℹ️ No free room suits this student for the whole stay (or the student does not exist).")
+        else:
+            st.caption("Never with roommates of another gender; then most roommates of the same major, "
+                       "the fullest room and a balcony")
+            st.dataframe(best_df, use_container_width=True, hide_index=True)
+            room_id = st.selectbox("Room", best_df['roomid'].tolist(), key="rooms_assign_room")
+            if st.button("✅ Assign", key="rooms_assign_button", type="primary"):
+                notices = db_manager.assign_room(int(student_id), int(room_id), check_in, check_out)
+                for notice in notices:  # The procedure reports success and failure as notices
+                    if notice.startswith("Student "):
+                        st.success(f"✅ {notice}")
+                    else:
+                        st.error(f"❌ {notice}")
+    render_back_to_home_button()
+    st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
@@ -1,16 +1,20 @@
 import streamlit as st
-from database_manager import DatabaseManager
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def authenticate_user(username: str, password: str, host: str = "localhost", port: str = "5432", database: str = "mydatabase") -> bool:
+def authenticate_user(username: str, password: str, host: str = "localhost", port: str = "5432",
+                      database: str = "mydatabase", replicas: str = "") -> bool:
     """Authenticate user"""
+    from database_manager import DatabaseManager  # Imported on first login, not on the first page render
     try:
         connection_string = f"postgresql://{username}:{password}@{host}:{port}/{database}"
+        # Read replicas ("host:port, host:port") use the same credentials and database
+        replica_strings = [f"postgresql://{username}:{password}@{replica.strip()}/{database}"
+                           for replica in replicas.split(',') if replica.strip()]
         db_manager = DatabaseManager()
-        if db_manager.connect(connection_string):
+        if db_manager.connect(connection_string, replica_strings=replica_strings):
             st.session_state.db_manager = db_manager
             st.session_state.connection_string = connection_string
             st.session_state.authenticated = True
@@ -0,0 +1,525 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as time_of_day, timedelta
+from decimal import Decimal
+import argparse
+import base64
+import getpass
+import hashlib
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql as pg_sql
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CAPTURE_LOG_ENV = "DB_CAPTURE_LOG"  # When set, every DatabaseManager records its statements to this file
+CAPTURE_REDACT_ENV = "DB_CAPTURE_REDACT"  # When 1, statement parameters are left out of capture logs
+_READ_COMMANDS = ('SELECT', 'WITH', 'TABLE', 'VALUES', 'SHOW', 'EXPLAIN')
+
+
+def _default_capture_dir() -> str:
+    """Per-user capture folder in the system temp directory"""
+    user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), f'db_workload_{user}')
+
+
+def default_capture_path() -> str:
+    """Capture log from DB_CAPTURE_LOG, or a file in a per-user folder of the system temp directory"""
+    return os.environ.get(CAPTURE_LOG_ENV) or os.path.join(_default_capture_dir(), 'capture.jsonl')
+
+
+def default_redact_params() -> bool:
+    """Whether capture logs leave out statement parameters (DB_CAPTURE_REDACT=1)"""
+    return os.environ.get(CAPTURE_REDACT_ENV, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def _private_directory(directory: str) -> None:
+    """Create the default capture folder for the current user only, and refuse one that others can reach"""
+    # Purpose: The temp folder is shared; a folder created there first by another user, or opened to
+    # other users, would let them read the captured statements and their parameters
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        return  # Windows: the temp folder is already per user
+    info = os.stat(directory)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"Capture directory {directory} is owned by another user")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"Capture directory {directory} is accessible to other users "
+                              f"(mode {oct(info.st_mode & 0o777)}); run chmod 700 on it")
+
+
+def _open_private(path: str):
+    """Open a log for appending, readable and writable by the current user only"""
+    # Purpose: Logs hold statement parameters (names, phones, emails); the file is created with mode
+    # 0600 rather than the umask default, an existing log is narrowed to it, and a symlink is refused
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    try:
+        if hasattr(os, 'fchmod') and os.fstat(fd).st_mode & 0o077:
+            os.fchmod(fd, 0o600)
+        return os.fdopen(fd, 'a', encoding='utf-8')
+    except BaseException:
+        os.close(fd)
+        raise
+
+
+def _encode(value: Any) -> Any:
+    """JSON form of a statement parameter; non-JSON types are tagged so replay binds the same type"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, tuple):  # psycopg2 binds tuples as (a, b) lists for IN, lists as ARRAYs
+        return {'$t': [_encode(item) for item in value]}
+    if isinstance(value, dict):
+        return {'$m': {str(key): _encode(item) for key, item in value.items()}}
+    if isinstance(value, Decimal):
+        return {'$n': str(value)}
+    if isinstance(value, datetime):
+        return {'$ts': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    if isinstance(value, time_of_day):
+        return {'$tm': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'$iv': value.total_seconds()}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$b': base64.b64encode(bytes(value)).decode('ascii')}
+    return {'$s': str(value)}  # Other adapted types replay as text literals
+
+
+def _decode(value: Any) -> Any:
+    """Inverse of _encode"""
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict) or len(value) != 1:
+        return value
+    (tag, item), = value.items()
+    decoders = {'$t': lambda v: tuple(_decode(i) for i in v), '$m': lambda v: {k: _decode(i) for k, i in v.items()},
+                '$n': Decimal, '$ts': datetime.fromisoformat, '$d': date.fromisoformat,
+                '$tm': time_of_day.fromisoformat, '$iv': lambda v: timedelta(seconds=v),
+                '$b': base64.b64decode, '$s': str}
+    return decoders[tag](item) if tag in decoders else value
+
+
+def _encode_params(params: Any) -> Any:
+    """Top-level parameters: a sequence stays a JSON list, a mapping a JSON object"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {str(key): _encode(value) for key, value in params.items()}
+    return [_encode(value) for value in params]
+
+
+def _decode_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _decode(value) for key, value in params.items()}
+    return [_decode(value) for value in params]
+
+
+class CaptureLog:
+    """Append-only log of the statements issued by one DatabaseManager (one app session)"""
+    # Purpose: One JSON line per event, with short keys. A statement's text is written once per log writer
+    # ({"k": "s", "h": hash, "q": text}); executions refer to it by hash, so repeated statements cost a few
+    # dozen bytes. Events carry wall-clock start, duration, session and lane (one per database connection),
+    # which is what the replay needs to reproduce timing and concurrency. Several sessions and processes may
+    # append to the same file: each event is a single write of complete lines.
+    # With redact_params, parameters are replaced by a marker ("x": 1); replay skips those statements.
+    def __init__(self, path: str, session_id: Optional[str] = None, redact_params: Optional[bool] = None):
+        self.path = path
+        self.session_id = session_id or uuid.uuid4().hex[:8]
+        self.redact_params = default_redact_params() if redact_params is None else redact_params
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory == os.path.abspath(_default_capture_dir()):
+            _private_directory(directory)
+        else:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._file = _open_private(path)
+        self._lock = threading.Lock()
+        self._known = set()  # Hashes of statements already written by this writer
+        self._lanes = itertools.count(1)
+        self.events = 0
+        self.closed = False
+
+    def new_lane(self) -> int:
+        """Number a new connection of this session"""
+        return next(self._lanes)
+
+    def record(self, lane: int, kind: str, query: Any, params: Any, started: float, duration_ms: float,
+               rowcount: Optional[int] = None, error: Optional[str] = None, autocommit: bool = False) -> None:
+        """Append one executed statement (kind: execute, many, callproc, copy) or commit / rollback"""
+        if self.closed:
+            return
+        event = {'k': kind, 't': round(started, 6), 's': self.session_id, 'c': lane, 'd': round(duration_ms, 3)}
+        lines = []
+        if query is not None:
+            digest = hashlib.blake2b(query.encode('utf-8'), digest_size=6).hexdigest()
+            event['h'] = digest
+            if params is not None and self.redact_params:
+                event['x'] = 1
+            elif params is not None:
+                event['p'] = _encode_params(params)
+        if rowcount is not None and rowcount >= 0:
+            event['r'] = rowcount
+        if error:
+            event['e'] = error
+        if autocommit:
+            event['a'] = 1
+        with self._lock:
+            if self.closed:
+                return
+            if query is not None and digest not in self._known:
+                self._known.add(digest)
+                lines.append(json.dumps({'k': 's', 'h': digest, 'q': query}, separators=(',', ':')))
+            lines.append(json.dumps(event, separators=(',', ':'), default=str))
+            self._file.write('\n'.join(lines) + '\n')
+            self._file.flush()
+            self.events += 1
+
+    def connection_factory(self) -> Callable[..., 'CapturingConnection']:
+        """psycopg2 connection_factory whose connections record into this log"""
+        def connect(dsn: str, async_: int = 0) -> CapturingConnection:
+            conn = CapturingConnection(dsn, async_)
+            conn.capture_log = self
+            conn.lane = self.new_lane()
+            return conn
+        return connect
+
+    def size(self) -> int:
+        """Bytes written to the log file so far (by all writers)"""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def close(self) -> None:
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self._file.close()
+
+
+def _statement_text(query: Any, cursor) -> str:
+    """Text of a statement given as str, bytes or psycopg2.sql object"""
+    if isinstance(query, pg_sql.Composable):
+        return query.as_string(cursor)
+    if isinstance(query, (bytes, bytearray)):
+        return bytes(query).decode('utf-8', 'replace')
+    return str(query)
+
+
+def _error_text(error: Exception) -> str:
+    return f"{type(error).__name__}: {str(error).strip().splitlines()[0] if str(error).strip() else ''}"
+
+
+class _CapturingCursor:
+    """Cursor mixin that records every statement in its connection's capture log"""
+    def _captured(self, kind: str, query: Any, params: Any, call: Callable[[], Any]) -> Any:
+        started, clock, error = time.time(), time.perf_counter(), None
+        try:
+            return call()
+        except Exception as e:
+            error = _error_text(e)
+            raise
+        finally:
+            self.connection.capture(kind, _statement_text(query, self), params, started,
+                                    (time.perf_counter() - clock) * 1000, self.rowcount, error)
+
+    def execute(self, query, vars=None):
+        return self._captured('execute', query, vars, lambda: super(_CapturingCursor, self).execute(query, vars))
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        return self._captured('many', query, vars_list,
+                              lambda: super(_CapturingCursor, self).executemany(query, vars_list))
+
+    def callproc(self, procname, parameters=None):
+        return self._captured('callproc', procname, parameters,
+                              lambda: super(_CapturingCursor, self).callproc(procname, parameters))
+
+    def copy_expert(self, sql, file, size=8192):
+        # COPY data is not kept; replay skips COPY statements
+        return self._captured('copy', sql, None, lambda: super(_CapturingCursor, self).copy_expert(sql, file, size))
+
+
+_cursor_classes = {}
+
+
+def _capturing_cursor(factory: type) -> type:
+    """Capturing subclass of a cursor class (plain, RealDictCursor, ...), created once per class"""
+    cls = _cursor_classes.get(factory)
+    if cls is None:
+        cls = _cursor_classes.setdefault(factory, type(f"Capturing{factory.__name__}", (_CapturingCursor, factory), {}))
+    return cls
+
+
+class CapturingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors, commits and rollbacks are recorded in a CaptureLog"""
+    capture_log = None
+    lane = 0
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _capturing_cursor(factory)
+        return super().cursor(*args, **kwargs)
+
+    def _timed_end(self, kind: str, call: Callable[[], None]) -> None:
+        started, clock, error = time.time(), time.perf_counter(), None
+        try:
+            call()
+        except Exception as e:
+            error = _error_text(e)
+            raise
+        finally:
+            self.capture(kind, None, None, started, (time.perf_counter() - clock) * 1000, None, error)
+
+    def commit(self):
+        self._timed_end('commit', super().commit)
+
+    def rollback(self):
+        self._timed_end('rollback', super().rollback)
+
+    def capture(self, kind: str, query: Optional[str], params: Any, started: float, duration_ms: float,
+                rowcount: Optional[int], error: Optional[str]) -> None:
+        if self.capture_log is not None:
+            self.capture_log.record(self.lane, kind, query, params, started, duration_ms, rowcount, error,
+                                    self.autocommit)
+
+
+def load_log(path: str) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+    """Read a capture log: statement texts by hash, and the events ordered by start time"""
+    statements, events = {}, []
+    with open(path, encoding='utf-8') as log_file:
+        for number, line in enumerate(log_file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable line {number} of {path}")  # e.g. cut off by a crash
+                continue
+            if record.get('k') == 's':
+                statements[record['h']] = record['q']
+            else:
+                events.append(record)
+    events.sort(key=lambda event: event['t'])
+    return statements, events
+
+
+def _is_read(query: str) -> bool:
+    words = query.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in _READ_COMMANDS
+
+
+def _replay_lane(dsn: str, events: List[Dict[str, Any]], statements: Dict[str, str], started: float,
+                 first_t: float, speed: float, reads_only: bool) -> List[Dict[str, Any]]:
+    """Re-run the events of one captured connection, in order, on one connection at their scaled offsets"""
+    results = []
+    conn = None  # Opened at the lane's first event, so only overlapping lanes hold connections at once
+    try:
+        for event in events:
+            if speed > 0:
+                delay = started + (event['t'] - first_t) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if conn is None:
+                conn = psycopg2.connect(dsn)
+                if reads_only:
+                    # The first word does not tell every write: functions, EXPLAIN ANALYZE and data-modifying
+                    # WITH write too, so the server refuses them instead. The session default also covers the
+                    # autocommit statements, which psycopg2's readonly flag does not reach after a mode switch.
+                    conn.set_session(readonly=True)
+                    with conn.cursor() as cursor:
+                        cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+                    conn.commit()
+            kind, query = event['k'], statements.get(event.get('h'))
+            if kind in ('commit', 'rollback'):
+                getattr(conn, 'rollback' if reads_only else kind)()  # A reads-only replay never commits
+                continue
+            skipped_read = reads_only and (kind != 'execute' or not _is_read(query or ''))
+            if query is None or kind == 'copy' or event.get('x') or skipped_read:  # x: parameters redacted
+                results.append({'event': event, 'latency_ms': None, 'error': None, 'skipped': True})
+                continue
+            autocommit = bool(event.get('a'))
+            if conn.autocommit != autocommit:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+                conn.autocommit = autocommit
+            params = _decode_params(event.get('p'))
+            clock, error = time.perf_counter(), None
+            try:
+                with conn.cursor() as cursor:
+                    if kind == 'many':
+                        cursor.executemany(query, params or [])
+                    elif kind == 'callproc':
+                        cursor.callproc(query, params)
+                    else:
+                        cursor.execute(query, params)
+                    if cursor.description is not None:
+                        cursor.fetchall()
+            except psycopg2.Error as e:
+                error = _error_text(e)
+            results.append({'event': event, 'latency_ms': (time.perf_counter() - clock) * 1000, 'error': error,
+                            'skipped': False})
+    finally:
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+    return results
+
+
+def _peak_overlap(lanes: Dict[Any, List[Dict[str, Any]]]) -> int:
+    """Most captured connections busy at the same time (from their first event to the end of their last)"""
+    edges = []
+    for lane_events in lanes.values():
+        edges.append((lane_events[0]['t'], 1))
+        edges.append((max(event['t'] + event['d'] / 1000 for event in lane_events), -1))
+    peak = busy = 0
+    for _, step in sorted(edges):  # At the same instant a lane ending frees its place before the next starts
+        busy += step
+        peak = max(peak, busy)
+    return peak
+
+
+def replay(dsn: str, path: str, speed: float = 1.0, reads_only: bool = False,
+           max_lanes: int = 64) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Re-run a capture log against a database with the original concurrency and (scaled) timing.
+
+    Every captured connection (session and lane) becomes one replay connection that runs its statements in
+    their original order, each started at its original offset divided by speed (0: as fast as possible), so
+    statements that overlapped in production overlap again.
+
+    Args:
+        dsn: Target database (a copy: writes are replayed unless reads_only)
+        path: Capture log written by CaptureLog
+        speed: Time scale, e.g. 1 for real time, 10 for ten times faster, 0 for no waiting
+        reads_only: Replay only SELECT-like statements, on read-only connections that roll back instead of
+            committing (safe against production or a replica)
+        max_lanes: Most connections replayed at once; a log whose captured connections overlap more than this
+            is refused, since queued lanes would start late (with speed 0, lanes simply queue)
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, Any]]: (per-statement latency deltas, summary)
+    """
+    statements, events = load_log(path)
+    if not events:
+        raise ValueError(f"No events in {path}")
+    lanes = defaultdict(list)
+    for event in events:
+        lanes[(event['s'], event['c'])].append(event)
+    first_t = events[0]['t']
+    workers = min(max_lanes, len(lanes))
+    if speed > 0:
+        # One thread per lane: each sleeps until its lane's first offset, so no lane waits for another's
+        # whole timeline; only lanes that overlapped in the capture hold connections at the same time
+        peak = _peak_overlap(lanes)
+        if peak > max_lanes:
+            raise ValueError(f"{peak} captured connections overlap, more than max_lanes ({max_lanes}); "
+                             f"raise it to replay them at their original offsets")
+        workers = len(lanes)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_replay_lane, dsn, lane_events, statements, started, first_t, speed, reads_only)
+                   for lane_events in lanes.values()]
+        results = [result for future in futures for result in future.result()]
+    wall_time = time.perf_counter() - started
+    report = latency_deltas(results, statements)
+    replayed = [r for r in results if not r['skipped']]
+    summary = {
+        'events': len(events), 'statements': len(statements), 'sessions': len({e['s'] for e in events}),
+        'lanes': len(lanes), 'replayed': len(replayed), 'skipped': len(results) - len(replayed),
+        'new_errors': sum(1 for r in replayed if r['error'] and not r['event'].get('e')),
+        'fixed_errors': sum(1 for r in replayed if not r['error'] and r['event'].get('e')),
+        'captured_s': events[-1]['t'] - first_t, 'wall_time_s': wall_time, 'speed': speed,
+        'captured_ms': sum(r['event']['d'] for r in replayed), 'replayed_ms': sum(r['latency_ms'] for r in replayed),
+    }
+    logger.info(f"Replayed {summary['replayed']} statements on {summary['lanes']} connections in {wall_time:.1f}s "
+                f"({summary['skipped']} skipped, {summary['new_errors']} new errors)")
+    return report, summary
+
+
+def latency_deltas(results: List[Dict[str, Any]], statements: Dict[str, str]) -> pd.DataFrame:
+    """Per-statement captured vs replayed latency (milliseconds), largest slowdown first"""
+    rows = []
+    grouped = defaultdict(list)
+    for result in results:
+        if not result['skipped']:
+            grouped[result['event']['h']].append(result)
+    for digest, group in grouped.items():
+        captured = np.array([r['event']['d'] for r in group])
+        replayed = np.array([r['latency_ms'] for r in group])
+        captured_p50, captured_p95 = np.percentile(captured, [50, 95])
+        replayed_p50, replayed_p95 = np.percentile(replayed, [50, 95])
+        rows.append({'statement': ' '.join(statements[digest].split())[:80], 'executions': len(group),
+                     'errors': sum(1 for r in group if r['error']),
+                     'captured_p50_ms': captured_p50, 'replayed_p50_ms': replayed_p50,
+                     'captured_p95_ms': captured_p95, 'replayed_p95_ms': replayed_p95,
+                     'delta_p50_ms': replayed_p50 - captured_p50,
+                     'delta_pct': (replayed_p50 - captured_p50) / captured_p50 * 100 if captured_p50 > 0 else None,
+                     'total_delta_ms': float(replayed.sum() - captured.sum())})
+    report = pd.DataFrame(rows)
+    return report.sort_values('total_delta_ms', ascending=False) if len(report) else report
+
+
+def capture_summary(path: str) -> pd.DataFrame:
+    """Per-statement executions and captured latency of a log, most total time first"""
+    statements, events = load_log(path)
+    rows = defaultdict(list)
+    for event in events:
+        if 'h' in event:
+            rows[event['h']].append(event['d'])
+    report = pd.DataFrame([{'statement': ' '.join(statements.get(digest, '?').split())[:80],
+                            'executions': len(durations), 'total_ms': sum(durations),
+                            'p50_ms': float(np.percentile(durations, 50)), 'max_ms': max(durations)}
+                           for digest, durations in rows.items()])
+    return report.sort_values('total_ms', ascending=False) if len(report) else report
+
+
+def main():
+    """Summarize a capture log or replay it against a database"""
+    parser = argparse.ArgumentParser(description="Replay captured app database traffic and report latency deltas")
+    parser.add_argument("log", help="Capture log (see DB_CAPTURE_LOG or Settings → Workload Capture)")
+    parser.add_argument("--dsn", help="Database to replay against (omit to only summarize the log)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Time scale: 1 = real time, 10 = ten times faster, 0 = no waiting")
+    parser.add_argument("--reads-only", action="store_true",
+                        help="Replay only SELECT-like statements, on read-only connections that never commit")
+    parser.add_argument("--max-connections", type=int, default=64, help="Most captured connections replayed at once")
+    parser.add_argument("--output", help="Write the per-statement report to this CSV file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with pd.option_context('display.width', 220, 'display.max_columns', None, 'display.max_colwidth', 80):
+        if not args.dsn:
+            report = capture_summary(args.log)
+            print(report.round(2).to_string(index=False))
+        else:
+            report, summary = replay(args.dsn, args.log, args.speed, args.reads_only, args.max_connections)
+            print(report.round(2).to_string(index=False))
+            print(f"\n{summary['replayed']:,} of {summary['events']:,} events replayed "
+                  f"({summary['skipped']:,} skipped) from {summary['sessions']} sessions on {summary['lanes']} "
+                  f"connections; {summary['captured_s']:.1f}s captured, replayed in {summary['wall_time_s']:.1f}s "
+                  f"at speed {summary['speed']:g}")
+            print(f"Statement time {summary['captured_ms']:,.0f} ms captured → {summary['replayed_ms']:,.0f} ms "
+                  f"replayed; {summary['new_errors']} new errors, {summary['fixed_errors']} errors gone")
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
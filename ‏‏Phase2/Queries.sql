@@ -20,6 +20,14 @@ AND CURRENT_DATE BETWEEN r.checkindate AND r.checkoutdate
 ORDER BY b.buildingname, a.floornumber DESC;
 
 -- Query 2: Finds rooms where the same issue was reported more than once in the past year, to plan targeted renovations.
+-- The counts come from maintenance_room_counts_since (Phase4), which reads the maintenance rollup when it is
+-- installed; only the repeated issues' requests are read, for their days.
+WITH repeated AS (
+    SELECT c.roomid, c.issuedescription, c.month
+    FROM maintenance_room_counts_since((CURRENT_DATE - INTERVAL '1 year')::DATE) c
+    GROUP BY c.roomid, c.issuedescription, c.month
+    HAVING SUM(c.request_count) > 1
+)
 SELECT 
     r.roomid, 
     b.buildingname, 
@@ -28,13 +36,14 @@ SELECT
     STRING_AGG('Day ' || EXTRACT(DAY FROM mr.requestdate), ', ') AS requestdays,
 	EXTRACT(MONTH FROM mr.requestdate) AS requestmonth,
 	EXTRACT(YEAR FROM mr.requestdate) AS requestyear
-FROM room r
+FROM repeated x
+JOIN maintenance_request mr ON mr.roomid = x.roomid AND mr.issuedescription = x.issuedescription
+    AND mr.requestdate >= x.month AND mr.requestdate < x.month + INTERVAL '1 month'
+JOIN room r ON r.roomid = mr.roomid
 JOIN apartment a ON r.apartmentid = a.apartmentid AND r.buildingid = a.buildingid
 JOIN building b ON a.buildingid = b.buildingid
-JOIN maintenance_request mr ON r.roomid = mr.roomid
 WHERE mr.requestdate >= CURRENT_DATE - INTERVAL '1 year'
 GROUP BY r.roomid, b.buildingname, mr.issuedescription, EXTRACT(YEAR FROM mr.requestdate), EXTRACT(MONTH FROM mr.requestdate)
-HAVING COUNT(mr.requestid) > 1
 ORDER BY issuecount DESC;
 
 -- Query 3: Alerts students living in rooms with unresolved urgent issues (high priority or gas leaks).
@@ -74,12 +83,13 @@ WHERE l.discountpercent > 15
 ORDER BY l.discountpercent DESC;
 
 -- Query 5: Identifies students living in rooms with balconies who reported fewer than 2 issues, for a promotional video.
+-- Issue counts per room come from maintenance_room_counts_since (Phase4).
 SELECT 
     s.studentid, 
     s.firstname || ' ' || s.lastname AS fullname, 
     r.roomid, 
     b.buildingname, 
-    COUNT(mr.requestid) AS requestcount,
+    COALESCE(mr.requestcount, 0) AS requestcount,
     EXTRACT(MONTH FROM r.checkindate) AS checkinmonth,
 	EXTRACT(YEAR FROM r.checkindate) AS checkinyear
 FROM student s
@@ -87,11 +97,14 @@ JOIN rental r ON s.studentid = r.studentid
 JOIN room rm ON r.roomid = rm.roomid
 JOIN apartment a ON rm.apartmentid = a.apartmentid AND rm.buildingid = a.buildingid
 JOIN building b ON a.buildingid = b.buildingid
-LEFT JOIN maintenance_request mr ON rm.roomid = mr.roomid AND mr.requestdate >= CURRENT_DATE - INTERVAL '1 year'
+LEFT JOIN (
+    SELECT c.roomid, SUM(c.request_count) AS requestcount
+    FROM maintenance_room_counts_since((CURRENT_DATE - INTERVAL '1 year')::DATE) c
+    GROUP BY c.roomid
+) mr ON rm.roomid = mr.roomid
 WHERE rm.hasbalcony = TRUE
 AND CURRENT_DATE BETWEEN r.checkindate AND r.checkoutdate
-GROUP BY s.studentid, s.firstname, s.lastname, s.major, r.roomid, b.buildingname, r.checkindate
-HAVING COUNT(mr.requestid) < 2
+AND COALESCE(mr.requestcount, 0) < 2
 ORDER BY requestcount ASC;
 
 -- Query 6: Identifies rooms that are currently available or will be available by September 1, 2025, 
@@ -120,15 +133,15 @@ GROUP BY r.roomid, b.buildingname, a.floornumber, r.maxpeople, r.hasbalcony
 ORDER BY b.buildingname, r.roomid;
 
 -- Query 7: Identifies the top 20% of managers who offered the most discounts, to review their impact on profits.
+-- Discounted lease counts and average discounts per manager come from manager_discount_totals (Phase4),
+-- which reads the lease discount rollup when it is installed.
 SELECT 
     dm.managerid,
     dm.fullname,
-    COUNT(l.leaseid) AS totaldiscounts,
-    AVG(l.discountpercent) AS averagediscount
+    d.totaldiscounts,
+    d.averagediscount
 FROM dorm_management dm
-JOIN lease l ON dm.managerid = l.managerid
-WHERE l.discountpercent > 0
-GROUP BY dm.managerid, dm.fullname
+JOIN manager_discount_totals() d ON dm.managerid = d.managerid
 ORDER BY totaldiscounts DESC, averagediscount DESC
 LIMIT (
     SELECT (COUNT(DISTINCT managerid) * 0.2)
@@ -136,25 +149,16 @@ LIMIT (
 );
 
 -- Query 8: Identifies buildings with more issues reported in winter (Dec-Feb) than in summer (Jun-Aug),
--- to prepare for the cold season.
+-- to prepare for the cold season. Monthly counts per building come from maintenance_counts_since (Phase4).
 SELECT 
     b.buildingid, 
     b.buildingname, 
-    SUM(CASE 
-        WHEN EXTRACT(MONTH FROM mr.requestdate) IN (12, 1, 2) THEN 1 
-        ELSE 0 
-    END) AS winterissues,
-    SUM(CASE 
-        WHEN EXTRACT(MONTH FROM mr.requestdate) IN (6, 7, 8) THEN 1 
-        ELSE 0
-    END) AS summerissues,
-    EXTRACT(YEAR FROM mr.requestdate) AS requestyear
+    COALESCE(SUM(c.request_count) FILTER (WHERE EXTRACT(MONTH FROM c.month) IN (12, 1, 2)), 0) AS winterissues,
+    COALESCE(SUM(c.request_count) FILTER (WHERE EXTRACT(MONTH FROM c.month) IN (6, 7, 8)), 0) AS summerissues,
+    EXTRACT(YEAR FROM c.month) AS requestyear
 FROM building b
-JOIN apartment a ON b.buildingid = a.buildingid
-JOIN room r ON a.apartmentid = r.apartmentid AND a.buildingid = r.buildingid
-JOIN maintenance_request mr ON r.roomid = mr.roomid
-WHERE mr.requestdate >= CURRENT_DATE - INTERVAL '2 years'
-GROUP BY b.buildingid, b.buildingname, EXTRACT(YEAR FROM mr.requestdate)
-HAVING SUM(CASE WHEN EXTRACT(MONTH FROM mr.requestdate) IN (12, 1, 2) THEN 1 ELSE 0 END) > 
-       SUM(CASE WHEN EXTRACT(MONTH FROM mr.requestdate) IN (6, 7, 8) THEN 1 ELSE 0 END)
+JOIN maintenance_counts_since((CURRENT_DATE - INTERVAL '2 years')::DATE) c ON c.buildingid = b.buildingid
+GROUP BY b.buildingid, b.buildingname, EXTRACT(YEAR FROM c.month)
+HAVING COALESCE(SUM(c.request_count) FILTER (WHERE EXTRACT(MONTH FROM c.month) IN (12, 1, 2)), 0) > 
+       COALESCE(SUM(c.request_count) FILTER (WHERE EXTRACT(MONTH FROM c.month) IN (6, 7, 8)), 0)
 ORDER BY buildingid DESC;
\ No newline at end of file
@@ -9,19 +9,29 @@ DECLARE
     revenue NUMERIC := 0;
     discount_cost NUMERIC := 0;
 BEGIN
-    FOR lease_rec IN
-        SELECT l.leaseid, l.discountpercent, r.checkindate, r.checkoutdate
-        FROM lease l
-        JOIN rental r ON l.leaseid = r.leaseid
-        WHERE r.checkindate <= end_date AND (r.checkoutdate >= start_date OR r.checkoutdate IS NULL)
-    LOOP
-        IF lease_rec.discountpercent < 0 OR lease_rec.discountpercent > 100 THEN
-            RAISE EXCEPTION 'Invalid discount percent % for lease %', lease_rec.discountpercent, lease_rec.leaseid;
-        END IF;
+    -- Reads the revenue cube (kept current by triggers) when revenue_cube.py installed it, instead of looping
+    -- over every lease of the year; each stay of the academic year (Sep 1 of p_year - 1 to Aug 31 of p_year)
+    -- counts at 1000.0 * 12
+    IF to_regclass('revenue_cube') IS NOT NULL THEN
+        SELECT COALESCE(SUM(c.revenue), 0), COALESCE(SUM(c.discount_cost), 0)
+        INTO revenue, discount_cost
+        FROM revenue_cube c
+        WHERE c.academic_year = p_year;
+    ELSE
+        FOR lease_rec IN
+            SELECT l.leaseid, l.discountpercent, r.checkindate, r.checkoutdate
+            FROM lease l
+            JOIN rental r ON l.leaseid = r.leaseid
+            WHERE r.checkindate <= end_date AND (r.checkoutdate >= start_date OR r.checkoutdate IS NULL)
+        LOOP
+            IF lease_rec.discountpercent < 0 OR lease_rec.discountpercent > 100 THEN
+                RAISE EXCEPTION 'Invalid discount percent % for lease %', lease_rec.discountpercent, lease_rec.leaseid;
+            END IF;
 
-        revenue := revenue + base_rental_cost * (1 - lease_rec.discountpercent / 100);
-        discount_cost := discount_cost + base_rental_cost * (lease_rec.discountpercent / 100);
-    END LOOP;
+            revenue := revenue + base_rental_cost * (1 - lease_rec.discountpercent / 100);
+            discount_cost := discount_cost + base_rental_cost * (lease_rec.discountpercent / 100);
+        END LOOP;
+    END IF;
 
     IF revenue = 0 THEN
         RAISE NOTICE 'No leases found for academic year %', p_year;
@@ -94,15 +104,20 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Function 3: Count maintenance requests by priority
+-- Reads the maintenance rollup (kept current by triggers) when maintenance_rollups.py installed it,
+-- instead of counting every request
 CREATE OR REPLACE FUNCTION count_maintenance_by_priority()
 RETURNS TABLE (priority VARCHAR, request_count INTEGER) AS $$
 DECLARE
     maint_rec RECORD;
+    counts_sql TEXT := 'SELECT priority::VARCHAR AS priority, COUNT(*)::INTEGER AS request_count
+                        FROM maintenance_request GROUP BY priority';
 BEGIN
-    FOR maint_rec IN
-        SELECT maintenance_request.priority::VARCHAR AS priority, COUNT(*)::INTEGER AS request_count
-        FROM maintenance_request
-        GROUP BY maintenance_request.priority
+    IF to_regclass('maintenance_by_priority') IS NOT NULL THEN
+        counts_sql := 'SELECT priority::VARCHAR AS priority, request_count FROM maintenance_by_priority';
+    END IF;
+
+    FOR maint_rec IN EXECUTE counts_sql
     LOOP
         IF maint_rec.request_count = 0 THEN
             RAISE NOTICE 'No requests found for priority %', maint_rec.priority;
@@ -206,4 +221,79 @@ EXCEPTION
         OPEN ref FOR SELECT leaseid, roomid, checkindate, checkoutdate FROM rental WHERE 1=0;
         RETURN ref;
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+
+-- Function 6: Maintenance request counts per month, building, priority and issue, from p_since on
+-- Whole months come from the maintenance rollup when maintenance_rollups.py installed it, and the first (partial)
+-- month from the requests; without the rollup every request since p_since is counted
+CREATE OR REPLACE FUNCTION maintenance_counts_since(p_since DATE)
+RETURNS TABLE (month DATE, buildingid INT, priority priority_type, issuedescription TEXT,
+               request_count INT, unresolved_count INT) AS $$
+DECLARE
+    first_full_month DATE := p_since;
+BEGIN
+    IF to_regclass('maintenance_rollup_building') IS NOT NULL THEN
+        first_full_month := date_trunc('month', p_since) + INTERVAL '1 month';
+        RETURN QUERY
+        SELECT c.month, c.buildingid, c.priority, c.issuedescription, c.request_count, c.unresolved_count
+        FROM maintenance_rollup_building c
+        WHERE c.month >= first_full_month;
+    END IF;
+
+    RETURN QUERY
+    SELECT date_trunc('month', mr.requestdate)::DATE, rm.buildingid, mr.priority, mr.issuedescription,
+           COUNT(*)::INT, (COUNT(*) FILTER (WHERE mr.resolveddate IS NULL))::INT
+    FROM maintenance_request mr
+    LEFT JOIN room rm ON rm.roomid = mr.roomid
+    WHERE mr.requestdate >= p_since AND (mr.requestdate < first_full_month OR first_full_month = p_since)
+    GROUP BY 1, 2, 3, 4;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Function 7: Maintenance request counts per month, room and issue, from p_since on (requests with a room)
+-- Read like maintenance_counts_since, from the per-room rollup when it is installed
+CREATE OR REPLACE FUNCTION maintenance_room_counts_since(p_since DATE)
+RETURNS TABLE (month DATE, roomid INT, buildingid INT, issuedescription TEXT,
+               request_count INT, unresolved_count INT) AS $$
+DECLARE
+    first_full_month DATE := p_since;
+BEGIN
+    IF to_regclass('maintenance_rollup_room') IS NOT NULL THEN
+        first_full_month := date_trunc('month', p_since) + INTERVAL '1 month';
+        RETURN QUERY
+        SELECT c.month, c.roomid, c.buildingid, c.issuedescription, c.request_count, c.unresolved_count
+        FROM maintenance_rollup_room c
+        WHERE c.month >= first_full_month;
+    END IF;
+
+    RETURN QUERY
+    SELECT date_trunc('month', mr.requestdate)::DATE, mr.roomid, rm.buildingid, mr.issuedescription,
+           COUNT(*)::INT, (COUNT(*) FILTER (WHERE mr.resolveddate IS NULL))::INT
+    FROM maintenance_request mr
+    LEFT JOIN room rm ON rm.roomid = mr.roomid
+    WHERE mr.roomid IS NOT NULL
+      AND mr.requestdate >= p_since AND (mr.requestdate < first_full_month OR first_full_month = p_since)
+    GROUP BY 1, 2, 3, 4;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Function 8: Discounted leases and average discount per manager
+-- Read from the lease discount rollup when revenue_cube.py installed it, otherwise from the leases
+CREATE OR REPLACE FUNCTION manager_discount_totals()
+RETURNS TABLE (managerid INT, totaldiscounts BIGINT, averagediscount NUMERIC) AS $$
+BEGIN
+    IF to_regclass('lease_discount_rollup') IS NOT NULL THEN
+        RETURN QUERY
+        SELECT d.managerid, SUM(d.discounted_leases)::BIGINT, SUM(d.discount_percent_sum) / SUM(d.discounted_leases)
+        FROM lease_discount_rollup d
+        GROUP BY d.managerid
+        HAVING SUM(d.discounted_leases) > 0;
+    ELSE
+        RETURN QUERY
+        SELECT l.managerid, COUNT(l.leaseid), AVG(l.discountpercent)
+        FROM lease l
+        WHERE l.discountpercent > 0
+        GROUP BY l.managerid;
+    END IF;
+END;
+$$ LANGUAGE plpgsql STABLE;
\ No newline at end of file
@@ -9,8 +9,6 @@ DECLARE
     room_id INTEGER := 4;
     year INTEGER := 2025;
     month INTEGER := 6;
-    new_lease_id INTEGER := (SELECT COALESCE(MAX(leaseid), 0) + 1 FROM lease);
-    new_request_id INTEGER := (SELECT COALESCE(MAX(requestid), 0) + 1 FROM maintenance_request);
 BEGIN
     -- Functions
     BEGIN
@@ -22,12 +22,29 @@ END;
 $$;
 
 -- Procedure 2: Assign rooms to students
-CREATE OR REPLACE PROCEDURE assign_rooms_to_students(p_student_id INTEGER, p_room_id INTEGER)
+-- The room is checked against room_occupancy for the whole stay; without a room the best free one is chosen
+DROP PROCEDURE IF EXISTS assign_rooms_to_students(INTEGER, INTEGER);
+CREATE OR REPLACE PROCEDURE assign_rooms_to_students(p_student_id INTEGER, p_room_id INTEGER DEFAULT NULL,
+                                                     p_check_in DATE DEFAULT CURRENT_DATE,
+                                                     p_check_out DATE DEFAULT NULL)
 LANGUAGE plpgsql AS $$
 DECLARE
     lease_id INTEGER;
     manager_id INTEGER;
+    room_id INTEGER := p_room_id;
+    check_out DATE := COALESCE(p_check_out, (p_check_in + INTERVAL '1 year')::DATE);
 BEGIN
+    IF room_id IS NULL THEN
+        SELECT roomid INTO room_id
+        FROM best_room_for_student(p_student_id, p_check_in, check_out)
+        LIMIT 1;
+
+        IF NOT FOUND THEN
+            RAISE NOTICE 'No free room for student % between % and %', p_student_id, p_check_in, check_out;
+            RETURN;
+        END IF;
+    END IF;
+
     SELECT managerid INTO manager_id
     FROM managerfullprofile
     ORDER BY random()
@@ -38,14 +55,25 @@ BEGIN
         RETURN;
     END IF;
 
-    SELECT COALESCE(MAX(leaseid), 0) + 1 INTO lease_id
-    FROM lease;
-
-    INSERT INTO lease (leaseid, contractdate, discountpercent, managerid)
-    VALUES (lease_id, CURRENT_DATE, 2.5, manager_id);
-
+    BEGIN
+        INSERT INTO lease (contractdate, discountpercent, managerid)
+        VALUES (CURRENT_DATE, 2.5, manager_id)
+        RETURNING leaseid INTO lease_id;
+    EXCEPTION
+        WHEN unique_violation THEN
+            -- Leases loaded with explicit LeaseIDs (Phase1) leave lease_leaseid_seq behind: move it past them once
+            PERFORM setval(pg_get_serial_sequence('lease', 'leaseid'),
+                           GREATEST((SELECT MAX(leaseid) FROM lease), 1));
+            INSERT INTO lease (contractdate, discountpercent, managerid)
+            VALUES (CURRENT_DATE, 2.5, manager_id)
+            RETURNING leaseid INTO lease_id;
+    END;
+
+    -- occupancy_sync gives the stay a free bed or raises when the room is full on any of its days
     INSERT INTO rental (studentid, roomid, leaseid, checkindate, checkoutdate)
-    VALUES (p_student_id, p_room_id, lease_id, CURRENT_DATE, CURRENT_DATE + INTERVAL '1 year');
+    VALUES (p_student_id, room_id, lease_id, p_check_in, check_out);
+
+    RAISE NOTICE 'Student % assigned to room % from % to %', p_student_id, room_id, p_check_in, check_out;
 
 EXCEPTION
     WHEN OTHERS THEN